@@ -0,0 +1,52 @@
+import argparse
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from awstracer.tracefile import read_traces, write_traces  # noqa: E402
+from awstracer.utils import json_deserialize_helper, json_loads  # noqa: E402
+from synth import make_traces  # noqa: E402
+
+
+# Compares loading a trace file the way trace files used to be loaded, with
+# the garbage collector running over the freshly decoded objects, with loading
+# it through read_traces() which pauses the collector while decoding.
+def best_of(repeat, fn):
+    ret = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        took = time.perf_counter() - start
+        ret = took if ret is None else min(ret, took)
+    return ret
+
+
+def main():
+    parser = argparse.ArgumentParser(description="trace file load benchmark")
+    parser.add_argument("--traces", type=int, default=50)
+    parser.add_argument("--items", type=int, default=250)
+    parser.add_argument("--depth", type=int, default=2)
+    parser.add_argument("--repeat", type=int, default=5)
+    ns = parser.parse_args()
+
+    traces = [t.to_dict() for t in make_traces(ns.traces, items=ns.items, depth=ns.depth)]
+    out = io.BytesIO()
+    write_traces(out, traces)
+    data = out.getvalue()
+    objects = data.count(b"{")
+    assert list(read_traces(io.BytesIO(data))) == json_loads(data)
+
+    print("{} traces, {} objects, {:.1f} MB".format(ns.traces, objects, len(data) / 1e6))
+    hook = best_of(ns.repeat, lambda: json.loads(data, object_hook=json_deserialize_helper))
+    print("before: {:.3f}s".format(hook))
+    after = best_of(ns.repeat, lambda: list(read_traces(io.BytesIO(data))))
+    print("after:  {:.3f}s ({:.1f}x)".format(after, hook / after))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import argparse
+import io
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from awstracer.player import TracePlayer, logger  # noqa: E402
+from awstracer.tracer import Trace  # noqa: E402
+
+
+# Times finding the connections between traces which all pass around the
+# same large document, so every trace connects to every trace before it on
+# a value which would have to be formatted for the debug log, with debug
+# logging disabled and enabled.
+def make_player(count, size):
+    doc = {"Statement": [{"Sid": "s{}".format(i), "Resource": ["arn:aws:s3:::bucket{}/*".format(i)]} for i in range(size)]}
+    tp = TracePlayer(io.StringIO("[]"), {}, prompt_color=False)
+    tp.__enter__()
+    for i in range(count):
+        t = Trace()
+        t.set_input("iam.PutPolicy{}".format(i), {"Document": doc, "PolicyName": "p{}".format(i)})
+        t.set_output("request-{}".format(i), "iam.PutPolicy{}".format(i), {"Document": doc})
+        tp.traces.append(t)
+    tp._index_connections()
+    return tp
+
+
+def best_of(repeat, fn):
+    ret = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        took = time.perf_counter() - start
+        ret = took if ret is None else min(ret, took)
+    return ret
+
+
+def main():
+    parser = argparse.ArgumentParser(description="debug logging overhead benchmark")
+    parser.add_argument("--traces", type=int, default=60)
+    parser.add_argument("--size", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3)
+    ns = parser.parse_args()
+
+    tp = make_player(ns.traces, ns.size)
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+    for level in (logging.INFO, logging.DEBUG):
+        logger.setLevel(level)
+        took = best_of(ns.repeat, tp.find_connections)
+        print("{:5}  {:.3f}s for {} connections".format(logging.getLevelName(level), took, len(tp.connections)))
+
+
+if __name__ == "__main__":
+    main()
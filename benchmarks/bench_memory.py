@@ -0,0 +1,102 @@
+import argparse
+import gc
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from awstracer.player import Edge, TracePlayer  # noqa: E402
+from awstracer.tracefile import write_traces  # noqa: E402
+from awstracer.tracer import Trace  # noqa: E402
+from synth import make_traces  # noqa: E402
+
+MODES = {
+    "eager": (False, False),
+    "lazy": (True, False),
+    "lazy+drop": (True, True),
+}
+
+
+# Measures the memory taken up by a player with all the traces loaded and the
+# connections between them found, with the outputs of the traces decoded up
+# front, decoded lazily and with the unused outputs dropped as well, together
+# with the time it took to load the traces and to find the connections. Every
+# mode runs in a process of its own so their resident set sizes are apart.
+def rss():
+    # current resident set size in bytes, only available on Linux
+    try:
+        with open("/proc/self/statm") as fd:
+            return int(fd.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return 0
+
+
+def count_objects():
+    # counts the traces and edges and the bytes they take up themselves
+    counts = {}
+    for obj in gc.get_objects():
+        if isinstance(obj, (Trace, Edge)):
+            size = sys.getsizeof(obj)
+            if hasattr(obj, "__dict__"):
+                size += sys.getsizeof(obj.__dict__)
+            name = type(obj).__name__
+            count, total = counts.get(name, (0, 0))
+            counts[name] = (count + 1, total + size)
+    return counts
+
+
+def measure(fn, mode):
+    lazy, drop = MODES[mode]
+    with open(fn, "rb") as fd:
+        before = rss()
+        start = time.perf_counter()
+        with TracePlayer(fd, {}, prompt_color=False, lazy_outputs=lazy) as tp:
+            loaded = time.perf_counter() - start
+            tp.find_connections()
+            took = time.perf_counter() - start
+            found = len(tp.connections)
+            tp.prune_connections()
+            if drop:
+                tp.drop_unused_outputs()
+            gc.collect()
+            current = rss()
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+            counts = count_objects()
+    print("{:10} rss {:7.1f} MB  peak {:7.1f} MB  load {:6.2f}s  total {:6.2f}s  {} connections found, {} kept".format(
+        mode, (current - before) / 1e6, peak / 1e6, loaded, took, found, len(tp.connections)))
+    for name, (count, total) in sorted(counts.items()):
+        print("{:10} {:6} x {:24} {:6.1f} MB".format("", count, name, total / 1e6))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="trace player memory benchmark")
+    parser.add_argument("--traces", type=int, default=10000)
+    parser.add_argument("--items", type=int, default=5)
+    parser.add_argument("--fanout", type=int, default=2)
+    parser.add_argument("--format", choices=("json", "jsonl", "msgpack"), default="jsonl")
+    parser.add_argument("--mode", choices=sorted(MODES), default=None)
+    parser.add_argument("--file", type=str, default=None)
+    ns = parser.parse_args()
+
+    if ns.mode:
+        measure(ns.file, ns.mode)
+        return
+
+    fn = "/tmp/bench_memory.{}".format(ns.format)
+    traces = [t.to_dict() for t in make_traces(ns.traces, items=ns.items, fanout=ns.fanout)]
+    with open(fn, "wb") as fd:
+        write_traces(fd, traces, ns.format)
+    print("{} traces, {:.1f} MB {} file".format(ns.traces, os.path.getsize(fn) / 1e6, ns.format))
+    try:
+        for mode in MODES:
+            subprocess.check_call([sys.executable, os.path.abspath(__file__), "--mode", mode, "--file", fn])
+    finally:
+        os.unlink(fn)
+
+
+if __name__ == "__main__":
+    main()
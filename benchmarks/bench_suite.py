@@ -0,0 +1,134 @@
+import argparse
+import io
+import json
+import os
+import platform
+import sys
+import time
+from contextlib import redirect_stderr, redirect_stdout
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from awstracer._version import __version__  # noqa: E402
+from awstracer.player import TracePlayer  # noqa: E402
+from awstracer.server import TraceServer  # noqa: E402
+from awstracer.tracefile import read_traces, write_traces  # noqa: E402
+from awstracer.tracer import Trace  # noqa: E402
+from awstracer.utils import json_dumps, json_loads  # noqa: E402
+from synth import make_dynamodb_traces  # noqa: E402
+
+BENCHMARKS = ("json_load", "read_traces", "from_dict", "find_connections", "prune_connections",
+              "play_dryrun", "play_direct", "play_cli", "play_cli_quiet")
+
+
+# Times every stage of playing a synthetic trace, from loading the trace file
+# to actually playing it against the local endpoint awstrace-serve provides,
+# and writes the results as JSON. Passing the results of an earlier run, e.g.
+# of another version, with --baseline shows how much every stage changed.
+def best_of(repeat, fn, setup=None):
+    ret = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        took = time.perf_counter() - start
+        ret = took if ret is None else min(ret, took)
+    return ret
+
+
+def make_player(data, **kwargs):
+    tp = TracePlayer(io.BytesIO(data), {}, prompt_color=False, **kwargs)
+    tp.__enter__()
+    return tp
+
+
+def play(tp):
+    with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+        tp.play_trace(sleep_delay=0)
+
+
+def run(ns, selected):
+    traces = [t.to_dict() for t in make_dynamodb_traces(ns.traces, ns.params, ns.items, ns.depth, ns.fanout)]
+    legacy = json_dumps(traces, pretty=True).encode("utf-8")
+    out = io.BytesIO()
+    write_traces(out, traces)
+    data = out.getvalue()
+    results = {}
+
+    def bench(name, fn, setup=None, repeat=ns.repeat):
+        if name not in selected:
+            return
+        results[name] = best_of(repeat, fn, setup)
+        sys.stderr.write("{:18} {:.4f}s\n".format(name, results[name]))
+
+    bench("json_load", lambda: json_loads(legacy))
+    bench("read_traces", lambda: list(read_traces(io.BytesIO(data))))
+    bench("from_dict", lambda: [Trace.from_dict(t) for t in traces])
+
+    tp = make_player(data)
+    bench("find_connections", tp.find_connections)
+    bench("prune_connections", tp.prune_connections, setup=tp.find_connections)
+    bench("play_dryrun", lambda: tp.play_trace(dryrun=True, sleep_delay=0))
+
+    if not selected.intersection(("play_direct", "play_cli", "play_cli_quiet")):
+        return results
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "benchmark")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "benchmark")
+    with TraceServer([Trace.from_dict(t) for t in traces]) as server:
+        for name, direct, quiet in (("play_direct", True, False), ("play_cli", False, False), ("play_cli_quiet", False, True)):
+            tp = make_player(data, endpoint=server.url, region="us-east-1", direct=direct)
+            tp.quiet = quiet
+            tp.find_connections()
+            tp.prune_connections()
+            bench(name, lambda: play(tp), repeat=ns.play_repeat)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="awstracer benchmark suite")
+    parser.add_argument("--traces", type=int, default=200, help="number of traces")
+    parser.add_argument("--params", type=int, default=4, help="input parameters per trace")
+    parser.add_argument("--items", type=int, default=20, help="items in the output of every trace")
+    parser.add_argument("--depth", type=int, default=2, help="nesting depth of the output items")
+    parser.add_argument("--fanout", type=int, default=2, help="inputs per trace taken from earlier outputs")
+    parser.add_argument("--repeat", type=int, default=5, help="best of this many runs")
+    parser.add_argument("--play-repeat", type=int, default=1, dest="play_repeat", help="best of this many playbacks")
+    parser.add_argument("--only", metavar="NAME", action="append", choices=BENCHMARKS, help="only run these benchmarks")
+    parser.add_argument("--output", metavar="FILE", help="write the results to FILE instead of stdout")
+    parser.add_argument("--baseline", metavar="FILE", help="compare with the results in FILE")
+    ns = parser.parse_args()
+
+    selected = set(ns.only or BENCHMARKS)
+    with redirect_stdout(io.StringIO()):
+        timings = run(ns, selected)
+    results = {
+        "version": __version__,
+        "python": platform.python_version(),
+        "date": datetime.now().isoformat(),
+        "config": {k: getattr(ns, k) for k in ("traces", "params", "items", "depth", "fanout", "repeat", "play_repeat")},
+        "results": timings,
+    }
+
+    if ns.baseline:
+        with open(ns.baseline, "r") as fd:
+            baseline = json.load(fd)
+        if baseline["config"] != results["config"]:
+            sys.stderr.write("warning: the baseline was run with a different configuration\n")
+        for name, took in timings.items():
+            before = baseline["results"].get(name)
+            if before:
+                sys.stderr.write("{:18} {:.4f}s -> {:.4f}s ({:+.1f}%)\n".format(name, before, took, (took / before - 1) * 100))
+
+    data = json.dumps(results, indent=1, sort_keys=True) + "\n"
+    if ns.output:
+        with open(ns.output, "w") as fd:
+            fd.write(data)
+    else:
+        sys.stdout.write(data)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+from awstracer.tracer import Trace
+
+
+# Generates synthetic traces for the benchmarks. Every trace has a number of
+# input parameters and an output with a list of items nested depth levels
+# deep. Up to fanout input parameters of every trace reuse an output value of
+# one of the traces before it so the player has connections to find.
+def make_traces(count=100, params=4, items=100, depth=2, fanout=1, seed=0):
+    rnd = random.Random(seed)
+    start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    traces = []
+    for i in range(count):
+        t = Trace()
+        inparams = {"Param{}".format(j): "value-{}-{}".format(i, j) for j in range(params)}
+        for j in range(min(fanout, len(traces))):
+            prev = rnd.choice(traces)
+            name = rnd.choice(sorted(prev.outparams["Names"]))
+            inparams[name] = prev.outparams["Names"][name]
+        fn_name = "synth.Operation{}".format(i % 10)
+        t.set_input(fn_name, inparams)
+
+        def make_item(level, k):
+            item = {
+                "Id": "item-{}-{}-{}".format(i, level, k),
+                "Size": k,
+                "Tags": [{"Key": "k{}".format(n), "Value": "v{}".format(k)} for n in range(2)],
+            }
+            if level == 1:
+                item["Created"] = start + timedelta(seconds=i * items + k)
+            if level < depth:
+                item["Child"] = make_item(level + 1, k)
+            return item
+
+        outparams = {
+            "Names": {"Name{}".format(i): "resource-{}".format(i)},
+            "Items": [make_item(1, k) for k in range(items)],
+        }
+        t.set_output("request-{}".format(i), fn_name, outparams)
+        t.ts_start = start.replace(tzinfo=None) + timedelta(seconds=i)
+        t.ts_end = t.ts_start + timedelta(milliseconds=10)
+        traces.append(t)
+    return traces
+
+
+def _attribute_value(val):
+    if type(val) == dict:
+        return {"M": {k: _attribute_value(v) for k, v in val.items()}}
+    if type(val) == list:
+        return {"L": [_attribute_value(v) for v in val]}
+    if type(val) == int:
+        return {"N": str(val)}
+    if isinstance(val, datetime):
+        return {"S": val.isoformat()}
+    return {"S": str(val)}
+
+
+# Turns the synthetic traces into calls to dynamodb.PutItem which store the
+# input parameters as an item and return the outputs as the old item. These
+# can actually be played against the endpoint awstrace-serve provides and the
+# connections between them are found the same way.
+def make_dynamodb_traces(count=100, params=4, items=100, depth=2, fanout=1, seed=0):
+    traces = make_traces(count, params, items, depth, fanout, seed)
+    for t in traces:
+        t.fn_name = "dynamodb.PutItem"
+        t.inparams = {
+            "TableName": "synth",
+            "Item": {k: _attribute_value(v) for k, v in t.inparams.items()},
+            "ReturnValues": "ALL_OLD",
+        }
+        t.outparams = {"Attributes": {k: _attribute_value(v) for k, v in t.outparams.items()}}
+    return traces
@@ -53,13 +53,18 @@ setuptools.setup(
     python_requires='>=3.6',
     entry_points={
         "console_scripts": ["awstrace-play=awstracer.player:main",
-                            "awstrace-rec=awstracer.recorder:main"]
+                            "awstrace-rec=awstracer.recorder:main",
+                            "awstrace-convert=awstracer.converter:main",
+                            "awstrace-serve=awstracer.server:main",
+                            "awstrace-compile=awstracer.compiler:main"]
     },
     install_requires=[
         "awscli>=1.18.39",
         "botocore>=1.15.39"
     ],
     extras_require={
-        "test": ["tox", "flake8"]
+        "test": ["tox", "flake8"],
+        "msgpack": ["msgpack"],
+        "zstd": ["zstandard"]
     }
 )
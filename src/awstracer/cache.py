@@ -0,0 +1,90 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from .utils import json_serialize_helper
+
+# operations with these prefixes only read and can be served from the cache,
+# every other operation is taken to change something in its service
+READ_ONLY_PREFIXES = ("Describe", "Get", "List", "BatchGet", "Head", "Query", "Scan")
+
+# operations with a read-only prefix that still return something new every
+# time, like credentials, tokens or identities, by their service id as used
+# in the names of the traces
+NOT_READ_ONLY = frozenset((
+    "codeartifact.GetAuthorizationToken",
+    "cognito-identity.GetCredentialsForIdentity",
+    "cognito-identity.GetId",
+    "cognito-identity.GetOpenIdToken",
+    "cognito-identity.GetOpenIdTokenForDeveloperIdentity",
+    "ecr.GetAuthorizationToken",
+    "ecr-public.GetAuthorizationToken",
+    "kms.GetParametersForImport",
+    "redshift.GetClusterCredentials",
+    "secrets-manager.GetRandomPassword",
+    "sso.GetRoleCredentials",
+    "sts.GetFederationToken",
+    "sts.GetSessionToken",
+))
+
+CACHE_TTL = 60
+CACHE_SIZE = 1024
+
+
+def is_read_only(fn_name):
+    return fn_name not in NOT_READ_ONLY and fn_name.split(".")[-1].startswith(READ_ONLY_PREFIXES)
+
+
+def get_cache_key(fn_name, params, profile=None, region=None, endpoint=None):
+    # parameters are compared by their canonical JSON form so that the same
+    # parameters always give the same key regardless of their order
+    return (fn_name, json.dumps(params, sort_keys=True, default=json_serialize_helper), profile, region, endpoint)
+
+
+class ResultCache:
+    # Keeps the results of read-only calls made while playing a trace so that
+    # the same call with the same parameters under the same profile and in the
+    # same region isn't made again. Results expire after ttl seconds and the
+    # least recently used results are dropped once there are more than
+    # max_entries of them. Any other call to a service drops all its results
+    # as these might have changed. The cache can be shared by the players of
+    # several targets and sweeps playing concurrently.
+    def __init__(self, ttl=CACHE_TTL, max_entries=CACHE_SIZE):
+        if max_entries < 1:
+            raise ValueError("need to cache at least one result")
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, trace):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, trace)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, service_id):
+        prefix = "{}.".format(service_id)
+        with self._lock:
+            for key in [k for k in self._entries if k[0].startswith(prefix)]:
+                del self._entries[key]
@@ -0,0 +1,69 @@
+import os
+import threading
+
+from .tracefile import FORMAT_JSONL, TraceWriter, read_traces, write_traces
+from .tracer import Trace
+
+CHECKPOINT_VERSION = 1
+
+
+class Checkpoint:
+    # Keeps track of the traces played successfully in a JSON lines file,
+    # together with the traces captured while playing them, so that playing
+    # a trace can be resumed where it stopped. The first line identifies the
+    # trace file and the overridden parameters the checkpoint is for and every
+    # other line holds the position of a played trace and its results.
+    def __init__(self, filename, trace_hash, input_args, fsync=False):
+        self.filename = filename
+        self.trace_hash = trace_hash
+        self.input_args = input_args
+        self.fsync = fsync
+        self._writer = TraceWriter(filename, fsync=fsync, trace_format=FORMAT_JSONL, append=True)
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def load(self):
+        # Returns the results of the traces played before by their position.
+        # Results of a trace file that changed since or with other overridden
+        # parameters would be meaningless so those are refused.
+        if not os.path.exists(self.filename):
+            return {}
+        results = {}
+        with open(self.filename, "rb") as fd:
+            for i, entry in enumerate(read_traces(fd)):
+                if i == 0:
+                    if entry.get("checkpoint") != CHECKPOINT_VERSION or entry.get("trace_sha256") != self.trace_hash:
+                        raise ValueError("it is for another trace file")
+                    if entry.get("params") != self.input_args:
+                        raise ValueError("it is for other parameters")
+                    continue
+                results[entry["position"]] = Trace.from_dict(entry["trace"])
+        return results
+
+    def start(self, results={}):
+        # Starts the checkpoint over with the results loaded when resuming.
+        # This also gets rid of the incomplete last line a crash leaves behind
+        # which would otherwise end up in the middle of the file. The new
+        # checkpoint is written next to the old one and only then replaces
+        # it, so a crash while doing so doesn't lose the results.
+        entries = [{"checkpoint": CHECKPOINT_VERSION, "trace_sha256": self.trace_hash, "params": self.input_args}]
+        entries.extend({"position": position, "trace": results[position].to_dict()} for position in sorted(results))
+        tmp_filename = "{}.tmp".format(self.filename)
+        with open(tmp_filename, "wb") as fd:
+            write_traces(fd, entries, FORMAT_JSONL)
+            if self.fsync:
+                fd.flush()
+                os.fsync(fd.fileno())
+        os.replace(tmp_filename, self.filename)
+
+    def add(self, position, trace):
+        with self._lock:
+            self._writer.write({"position": position, "trace": trace.to_dict()})
+
+    def close(self):
+        self._writer.close()
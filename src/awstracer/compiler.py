@@ -0,0 +1,50 @@
+import argparse
+import logging
+import sys
+
+from .plan import compile_plan, hash_trace_file, write_plan
+from .player import TracePlayer
+from .utils import convert_to_camelcase, setup_logging
+
+logger = logging.getLogger("compiler")
+
+
+def opt_parser(args=None):
+    parser = argparse.ArgumentParser(description="AWS CLI Trace Compiler")
+    parser.add_argument("-p", "--param", metavar="NAME", type=str, action="append", dest="params",
+                        help="Compile the plan for when parameter NAME gets overridden")
+    parser.add_argument("-c", action="store_false", dest="colorize", help="Turn off colorized output")
+    parser.add_argument("-d", action="store_true", dest="debug", help="Turn on debug output")
+    group = parser.add_argument_group("required arguments")
+    group.add_argument("--trace-file", metavar="FILE", type=str, required=True, help="input trace file", dest="trace_file")
+    group.add_argument("--output", metavar="FILE", type=str, required=True, help="output plan file", dest="output_file")
+    ns = parser.parse_args() if not args else parser.parse_args(args)
+    if ns.trace_file == ns.output_file:
+        sys.stderr.write("trace file and plan file cannot be the same\n")
+        sys.stderr.flush()
+        sys.exit(1)
+    return ns
+
+
+def main():
+    ns = opt_parser()
+    setup_logging(logger, debug=ns.debug, colorize=ns.colorize)
+    names = set(convert_to_camelcase(name) for name in ns.params or [])
+    try:
+        with open(ns.trace_file, "rb") as fd:
+            trace_hash = hash_trace_file(fd)
+            with TracePlayer(fd, {}, prompt_color=False) as player:
+                plan = compile_plan(player, trace_hash, names)
+        with open(ns.output_file, "wb") as fd:
+            write_plan(fd, plan)
+    except OSError as e:
+        sys.stderr.write("Failed to compile {}: {}\n".format(ns.trace_file, e))
+        sys.exit(1)
+    except ValueError as e:
+        sys.stderr.write("Failed to compile {}: {}\n".format(ns.trace_file, e))
+        sys.exit(1)
+    logger.info("Compiled {} traces with {} connections to {}".format(len(plan["traces"]) - 1, len(plan["edges"]), ns.output_file))
+
+
+if __name__ == "__main__":
+    main()
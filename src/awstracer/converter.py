@@ -0,0 +1,49 @@
+import argparse
+import sys
+
+from .tracefile import (COMPRESSIONS, FORMAT_JSON, FORMATS, guess_compression, guess_format, open_trace_file,
+                        read_traces, write_traces)
+
+
+def convert(input_fd, output_fd, trace_format):
+    # only the JSON array format needs all traces at once, the other formats
+    # are converted one trace at a time
+    traces = read_traces(input_fd)
+    if trace_format == FORMAT_JSON:
+        traces = list(traces)
+    write_traces(output_fd, traces, trace_format)
+
+
+def opt_parser(args=None):
+    parser = argparse.ArgumentParser(description="AWS CLI Trace Converter")
+    parser.add_argument("--format", choices=FORMATS, dest="trace_format", default=None, help="Output trace file format (default: based on the file extension)")
+    parser.add_argument("--compress", choices=COMPRESSIONS, dest="compression", default=None, help="Output trace file compression (default: based on the file extension)")
+    group = parser.add_argument_group("required arguments")
+    group.add_argument("--trace-file", metavar="FILE", type=str, required=True, help="input trace file", dest="trace_file")
+    group.add_argument("--output", metavar="FILE", type=str, required=True, help="output trace file", dest="output_file")
+    ns = parser.parse_args() if not args else parser.parse_args(args)
+    if ns.trace_file == ns.output_file:
+        sys.stderr.write("input and output trace file cannot be the same\n")
+        sys.stderr.flush()
+        sys.exit(1)
+    return ns
+
+
+def main():
+    ns = opt_parser()
+    trace_format = ns.trace_format if ns.trace_format else guess_format(ns.output_file)
+    compression = ns.compression if ns.compression else guess_compression(ns.output_file)
+    try:
+        with open_trace_file(ns.trace_file) as input_fd:
+            with open_trace_file(ns.output_file, "wb", compression) as output_fd:
+                convert(input_fd, output_fd, trace_format)
+    except OSError as e:
+        sys.stderr.write("Failed to convert {}: {}\n".format(ns.trace_file, e))
+        sys.exit(1)
+    except ValueError as e:
+        sys.stderr.write("Failed to convert {}: {}\n".format(ns.trace_file, e))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import json
+import logging
+import os
+import queue
+import re
+import threading
+
+from .utils import json_display_helper
+
+logger = logging.getLogger("output")
+
+# how many responses can be waiting to be written before playing the trace
+# has to wait for the writer to catch up
+MAX_PENDING = 64
+
+
+def get_output_name(label, position, fn_name):
+    name = "{:05d}-{}".format(position, fn_name)
+    if label is not None:
+        name = "{}-{}".format(re.sub(r"[^\w.-]+", "_", label).strip("_"), name)
+    return name
+
+
+class OutputWriter:
+    # Writes the responses of the commands played to a JSON file per command
+    # in the given directory. Formatting and writing large responses can take
+    # longer than the call itself so this is done by a background thread.
+    def __init__(self, directory, max_pending=MAX_PENDING):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.written = 0
+        self.failed = 0
+        self._queue = queue.Queue(max_pending)
+        self._thread = threading.Thread(target=self._run, name="output-writer", daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write(self, name, values):
+        self._queue.put((name, values))
+
+    def close(self):
+        # waits for everything queued to be written
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            name, values = item
+            filename = os.path.join(self.directory, "{}.json".format(name))
+            try:
+                with open(filename, "w") as fd:
+                    json.dump(values, fd, indent=4, default=json_display_helper, ensure_ascii=False)
+                    fd.write("\n")
+                self.written += 1
+            except (OSError, TypeError, ValueError) as e:
+                logger.error("Failed to write {}: {}".format(filename, str(e)))
+                self.failed += 1
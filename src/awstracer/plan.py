@@ -0,0 +1,68 @@
+import hashlib
+import json
+
+# A plan holds the connections found between the traces of a trace file
+# together with the hash of that trace file so they don't have to be found
+# again every time it is played.
+PLAN_VERSION = 1
+
+
+def hash_trace_file(fd):
+    # hashes the raw contents of a trace file and rewinds it again so that it
+    # can be read after
+    h = hashlib.sha256()
+    for chunk in iter(lambda: fd.read(1 << 20), b""):
+        h.update(chunk)
+    fd.seek(0)
+    return h.hexdigest()
+
+
+def compile_plan(player, trace_hash, names=()):
+    # Finds the connections between the traces of the player for when the
+    # parameters with the given names get overridden and returns them as a
+    # plan. Only the names of the overridden parameters matter so the plan
+    # can be played with any values for them.
+    player.find_input_connections(names)
+    replaced = [[] for _ in player.traces]
+    for edge in player.connections:
+        replaced[edge.idx_to].append(edge.varname_to)
+    return {
+        "version": PLAN_VERSION,
+        "trace_sha256": trace_hash,
+        "params": sorted(names),
+        "traces": [{"fn_name": t.fn_name, "request_id": t.request_id, "replaced": r} for t, r in zip(player.traces, replaced)],
+        "edges": [[e.idx_from, e.idx_to, e.varname_from, e.varname_to] for e in player.connections],
+    }
+
+
+def plan_matches(plan, trace_hash, names):
+    if plan.get("version") != PLAN_VERSION or plan.get("trace_sha256") != trace_hash:
+        return False
+    return plan.get("params") == sorted(names)
+
+
+def apply_plan(player, plan):
+    # Sets the connections of the player to the ones in the plan instead of
+    # finding them, after checking the plan is for the traces the player has
+    # loaded.
+    traces = plan["traces"]
+    if len(traces) != len(player.traces):
+        raise ValueError("the plan is for {} traces instead of {}".format(len(traces) - 1, len(player.traces) - 1))
+    for i, (t, trace) in enumerate(zip(traces, player.traces)):
+        if i > 0 and (t["fn_name"] != trace.fn_name or t["request_id"] != trace.request_id):
+            raise ValueError("trace {} of the plan is {} instead of {}".format(i, t["fn_name"], trace.fn_name))
+    for idx_from, idx_to, _, _ in plan["edges"]:
+        if not 0 <= idx_from < idx_to < len(player.traces):
+            raise ValueError("invalid connection from trace {} to {}".format(idx_from, idx_to))
+    player.set_connections(plan["edges"])
+
+
+def write_plan(fd, plan):
+    fd.write(json.dumps(plan, indent=1).encode("utf-8"))
+
+
+def read_plan(fd):
+    plan = json.loads(fd.read())
+    if type(plan) != dict or "edges" not in plan or "traces" not in plan:
+        raise ValueError("not a plan file")
+    return plan
@@ -1,22 +1,97 @@
 import argparse
+import contextlib
+import copy
+import csv
+import functools
+import itertools
+import json
 import logging
+import random
 import shlex
 import sys
+import threading
 import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
-from .tracer import Trace, TraceRunner
-from .utils import convert_to_camelcase, json_load, setup_logging, process_file_argument
+import botocore.exceptions
+
+from .cache import CACHE_SIZE, CACHE_TTL, ResultCache, get_cache_key, is_read_only
+from .checkpoint import Checkpoint
+from .output import OutputWriter, get_output_name
+from .plan import apply_plan, hash_trace_file, plan_matches, read_plan
+from .ratelimit import RateLimiter, is_throttling
+from .tracefile import read_traces
+from .tracer import Trace, TraceRunner, get_path_value, replace_path_values
+from .utils import convert_to_camelcase, setup_logging, process_file_argument
 
 logger = logging.getLogger("player")
 
+# stand-in value for overridden parameters when finding the connections for
+# a sweep, it shouldn't be equal to any value in a trace
+SWEEP_PLACEHOLDER = "<awstracer-sweep-placeholder>"
+
+# bounds of the delay between retries when polling traces until they succeed
+POLL_MIN_DELAY = 0.5
+POLL_MAX_DELAY = 8
+
+# throttled calls are retried after a random delay of up to the given number
+# of seconds, doubling every time up to the maximum
+THROTTLE_MIN_DELAY = 0.5
+THROTTLE_MAX_DELAY = 20
+THROTTLE_RETRIES = 5
+
+# default number of profiles, regions and sweep sets played at the same time,
+# every one of them has its own sessions and clients for every thread
+TARGET_JOBS = 8
+
+
+def flatten_params(params):
+    # Flattens nested parameters into a list with a (path, top, depth, value,
+    # key) tuple for every value at any depth, in the order they appear. The
+    # top is the position of the toplevel parameter the value is nested in
+    # and key is a hashable stand-in for the value which compares equal for
+    # exactly the values that compare equal with ==. The keys are computed
+    # bottom-up so large nested values are only walked once.
+    flat = []
+
+    def walk(path, top, depth, val):
+        pos = len(flat)
+        flat.append(None)
+        if type(val) == dict:
+            key = ("<dict>", frozenset((k, walk("{}.{}".format(path, k), top, depth + 1, v)) for k, v in val.items()))
+        elif type(val) == list:
+            key = ("<list>", tuple(walk("{}.{}".format(path, i), top, depth + 1, v) for i, v in enumerate(val)))
+        else:
+            key = val
+        flat[pos] = (path, top, depth, val, key)
+        return key
+
+    for top, name in enumerate(params):
+        walk(name, top, 0, params[name])
+    return flat
+
 
 class Edge:
-    def __init__(self, trace_from, trace_to, varname_from, varname_to):
-        self.trace_from = trace_from
-        self.trace_to = trace_to
+    # Edges refer to the traces they connect by their position in the list of
+    # loaded traces. There can be a lot of them, most of which are pruned
+    # right away, so they are kept as small as possible.
+    __slots__ = ("traces", "idx_from", "idx_to", "varname_from", "varname_to")
+
+    def __init__(self, traces, idx_from, idx_to, varname_from, varname_to):
+        self.traces = traces
+        self.idx_from = idx_from
+        self.idx_to = idx_to
         self.varname_from = varname_from
         self.varname_to = varname_to
 
+    @property
+    def trace_from(self):
+        return self.traces[self.idx_from]
+
+    @property
+    def trace_to(self):
+        return self.traces[self.idx_to]
+
     def __str__(self):
         return "[{}] {} {} -> [{}] {} {}".format(
             self.trace_from.request_id,
@@ -29,29 +104,117 @@ class Edge:
 
 
 class MatchingNameAndValueEdge(Edge):
-    def __init__(self, trace_from, trace_to, varname, value):
-        super().__init__(trace_from, trace_to, varname, varname)
-        logger.debug("Connection from {} [{}] to {} [{}] with match for name {} and value {}".
-                     format(trace_from.fn_name, trace_from.request_id, trace_to.fn_name, trace_to.request_id, varname, value))
+    __slots__ = ()
+
+    def __init__(self, traces, idx_from, idx_to, varname, value):
+        super().__init__(traces, idx_from, idx_to, varname, varname)
+        if logger.isEnabledFor(logging.DEBUG):
+            trace_from, trace_to = self.trace_from, self.trace_to
+            logger.debug("Connection from {} [{}] to {} [{}] with match for name {} and value {}".
+                         format(trace_from.fn_name, trace_from.request_id, trace_to.fn_name, trace_to.request_id, varname, value))
 
 
 class MatchingNameEdge(Edge):
-    def __init__(self, trace_from, trace_to, varname, value_from, value_to):
-        super().__init__(trace_from, trace_to, varname, varname)
-        logger.debug("Connection from {} [{}] to {} [{}] with match for name {} but different values: {} -> {})".
-                     format(trace_from.fn_name, trace_from.request_id, trace_to.fn_name, trace_to.request_id, varname, value_from, value_to))
+    __slots__ = ()
+
+    def __init__(self, traces, idx_from, idx_to, varname, value_from, value_to):
+        super().__init__(traces, idx_from, idx_to, varname, varname)
+        if logger.isEnabledFor(logging.DEBUG):
+            trace_from, trace_to = self.trace_from, self.trace_to
+            logger.debug("Connection from {} [{}] to {} [{}] with match for name {} but different values: {} -> {})".
+                         format(trace_from.fn_name, trace_from.request_id, trace_to.fn_name, trace_to.request_id, varname, value_from, value_to))
 
 
 class MatchingValueEdge(Edge):
-    def __init__(self, trace_from, trace_to, value, varname_from, varname_to):
-        super().__init__(trace_from, trace_to, varname_from, varname_to)
-        logger.debug("Connection from {} [{}] to {} [{}] with match values {} but different names: {} -> {})".
-                     format(trace_from.fn_name, trace_from.request_id, trace_to.fn_name, trace_to.request_id, value, varname_from, varname_to))
+    __slots__ = ()
+
+    def __init__(self, traces, idx_from, idx_to, value, varname_from, varname_to):
+        super().__init__(traces, idx_from, idx_to, varname_from, varname_to)
+        if logger.isEnabledFor(logging.DEBUG):
+            trace_from, trace_to = self.trace_from, self.trace_to
+            logger.debug("Connection from {} [{}] to {} [{}] with match values {} but different names: {} -> {})".
+                         format(trace_from.fn_name, trace_from.request_id, trace_to.fn_name, trace_to.request_id, value, varname_from, varname_to))
+
+
+class OutputIndex:
+    # Index from the output names and output values at any depth of the
+    # traces added so far to where they can be found. This allows finding
+    # all connections into a trace with a single lookup for every input
+    # parameter rather than comparing it with every older trace. Outputs
+    # which are loaded lazily are only decoded for as long as it takes to add
+    # them to the index. Traces are referred to by their position in traces.
+    #
+    # When the inputs of all the traces are known up front only the outputs
+    # that match the name or value of any of them at all are indexed. This
+    # keeps the index small as most outputs are never used as inputs.
+    def __init__(self, traces, inputs=None):
+        self._traces = traces
+        self._names = {}
+        self._values = {}
+        self._input_names = None
+        self._input_keys = None
+        if inputs is not None:
+            self._input_names = set()
+            self._input_keys = set()
+            for trace in inputs:
+                for path, _, depth, _, key in flatten_params(trace.inparams):
+                    if depth == 0:
+                        self._input_names.add(path)
+                    self._input_keys.add(key)
+
+    def add(self, j):
+        input_names, input_keys = self._input_names, self._input_keys
+        for out_pos, (path, top, depth, val, key) in enumerate(flatten_params(self._traces[j].peek_outparams())):
+            if not val:
+                continue
+            if depth == 0 and (input_names is None or path in input_names):
+                self._names.setdefault(path, []).append((j, top, val))
+            # below the toplevel only strings such as ids and ARNs connect
+            # traces, equal numbers and flags there are mostly a coincidence
+            if depth > 0 and type(val) != str:
+                continue
+            if input_keys is None or key in input_keys:
+                self._values.setdefault(key, []).append((j, top, depth, out_pos, path))
+
+    def find_connections(self, i):
+        # Matches are sorted on the position of the older traces and then on
+        # the position of the output and input parameters, with the matches
+        # for nested output values coming before the ones for the toplevel
+        # output parameter they are part of.
+        trace = self._traces[i]
+        found = []
+        for in_pos, (path_in, _, depth_in, val_in, key) in enumerate(flatten_params(trace.inparams)):
+            # only toplevel parameters are matched on their name
+            if depth_in == 0:
+                for j, top, val_from in self._names.get(path_in, ()):
+                    found.append(((j, top, 1, 0, in_pos), True, path_in, path_in, val_from))
+            elif type(val_in) != str:
+                continue
+            for j, top, depth_out, out_pos, path_out in self._values.get(key, ()):
+                # a matching name takes precedence over matching values for
+                # the toplevel output parameters
+                if depth_out == 0 and path_out in trace.inparams:
+                    continue
+                found.append(((j, top, 0 if depth_out else 1, out_pos, in_pos), False, path_out, path_in, None))
+
+        found.sort(key=lambda f: f[0])
+        connections = []
+        for (j, _, _, _, _), is_name_match, path_out, path_in, val_from in found:
+            val_to = get_path_value(trace.inparams, path_in)
+            if not is_name_match:
+                c = MatchingValueEdge(self._traces, j, i, val_to, path_out, path_in)
+            elif val_from == val_to:
+                c = MatchingNameAndValueEdge(self._traces, j, i, path_out, val_to)
+            else:
+                c = MatchingNameEdge(self._traces, j, i, path_out, val_from, val_to)
+            connections.append(c)
+        return connections
 
 
 class TracePlayer(TraceRunner):
-    def __init__(self, input_fd, input_args={}, profile=None, endpoint=None, region=None, prompt_color=True):
-        super().__init__()
+    def __init__(self, input_fd, input_args={}, profile=None, endpoint=None, region=None, prompt_color=True, reuse_session=True,
+                 lazy_outputs=True, direct=False):
+        super().__init__(reuse_session=reuse_session)
         self._fd = input_fd
         self._input_args = input_args
         self.connections = []
@@ -59,19 +222,100 @@ class TracePlayer(TraceRunner):
         self.endpoint = endpoint
         self.region = region
         self.prompt_color = prompt_color
+        self.lazy_outputs = lazy_outputs
+        self.direct = direct
+        self._poll_timeout = None
+        self._wait_timeout = None
+        self._waited = {}
+        self._skipped = set()
+        self.label = None
+        self.checkpoint = None
+        self.cache = None
+        self.rate_limiter = None
+        self.bounded_pages = False
+        self.throttle_retries = THROTTLE_RETRIES
+        self._resumed = {}
 
     def __enter__(self):
-        traces = [Trace.from_dict(t) for t in json_load(self._fd)]
+        traces = [Trace.from_dict(t) for t in read_traces(self._fd, lazy_outparams=self.lazy_outputs)]
         input_trace = self._get_input_trace(traces)
         traces.insert(0, input_trace)
         self.traces = traces
+        self._index_connections()
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        return
+        if self.output_writer is not None:
+            self.output_writer.close()
+        if self.cache is not None and self.cache.hits:
+            logger.info("Served {} out of {} read-only calls from the cache".format(self.cache.hits, self.cache.hits + self.cache.misses))
+        if self.rate_limiter is not None:
+            for (service_id, profile, region), calls, rate, throttled in self.rate_limiter.get_summary():
+                target = "".join(" {}".format(t) for t in (profile, region) if t)
+                logger.info("Made {} calls to {}{} at {:.1f} calls per second, {} got throttled".format(
+                    calls, service_id, target, rate, throttled))
+
+    def for_target(self, profile=None, region=None, endpoint=None):
+        # Returns a player for playing the same trace under another profile or
+        # in another region. It shares the loaded traces and the connections
+        # between them but keeps its own results and clients.
+        ret = copy.copy(self)
+        ret.profile = profile
+        ret.region = region
+        ret.endpoint = endpoint
+        ret._local = threading.local()
+        ret._play_results = {}
+        ret._waited = {}
+        ret._skipped = set()
+        return ret
+
+    def find_input_connections(self, names):
+        # Finds the connections for when the given parameters get overridden
+        # without knowing their values yet. Only the names of the overridden
+        # parameters matter for the connections so for_inputs() can then play
+        # the trace with any values for them.
+        input_args = self._input_args
+        self._input_args = dict(input_args)
+        self._input_args.update((name, SWEEP_PLACEHOLDER) for name in names)
+        self.traces[0] = self._get_input_trace(self.traces[1:])
+        self._input_args = input_args
+        self.find_connections()
+        self.prune_connections()
+
+    def for_inputs(self, input_args):
+        # Returns a player for playing the same trace with other overridden
+        # parameters, without finding the connections again. These have to
+        # be found for the same parameter names first, see above.
+        ret = self.for_target(self.profile, self.region, self.endpoint)
+        ret._input_args = input_args
+        ret.traces = [ret._get_input_trace(self.traces[1:])] + self.traces[1:]
+        ret._positions = dict(self._positions)
+        del ret._positions[id(self.traces[0])]
+        ret._positions[id(ret.traces[0])] = 0
+        return ret
+
+    def resume(self, results):
+        # Skips the traces with the given positions when playing the trace and
+        # uses the given results for them instead, e.g. as loaded from a
+        # Checkpoint of an earlier run that stopped halfway.
+        self._resumed = results
+
+    def get_play_summary(self):
+        # the number of traces that succeeded, failed and were never played
+        # during the last time the trace was played
+        succeeded, failed = 0, 0
+        for i in range(1, len(self.traces)):
+            if i not in self._play_results:
+                continue
+            if self._play_results[i]:
+                succeeded += 1
+            else:
+                failed += 1
+        return succeeded, failed, len(self.traces) - 1 - succeeded - failed
 
     def print_prompt(self, data):
-        prompt = "\x1b[32m(play)\x1b[0m {}" if self.prompt_color else "(play) {}"
+        prompt = "(play)" if self.label is None else "(play {})".format(self.label)
+        prompt = "\x1b[32m{}\x1b[0m {{}}".format(prompt) if self.prompt_color else "{} {{}}".format(prompt)
         data = "\x1b[33m{}\x1b[0m".format(data) if self.prompt_color else data
         print(prompt.format(data))
 
@@ -98,12 +342,30 @@ class TracePlayer(TraceRunner):
         ret.finish()
         return ret
 
-    def play_trace(self, dryrun=False, stop_on_error=True, sleep_delay=None):
-        logger.debug("Playing trace: dryrun={}, stop_on_error={}, sleep_delay={}".format(dryrun, stop_on_error, sleep_delay))
+    def play_trace(self, dryrun=False, stop_on_error=True, sleep_delay=None, jobs=1, speed=1.0, max_gap=None, poll_timeout=None,
+                   wait_timeout=None):
+        # The recorded gaps between subsequent traces are replayed at the given
+        # speed, so 2 halves them and 0 skips them, and none of them takes
+        # longer than max_gap seconds. With poll_timeout no gaps are replayed
+        # at all but the traces depending on earlier ones are retried for up
+        # to poll_timeout seconds instead until what they depend on is ready.
+        # With wait_timeout no gaps are replayed either but traces using a
+        # resource created by an earlier trace first wait for up to
+        # wait_timeout seconds for it to be ready.
+        logger.debug("Playing trace: dryrun={}, stop_on_error={}, sleep_delay={}, jobs={}, speed={}, max_gap={}, poll_timeout={}, "
+                     "wait_timeout={}".format(dryrun, stop_on_error, sleep_delay, jobs, speed, max_gap, poll_timeout, wait_timeout))
 
         t0 = self.traces[0]
         self._play_results = {}
-        self._play_results[t0.request_id] = t0
+        self._play_results[0] = t0
+        self._poll_timeout = poll_timeout
+        self._wait_timeout = wait_timeout
+        self._waited = {}
+        self._skipped = set()
+
+        if jobs > 1:
+            self._play_trace_parallel(dryrun, stop_on_error, sleep_delay, jobs)
+            return
 
         logger.debug("Running {} single traces".format(len(self.traces)))
         for i, trace in enumerate(self.traces):
@@ -114,15 +376,16 @@ class TracePlayer(TraceRunner):
             if i > 0:
 
                 # calculate sleep delay from the time difference in the loaded
-                # trace if no specific sleep delay is specified
-                if sleep_delay is None:
-                    last_trace = self.traces[i - 1]
-                    diff = trace.ts_start - last_trace.ts_end
-                    secs = diff.total_seconds()
-                    isecs = int(secs)
+                # trace if no specific sleep delay is specified; there's no
+                # point in waiting for traces resumed from a checkpoint, nor
+                # for the results of one, as these were played long ago
+                if self._group_start[i] != i or i in self._resumed or i - 1 in self._resumed:
+                    secs = 0
+                elif sleep_delay is None:
+                    secs = self.get_gap(i, speed, max_gap) if poll_timeout is None and wait_timeout is None else 0
                 else:
                     secs = sleep_delay
-                    isecs = int(sleep_delay)
+                isecs = int(secs)
                 if isecs > 0:
                     self.print_prompt("sleeping for {} second{}".format(isecs, "" if isecs < 2 else "s"))
 
@@ -136,50 +399,196 @@ class TracePlayer(TraceRunner):
                     time.sleep(secs)
 
             ret = self.play_single_trace(trace, dryrun, i == 0)
-            if not ret and stop_on_error:
+            if not ret and i not in self._skipped and stop_on_error:
                 break
 
+    def get_gap(self, i, speed=1.0, max_gap=None):
+        # the recorded time between the end of the previous trace and the
+        # start of trace i adjusted to the replay speed
+        if speed == 0:
+            return 0
+        diff = self.traces[i].ts_start - self.traces[i - 1].ts_end
+        secs = diff.total_seconds() / speed
+        if max_gap is not None:
+            secs = min(secs, max_gap)
+        return secs
+
+    def get_dependencies(self):
+        # Turn the connections into a dependency graph over the indices of
+        # the loaded traces. Edges coming from the input trace are left out
+        # as that one is always played before anything else.
+        #
+        # Pruning only keeps the oldest trace a value comes from, so traces
+        # using the same value, e.g. a PutItem and a DeleteTable on the same
+        # table, are ordered on it as well. Traces that only read it wait for
+        # the last earlier trace that might change it and traces that might
+        # change it wait for that one and every trace reading it since.
+        deps = [set() for _ in self.traces]
+        last_writer = {}
+        readers = {}
+        for i_to, edges in enumerate(self._incoming):
+            values = set()
+            for edge in edges:
+                if edge.idx_from == i_to:
+                    continue
+                if edge.idx_from != 0:
+                    deps[i_to].add(edge.idx_from)
+                values.add((edge.idx_from, edge.varname_from))
+            read_only = is_read_only(self.traces[i_to].fn_name)
+            for value in values:
+                if value in last_writer:
+                    deps[i_to].add(last_writer[value])
+                if read_only:
+                    readers.setdefault(value, []).append(i_to)
+                else:
+                    deps[i_to].update(readers.pop(value, ()))
+                    last_writer[value] = i_to
+        # the first call of a group plays all of them so it depends on what
+        # any of them depends on and the others only depend on the first
+        for start, members in self._groups.items():
+            for m in members[1:]:
+                deps[start].update(deps[m])
+                deps[m] = {start}
+            deps[start].difference_update(members)
+        return deps
+
+    def _play_trace_parallel(self, dryrun, stop_on_error, sleep_delay, jobs):
+        deps = self.get_dependencies()
+        dependents = [[] for _ in self.traces]
+        for i, d in enumerate(deps):
+            for j in d:
+                dependents[j].append(i)
+
+        # The recorded gaps between subsequent traces are meaningless once
+        # traces run out of order so only an explicit sleep delay is honoured.
+        def play(i):
+            if sleep_delay and i not in self._resumed:
+                time.sleep(sleep_delay)
+            return self.play_single_trace(self.traces[i], dryrun, False)
+
+        self.play_single_trace(self.traces[0], dryrun, True)
+        waiting = [len(d) for d in deps]
+        played = 1
+        logger.debug("Running {} single traces with {} jobs".format(len(self.traces), jobs))
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            running = {}
+            for i in range(1, len(self.traces)):
+                if waiting[i] == 0:
+                    running[pool.submit(play, i)] = i
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    i = running.pop(fut)
+                    played += 1
+                    if not fut.result() and (stop_on_error or i in self._skipped):
+                        # the dependents of this trace will never have all
+                        # their dependencies met so they are never started
+                        logger.debug("Not starting any of the traces depending on {} [{}]".format(self.traces[i].fn_name, i))
+                        continue
+                    for j in dependents[i]:
+                        waiting[j] -= 1
+                        if waiting[j] == 0:
+                            running[pool.submit(play, j)] = j
+
+        skipped = len(self.traces) - played
+        if skipped > 0:
+            logger.warning("Skipped {} trace{} because a trace they depend on failed or was skipped".format(skipped, "" if skipped == 1 else "s"))
+
     def play_single_trace(self, trace, dryrun=False, is_first=False):
         # find connections into this trace and replace the variables with
         # the cached results variables
         replace_vars = {}
-        logger.debug("Playing single trace: fn_name={}, request_id={}, dryrun={}".format(trace.fn_name, trace.request_id, dryrun))
+
+        # the values logged here can be huge so only format them when they
+        # are actually going to be logged
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            logger.debug("Playing single trace: fn_name={}, request_id={}, dryrun={}".format(trace.fn_name, trace.request_id, dryrun))
         missing, replaced = 0, 0
-        for edge in self.connections:
-            if edge.trace_to.request_id == trace.request_id:
+        pos = self._positions[id(trace)]
+        if pos in self._resumed:
+            logger.info("Skipping {} [{}] as it was played before".format(trace.fn_name, pos))
+            self._play_results[pos] = self._resumed[pos]
+            return self._play_results[pos]
+        if self._group_start[pos] == pos and self._depends_on_skipped(pos):
+            logger.warning("Skipping {} [{}] as a call it depends on wasn't made".format(trace.fn_name, pos))
+            self._skipped.update(self._groups.get(pos, [pos]))
+            return None
+        if pos in self._groups:
+            return self._play_group(pos, dryrun)
+        if self._group_start[pos] != pos:
+            # played together with the first call of its group
+            return self._play_results.get(pos)
+        for edge in self._incoming[pos]:
+            if debug:
                 logger.debug("Found matching edge to this trace from: fn_name={}, request_id={}".format(edge.trace_from.fn_name, edge.trace_from.request_id))
 
-                from_rid = edge.trace_from.request_id
-                if from_rid not in self._play_results:
-                    logger.warning("Previous results not found so cannot replace variables.")
-                    logger.warning("The {} call probably failed.".format(edge.trace_from.fn_name))
-                    missing += 1
-                    continue
+            from_pos = edge.idx_from
+            if from_pos not in self._play_results:
+                logger.warning("Previous results not found so cannot replace variables.")
+                logger.warning("The {} call probably failed.".format(edge.trace_from.fn_name))
+                missing += 1
+                continue
 
-                # check if we can fetch results from the previous call
-                rtrace = self._play_results[from_rid]
-                if not rtrace:
-                    logger.warning("The {} call probably failed.".format(edge.trace_from.fn_name))
-                    missing += 1
-                    continue
+            # check if we can fetch results from the previous call
+            rtrace = self._play_results[from_pos]
+            if not rtrace:
+                logger.warning("The {} call probably failed.".format(edge.trace_from.fn_name))
+                missing += 1
+                continue
 
-                # check if we found a value for the connection
-                from_name = edge.varname_from
-                to_name = edge.varname_to
-                old_val = edge.trace_to.inparams[to_name]
-                val = rtrace.get_output_value(from_name)
-                if val:
-                    logger.debug("Replacing {} value with {} (was: {})".format(to_name, shlex.quote(val), shlex.quote(old_val)))
-                    replace_vars[to_name] = val
-                    replaced += 1
-                    continue
+            # check if we found a value for the connection
+            from_name = edge.varname_from
+            to_name = edge.varname_to
+            val = rtrace.get_output_value(from_name)
+            if val:
+                if debug:
+                    old_val = get_path_value(edge.trace_to.inparams, to_name)
+                    logger.debug("Replacing {} value with {} (was: {})".format(to_name, shlex.quote(str(val)), shlex.quote(str(old_val))))
+                replace_vars[to_name] = val
+                replaced += 1
+                continue
 
-                logger.warning("Couldn't replace {} as we didn't find {} (was: {})".format(to_name, from_name, shlex.quote(old_val)))
-                missing += 1
+            old_val = get_path_value(edge.trace_to.inparams, to_name)
+            logger.warning("Couldn't replace {} as we didn't find {} (was: {})".format(to_name, from_name, shlex.quote(str(old_val))))
+            missing += 1
 
-        logger.debug("Replacing {} out of {} parameters ({} failed to replace)".
-                     format(replaced, missing + replaced, missing))
+        if debug:
+            logger.debug("Replacing {} out of {} parameters ({} failed to replace)".
+                         format(replaced, missing + replaced, missing))
+        replace_vars = replace_path_values(trace.inparams, replace_vars)
         base_poc = trace.get_shell_poc(replace_vars)
+        poc = "{} {}".format(base_poc, " ".join(self._get_overrides()))
+
+        # highlight replaced variables in different color if requested
+        outpoc = poc
+        if self.prompt_color:
+            for name in replace_vars:
+                optname, optval = trace.get_shell_var(name, replace_vars[name])
+                outpoc = outpoc.replace("{} {}".format(optname, optval),
+                                        "\x1b[31m{} {}\x1b[0m".format(optname, optval))
+
+        if not is_first:
+            self.print_prompt(outpoc)
+
+        if dryrun or is_first:
+            self._play_results[pos] = trace
+            return trace
+
+        poll_timeout = self._poll_timeout
+        if self._wait_timeout and not self._wait_for_resources(pos):
+            # retry this trace instead when not every resource it depends on
+            # could be waited for
+            poll_timeout = poll_timeout or self._wait_timeout
+        out_trace = self._run_trace(trace, poc, replace_vars)
+        if out_trace is None and poll_timeout and self._has_dependencies(pos):
+            out_trace = self._poll_trace(trace, poc, replace_vars, poll_timeout)
+        self._play_results[pos] = out_trace
+        if out_trace and self.checkpoint is not None:
+            self.checkpoint.add(pos, out_trace)
+        return out_trace
+
+    def _get_overrides(self):
         override = []
 
         # add overriding variables
@@ -195,23 +604,166 @@ class TracePlayer(TraceRunner):
             override.append("--region")
             override.append(shlex.quote(self.region))
             logger.debug("Added --region")
-        poc = "{} {}".format(base_poc, " ".join(override))
-
-        # highlight replaced variables in different color if requested
-        outpoc = poc
-        if self.prompt_color:
-            for name in replace_vars:
-                optname, optval = trace.get_shell_var(name, replace_vars[name])
-                outpoc = outpoc.replace("{} {}".format(optname, optval),
-                                        "\x1b[31m{} {}\x1b[0m".format(optname, optval))
+        return override
 
-        if not is_first:
-            self.print_prompt(outpoc)
+    def _play_group(self, pos, dryrun=False):
+        # The calls made by a single AWS CLI command, e.g. aws s3 sync, are
+        # played by running that command again as it was recorded. The calls
+        # it makes are then matched up with the recorded ones by their order
+        # and function names. Nothing can be replaced in the command itself.
+        members = self._groups[pos]
+        trace = self.traces[pos]
+        skipped = sum(1 for m in members for edge in self._incoming[m] if edge.idx_from not in members)
+        if skipped:
+            logger.warning("Playing {} as recorded without replacing {} value{} in it".format(
+                " ".join(trace.command[:2]), skipped, "" if skipped == 1 else "s"))
+        poc = " ".join(["aws"] + [shlex.quote(arg) for arg in trace.command] + self._get_overrides())
+        self.print_prompt(poc)
 
-        if dryrun or is_first:
-            self._play_results[trace.request_id] = trace
+        if dryrun:
+            for m in members:
+                self._play_results[m] = self.traces[m]
             return trace
 
+        if self.output_writer is not None:
+            self.set_output_name(get_output_name(self.label, pos, trace.fn_name))
+        args = self._get_cli_args(poc)
+        out_traces = self.run_aws_cmd_traces(args) if args is not None else None
+        if out_traces is not None and len(out_traces) != len(members):
+            logger.warning("{} made {} calls instead of the {} recorded".format(" ".join(trace.command[:2]), len(out_traces), len(members)))
+        remaining = list(out_traces or [])
+        for m in members:
+            out_trace = next((t for t in remaining if t.fn_name == self.traces[m].fn_name), None)
+            if out_trace is None and out_traces is not None:
+                # the command succeeded without making this call, e.g. as
+                # there was less to sync, so it didn't fail but what depends
+                # on it can't be played either
+                logger.warning("Skipping what depends on {} [{}] as the command didn't make it".format(self.traces[m].fn_name, m))
+                self._skipped.add(m)
+                continue
+            if out_trace is not None:
+                remaining.remove(out_trace)
+                if self.checkpoint is not None:
+                    self.checkpoint.add(m, out_trace)
+            self._play_results[m] = out_trace
+        return self._play_results.get(pos)
+
+    def _has_dependencies(self, pos):
+        return any(edge.idx_from not in (0, pos) for edge in self._incoming[pos])
+
+    def _depends_on_skipped(self, pos):
+        # whether this trace, or any call of its group, uses the results of
+        # a trace that was skipped
+        return any(edge.idx_from in self._skipped for m in self._groups.get(pos, [pos]) for edge in self._incoming[m])
+
+    def _wait_for_resources(self, pos):
+        # Waits for the resources created by the Create* traces this trace
+        # depends on to be ready. Every resource is only waited for once.
+        # Returns whether there was a waiter for every one of them.
+        ret = True
+        for j in sorted(set(edge.idx_from for edge in self._incoming[pos])):
+            rtrace = self._play_results.get(j)
+            if j in (0, pos) or not rtrace or not rtrace.fn_name.split(".")[-1].startswith("Create"):
+                continue
+            if j not in self._waited:
+                logger.info("Waiting for the resource created by {} to be ready".format(rtrace.fn_name))
+                try:
+                    self._waited[j] = self.wait_for_resource(rtrace, self._wait_timeout, self.profile, self.region, self.endpoint)
+                except (ValueError, botocore.exceptions.NoCredentialsError, botocore.exceptions.ClientError,
+                        botocore.exceptions.ParamValidationError) as e:
+                    # e.g. an unknown service or not being allowed to describe
+                    # the resource, which retrying the trace itself might get by
+                    logger.debug("Waiting for the resource created by {} failed: {}".format(rtrace.fn_name, e))
+                    self._waited[j] = None
+                if self._waited[j] is None:
+                    logger.info("No way to wait for the resource created by {} so retrying instead".format(rtrace.fn_name))
+            if self._waited[j] is None:
+                ret = False
+        return ret
+
+    def _poll_trace(self, trace, poc, replace_vars, timeout):
+        # A trace depending on earlier traces can fail because what they
+        # created isn't ready yet, e.g. an IAM role that hasn't propagated, so
+        # it is retried with an exponential backoff until the timeout.
+        deadline = time.monotonic() + timeout
+        delay = POLL_MIN_DELAY
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logger.warning("Giving up on {} after retrying it for {} seconds".format(trace.fn_name, timeout))
+                return None
+            delay = min(delay, remaining)
+            logger.info("Retrying {} in {:.1f} seconds".format(trace.fn_name, delay))
+            time.sleep(delay)
+            out_trace = self._run_trace(trace, poc, replace_vars)
+            if out_trace is not None:
+                return out_trace
+            delay = min(delay * 2, POLL_MAX_DELAY)
+
+    def _run_trace(self, trace, poc, replace_vars):
+        if self.cache is None:
+            return self._call_trace(trace, poc, replace_vars)
+        if not is_read_only(trace.fn_name):
+            # the results of earlier calls to the same service might have
+            # changed by this one, also when it fails halfway through
+            self.cache.invalidate(trace.fn_name.split(".")[0])
+            return self._call_trace(trace, poc, replace_vars)
+
+        params = dict(trace.inparams)
+        params.update(replace_vars)
+        key = get_cache_key(trace.fn_name, params, self.profile, self.region, self.endpoint)
+        out_trace = self.cache.get(key)
+        if out_trace is not None:
+            logger.info("Using the cached result of {}".format(trace.fn_name))
+            self.print_output(out_trace.outparams)
+            return out_trace
+        out_trace = self._call_trace(trace, poc, replace_vars)
+        # results with only the pages this trace needed, with bounded pages,
+        # would be missing what the same call elsewhere in the trace needs
+        if out_trace is not None and not self.stopped_early():
+            self.cache.put(key, out_trace)
+        return out_trace
+
+    def _call_trace(self, trace, poc, replace_vars):
+        if self.rate_limiter is None:
+            return self._execute_trace(trace, poc, replace_vars)
+
+        # calls throttled by the service are retried after a random delay
+        # and make the rate limiter slow down the calls to the service
+        bucket = self.rate_limiter.get_bucket(trace.fn_name.split(".")[0], self.profile, self.region)
+        delay = THROTTLE_MIN_DELAY
+        for attempt in range(self.throttle_retries + 1):
+            bucket.acquire()
+            out_trace = self._execute_trace(trace, poc, replace_vars)
+            if out_trace is not None:
+                bucket.succeeded()
+                return out_trace
+            if not is_throttling(self.get_error_code()):
+                return None
+            bucket.was_throttled()
+            if attempt == self.throttle_retries:
+                break
+            jitter = random.uniform(0, delay)
+            logger.warning("{} got throttled so retrying it in {:.1f} seconds".format(trace.fn_name, jitter))
+            time.sleep(jitter)
+            delay = min(delay * 2, THROTTLE_MAX_DELAY)
+        logger.warning("Giving up on {} after it got throttled {} times".format(trace.fn_name, self.throttle_retries + 1))
+        return None
+
+    def _execute_trace(self, trace, poc, replace_vars):
+        if self.output_writer is not None:
+            self.set_output_name(get_output_name(self.label, self._positions[id(trace)], trace.fn_name))
+        if self.direct:
+            return self._play_direct(trace, replace_vars)
+
+        new_args = self._get_cli_args(poc)
+        if new_args is None:
+            return None
+        out_trace = self.run_aws_cmd(new_args)
+        logger.debug("Ran trace with the AWS CLI")
+        return out_trace
+
+    def _get_cli_args(self, poc):
         # shell split the arguments and remove the call to aws itself
         args = shlex.split(poc)
         if args[0] != "aws":
@@ -226,12 +778,30 @@ class TracePlayer(TraceRunner):
                 logger.error("Couldn't read {}".format(arg))
                 return None
             new_args.append(arg_ret)
+        return new_args
 
-        out_trace = self.run_aws_cmd(new_args)
-        self._play_results[trace.request_id] = out_trace
-        logger.debug("Ran trace and added results to the results cache")
+    def _play_direct(self, trace, replace_vars):
+        # the shell command is only used for display here, the parameters
+        # are handed to the botocore client as they are
+        params = dict(trace.inparams)
+        for name, val in replace_vars.items():
+            if type(val) == str:
+                val = process_file_argument(val)
+                if val is None:
+                    logger.error("Couldn't read {}".format(replace_vars[name]))
+                    return None
+            params[name] = val
+
+        # with bounded pages no more pages are fetched once every output the
+        # traces after this one use has been found
+        enough = functools.partial(self._has_used_outputs, self._positions[id(trace)]) if self.bounded_pages else None
+        out_trace = self.run_api_call(trace.fn_name, params, self.profile, self.region, self.endpoint, enough)
+        logger.debug("Called {} directly and added results to the results cache".format(trace.fn_name))
         return out_trace
 
+    def _has_used_outputs(self, pos, outparams):
+        return all(get_path_value(outparams, path) is not None for path in self._outgoing[pos])
+
     def get_shell_poc(self):
         pocs = []
         for trace in self.traces:
@@ -241,57 +811,26 @@ class TracePlayer(TraceRunner):
 
     def find_connections_between_traces(self, trace_from, trace_to):
         logger.debug("Finding connections from {} to {}".format(trace_from.fn_name, trace_to.fn_name))
-        for name_out in trace_from.outparams:
-            val_from = trace_from.outparams[name_out]
-            if not val_from:
-                continue
-
-            if type(val_from) == dict:
-                # check nested structure XXX for now we only check one level deep
-                for kname in val_from:
-                    nested_name = "{}.{}".format(name_out, kname)
-                    kval = val_from[kname]
-                    for k in trace_to.inparams:
-                        inval = trace_to.inparams[k]
-                        if inval == kval:
-                            c = MatchingValueEdge(trace_from, trace_to, kval, nested_name, k)
-                            self.connections.append(c)
-
-            # check if we can find a matching parameter name between the output
-            # of the trace we're coming from and the input parameters of the
-            # trace we're comparing with
-            if name_out in trace_to.inparams:
-                val_to = trace_to.inparams[name_out]
-                if val_from == val_to:
-                    c = MatchingNameAndValueEdge(trace_from, trace_to, name_out, val_to)
-                else:
-                    c = MatchingNameEdge(trace_from, trace_to, name_out, val_from, val_to)
-                self.connections.append(c)
-                continue
-
-            # check if we can find a matching input value even though the
-            # parameter names are different compared with the output value of
-            # the trace we're coming from
-            for name_in in trace_to.inparams:
-                val_to = trace_to.inparams[name_in]
-                if val_from == val_to:
-                    c = MatchingValueEdge(trace_from, trace_to, val_to, name_out, name_in)
-                    self.connections.append(c)
-                # we keep going as we technically could have multiple
-                # parameters which are set to the same value
+        index = OutputIndex(self.traces)
+        index.add(self._positions[id(trace_from)])
+        self.connections.extend(index.find_connections(self._positions[id(trace_to)]))
 
     def find_connections(self):
+        # Both the inputs and outputs of every trace are flattened only once
+        # and every trace is matched against the index of all older traces.
+        # This yields the same connections in the same order as calling
+        # find_connections_between_traces() on every pair of traces.
         self.connections = []
-        for i, trace in enumerate(self.traces):
-            for j, older_trace in enumerate(self.traces):
-                if j == i:
-                    break
-                self.find_connections_between_traces(older_trace, trace)
+        index = OutputIndex(self.traces, self.traces)
+        for i in range(len(self.traces)):
+            self.connections.extend(index.find_connections(i))
+            index.add(i)
+        self._index_connections()
 
     def prune_connections(self):
         # Assumption is that connections are sorted in the order of the loaded
-        # tracefiles by find_connections(). We create a keyname of the unique
-        # request id's and the variable name that the edge points too. If if is
+        # tracefiles by find_connections(). We create a keyname of the position
+        # of the trace and the variable name that the edge points too. If if is
         # already in the pruned dictionary it means we found an older
         # connection in the tracefile that already supplies this value and as
         # such we can ignore the new one.
@@ -299,7 +838,7 @@ class TracePlayer(TraceRunner):
         before_cnt = len(self.connections)
         prune_cnt = 0
         for i, edge in enumerate(self.connections):
-            keyname = "{}.{}".format(edge.trace_to.request_id, edge.varname_to)
+            keyname = (edge.idx_to, edge.varname_to)
             if keyname in pruned:
                 prune_cnt += 1
                 continue
@@ -308,6 +847,184 @@ class TracePlayer(TraceRunner):
         self.connections = list(pruned.values())
         after_cnt = len(self.connections)
         logger.debug("Pruned {} connections from total of {} so now {} left".format(prune_cnt, before_cnt, after_cnt))
+        self._index_connections()
+
+    def set_connections(self, connections):
+        # sets the connections from (idx_from, idx_to, varname_from,
+        # varname_to) tuples, e.g. as stored in a plan, instead of finding them
+        self.connections = [Edge(self.traces, *c) for c in connections]
+        self._index_connections()
+
+    def drop_unused_outputs(self):
+        # The outputs of the loaded traces are only used for the connections
+        # going out of them and then only in a dry run, as otherwise the
+        # outputs of the commands that actually ran are used. Everything else
+        # can be dropped to save memory once the connections are final.
+        for trace, paths in zip(self.traces, self._outgoing):
+            trace.keep_outputs(paths)
+        logger.debug("Dropped the outputs of {} traces not used by any connection".format(sum(1 for u in self._outgoing if not u)))
+
+    def _index_connections(self):
+        # Map every trace to its position in the list of loaded traces and
+        # every position to the connections going into that trace and the
+        # outputs used by the connections going out of it. Playing a trace
+        # then doesn't require a scan of all the connections. This needs to
+        # be redone whenever the traces or connections change.
+        self._positions = {id(trace): i for i, trace in enumerate(self.traces)}
+        self._incoming = [[] for _ in self.traces]
+        self._outgoing = [[] for _ in self.traces]
+        for edge in self.connections:
+            self._incoming[edge.idx_to].append(edge)
+            self._outgoing[edge.idx_from].append(edge.varname_from)
+
+        # the positions of the calls in every group by the position of the
+        # first one and the position of the first call of every call's group
+        self._groups = {}
+        self._group_start = list(range(len(self.traces)))
+        for i in range(2, len(self.traces)):
+            group = self.traces[i].group
+            if group is not None and group == self.traces[i - 1].group:
+                self._group_start[i] = self._group_start[i - 1]
+                self._groups.setdefault(self._group_start[i], [self._group_start[i]]).append(i)
+
+
+class PlayResult:
+    def __init__(self, label, succeeded, failed, skipped, duration, error=None):
+        self.label = label
+        self.succeeded = succeeded
+        self.failed = failed
+        self.skipped = skipped
+        self.duration = duration
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None and self.failed == 0 and self.skipped == 0
+
+
+def play_players(players, target_jobs=None, **kwargs):
+    # Plays the trace of every player, up to target_jobs of them at the same
+    # time or TARGET_JOBS if not given, and returns a PlayResult for every
+    # player. The keyword arguments are passed on to play_trace().
+    def play(tp):
+        start = time.monotonic()
+        error = None
+        try:
+            tp.play_trace(**kwargs)
+        except Exception as e:
+            logger.error("Playing the trace for {} failed: {}".format(tp.label, str(e)))
+            error = str(e)
+        return PlayResult(tp.label, *tp.get_play_summary(), time.monotonic() - start, error)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(target_jobs or TARGET_JOBS, len(players)))) as pool:
+        return list(pool.map(play, players))
+
+
+def get_target_players(player, targets):
+    # a player for every (profile, region) target, labelled with the target
+    ret = []
+    for profile, region in targets:
+        tp = player.for_target(profile, region, player.endpoint)
+        label = "{}/{}".format(profile or "default", region or "default")
+        tp.label = label if player.label is None else "{} {}".format(player.label, label)
+        ret.append(tp)
+    return ret
+
+
+def play_targets(player, targets, target_jobs=None, **kwargs):
+    # plays the trace under every (profile, region) target in targets
+    return play_players(get_target_players(player, targets), target_jobs, **kwargs)
+
+
+def read_sweep_file(filename):
+    # Reads the sets of overridden parameters for a sweep from a CSV file
+    # with a header naming the parameters or from a JSON lines file with an
+    # object for every set. Parameters can be named as on the command line,
+    # e.g. table-name, or as in the trace, e.g. TableName. Empty CSV fields
+    # leave the parameter alone.
+    sweep = []
+    with open(filename, "r", newline="") as fd:
+        if filename.endswith(".csv"):
+            for row in csv.DictReader(fd):
+                sweep.append({convert_to_camelcase(k): v for k, v in row.items() if k and v})
+        else:
+            for line in fd:
+                if not line.strip():
+                    continue
+                row = json.loads(line)
+                if type(row) != dict:
+                    raise ValueError("every line of a sweep file should be a JSON object")
+                sweep.append({convert_to_camelcase(k): v for k, v in row.items()})
+    return sweep
+
+
+def play_sweep(player, sweep, targets=None, target_jobs=None, drop_unused_outputs=False, **kwargs):
+    # Plays the trace once for every set of overridden parameters in sweep,
+    # on top of the ones the player already overrides, and under every
+    # (profile, region) target. The connections are found only once for all
+    # the sets overriding the same parameters instead of for every set, which
+    # leaves the player with the connections for the last of these. Returns
+    # a PlayResult for every set and target, in that order.
+    if targets is None:
+        targets = [(player.profile, player.region)]
+    groups = {}
+    for i, args in enumerate(sweep):
+        groups.setdefault(frozenset(args), []).append(i)
+
+    results = []
+    for names, rows in groups.items():
+        player.find_input_connections(names)
+        if drop_unused_outputs and len(groups) == 1:
+            player.drop_unused_outputs()
+        players = []
+        for i in rows:
+            tp = player.for_inputs(dict(player._input_args, **sweep[i]))
+            tp.label = "#{}".format(i + 1)
+            for target_player in get_target_players(tp, targets) if len(targets) > 1 else [tp]:
+                players.append((i, target_player))
+        played = play_players([tp for _, tp in players], target_jobs, **kwargs)
+        results.extend(zip([i for i, _ in players], played))
+    results.sort(key=lambda r: r[0])
+    return [r for _, r in results]
+
+
+def print_play_results(results):
+    width = max([6] + [len(r.label) for r in results])
+    print("{:{}} {:>9} {:>6} {:>7} {:>9}".format("TARGET", width, "SUCCEEDED", "FAILED", "SKIPPED", "DURATION"))
+    for r in results:
+        error = "" if r.error is None else "  " + r.error
+        print("{:{}} {:>9} {:>6} {:>7} {:>8.1f}s{}".format(r.label, width, r.succeeded, r.failed, r.skipped, r.duration, error))
+    ok = sum(1 for r in results if r.ok)
+    print("{} out of {} replays played without errors".format(ok, len(results)))
+
+
+def play_checkpointed(player, checkpoint, resume=False, **kwargs):
+    # Plays the trace keeping track of the progress in the checkpoint, after
+    # loading the progress made before from it when resuming. A dry run only
+    # shows what would be skipped and leaves the checkpoint alone.
+    if resume:
+        try:
+            results = checkpoint.load()
+        except (KeyError, ValueError, OSError) as e:
+            logger.error("Cannot resume from {}: {}".format(checkpoint.filename, str(e)))
+            sys.exit(1)
+        logger.info("Resuming after the {} commands played before".format(len(results)))
+        player.resume(results)
+    if kwargs.get("dryrun"):
+        player.play_trace(**kwargs)
+        return
+    try:
+        with checkpoint:
+            checkpoint.start(player._resumed)
+            player.checkpoint = checkpoint
+            player.play_trace(**kwargs)
+    except OSError as e:
+        logger.error("Failed to write the checkpoint {}: {}".format(checkpoint.filename, str(e)))
+        sys.exit(1)
+
+
+def _split_list(arg):
+    return [x.strip() for x in arg.split(",") if x.strip()]
 
 
 def opt_parser(args=None):
@@ -317,7 +1034,53 @@ def opt_parser(args=None):
     parser.add_argument("-p", "--param", nargs=2, metavar=("NAME", "VALUE"), type=str, help="Override parameter NAME with VALUE", action="append", dest="params")
     parser.add_argument("--profile", metavar="PROFILE", type=str, help="AWS profile to run trace under", dest="profile")
     parser.add_argument("--region", metavar="REGION", type=str, help="AWS region to run trace in", dest="region")
-    parser.add_argument("-s", type=int, metavar="N", dest="sleep_delay", default=None, help="Force N seconds of sleep delay between commands")
+    parser.add_argument("--profiles", metavar="LIST", type=_split_list, dest="profiles",
+                        help="Comma separated AWS profiles to run the trace under concurrently")
+    parser.add_argument("--regions", metavar="LIST", type=_split_list, dest="regions",
+                        help="Comma separated AWS regions to run the trace in concurrently")
+    parser.add_argument("--plan", metavar="FILE", type=str, dest="plan",
+                        help="Use the connections in a plan file made by awstrace-compile if it was made for this trace file")
+    parser.add_argument("-q", "--quiet", action="store_true", dest="quiet",
+                        help="Don't show the output of the commands played")
+    parser.add_argument("--output-dir", metavar="DIR", type=str, dest="output_dir",
+                        help="Write the output of every command played to a separate file in DIR")
+    parser.add_argument("--bounded-pages", action="store_true", dest="bounded_pages",
+                        help="Stop fetching the pages of paginated calls once the outputs used later on have been found (requires --direct)")
+    parser.add_argument("--cache", action="store_true", dest="cache",
+                        help="Reuse the results of read-only calls made before with the same parameters")
+    parser.add_argument("--cache-ttl", metavar="SECS", type=float, default=CACHE_TTL, dest="cache_ttl",
+                        help="Reuse cached results for at most SECS seconds (default: %(default)s)")
+    parser.add_argument("--cache-size", metavar="N", type=int, default=CACHE_SIZE, dest="cache_size",
+                        help="Keep at most N cached results (default: %(default)s)")
+    parser.add_argument("--throttle", action="store_true", dest="throttle",
+                        help="Slow down the calls to services that throttle them and retry the throttled calls")
+    parser.add_argument("--max-rate", metavar="N", type=float, dest="max_rate",
+                        help="Make at most N calls per second to every service, implies --throttle")
+    parser.add_argument("--throttle-retries", metavar="N", type=int, default=THROTTLE_RETRIES, dest="throttle_retries",
+                        help="Retry throttled calls at most N times (default: %(default)s)")
+    parser.add_argument("--checkpoint", metavar="FILE", type=str, dest="checkpoint",
+                        help="Keep track of the commands played successfully and their results in FILE")
+    parser.add_argument("--resume", action="store_true", dest="resume",
+                        help="Skip the commands played successfully according to the checkpoint and reuse their results")
+    parser.add_argument("--sweep", metavar="FILE", type=str, dest="sweep",
+                        help="Play the trace once for every set of overridden parameters in a CSV or JSON lines FILE")
+    parser.add_argument("--target-jobs", type=int, metavar="N", dest="target_jobs", default=None,
+                        help="Play the trace for up to N profiles, regions and sweep sets at the same time (default: {})".format(TARGET_JOBS))
+    parser.add_argument("-j", "--jobs", type=int, metavar="N", dest="jobs", default=1, help="Play up to N independent commands concurrently")
+    parser.add_argument("--no-session-reuse", action="store_false", dest="reuse_session", help="Create a new AWS CLI session for every command")
+    parser.add_argument("--direct", action="store_true", dest="direct",
+                        help="Call the AWS APIs directly with the recorded parameters instead of running the AWS CLI commands")
+    parser.add_argument("--drop-unused-outputs", action="store_true", dest="drop_unused_outputs",
+                        help="Free the recorded outputs no other command depends on before playing the trace")
+    parser.add_argument("-s", type=float, metavar="N", dest="sleep_delay", default=None, help="Force N seconds of sleep delay between commands")
+    parser.add_argument("--speed", type=float, metavar="F", dest="speed", default=1.0,
+                        help="Replay the recorded delays between commands F times as fast, 0 to not wait at all (default: 1)")
+    parser.add_argument("--max-gap", type=float, metavar="N", dest="max_gap", default=None,
+                        help="Never wait more than N seconds between commands")
+    parser.add_argument("--poll", type=float, metavar="N", dest="poll_timeout", default=None,
+                        help="Don't wait between commands but retry commands depending on earlier ones for up to N seconds until they succeed")
+    parser.add_argument("--wait-for-resources", type=float, metavar="N", dest="wait_timeout", default=None,
+                        help="Don't wait between commands but wait for up to N seconds for resources created by earlier commands to be ready")
     parser.add_argument("-c", action="store_false", dest="colorize", help="Turn off colorized output")
     parser.add_argument("-d", action="store_true", dest="debug", help="Turn on debug output")
     parser.add_argument("-f", action="store_false", dest="stop_on_error", help="Continue running even if one or more commands fail")
@@ -328,6 +1091,58 @@ def opt_parser(args=None):
         sys.stderr.write("sleep delay cannot be negative\n")
         sys.stderr.flush()
         sys.exit(1)
+    if ns.profile and ns.profiles or ns.region and ns.regions:
+        sys.stderr.write("cannot combine --profile with --profiles or --region with --regions\n")
+        sys.stderr.flush()
+        sys.exit(1)
+    if ns.resume and not ns.checkpoint:
+        sys.stderr.write("cannot resume without a checkpoint\n")
+        sys.stderr.flush()
+        sys.exit(1)
+    if ns.checkpoint and (ns.sweep or ns.profiles or ns.regions):
+        sys.stderr.write("cannot combine --checkpoint with --sweep, --profiles or --regions\n")
+        sys.stderr.flush()
+        sys.exit(1)
+    if ns.bounded_pages and not ns.direct:
+        sys.stderr.write("cannot bound the pages fetched without --direct\n")
+        sys.stderr.flush()
+        sys.exit(1)
+    if ns.plan and ns.sweep:
+        sys.stderr.write("cannot combine --plan with --sweep\n")
+        sys.stderr.flush()
+        sys.exit(1)
+    if ns.target_jobs is not None and ns.target_jobs < 1:
+        sys.stderr.write("number of target jobs should be at least 1\n")
+        sys.stderr.flush()
+        sys.exit(1)
+    if ns.jobs < 1:
+        sys.stderr.write("number of jobs should be at least 1\n")
+        sys.stderr.flush()
+        sys.exit(1)
+    if ns.speed < 0:
+        sys.stderr.write("speed cannot be negative\n")
+        sys.stderr.flush()
+        sys.exit(1)
+    if ns.max_gap is not None and ns.max_gap < 0:
+        sys.stderr.write("maximum gap cannot be negative\n")
+        sys.stderr.flush()
+        sys.exit(1)
+    if ns.poll_timeout is not None and ns.poll_timeout <= 0:
+        sys.stderr.write("poll timeout should be positive\n")
+        sys.stderr.flush()
+        sys.exit(1)
+    if ns.wait_timeout is not None and ns.wait_timeout <= 0:
+        sys.stderr.write("resource wait timeout should be positive\n")
+        sys.stderr.flush()
+        sys.exit(1)
+    if (ns.max_rate is not None and ns.max_rate <= 0) or ns.throttle_retries < 0:
+        sys.stderr.write("maximum rate should be positive and throttle retries cannot be negative\n")
+        sys.stderr.flush()
+        sys.exit(1)
+    if ns.cache_ttl <= 0 or ns.cache_size < 1:
+        sys.stderr.write("cache TTL and size should be positive\n")
+        sys.stderr.flush()
+        sys.exit(1)
     return ns
 
 
@@ -347,23 +1162,100 @@ def main():
         logger.debug("Turning off sleep delay automatically as we are doing a dryrun")
         ns.sleep_delay = 0
 
-    try:
-        with open(ns.trace_file, "rb") as fd:
-            with TracePlayer(
-                    input_fd=fd,
-                    input_args=input_args,
-                    prompt_color=ns.colorize,
-                    profile=ns.profile,
-                    endpoint=ns.endpoint,
-                    region=ns.region) as player:
-
-                player.find_connections()
-                player.prune_connections()
-
-                player.play_trace(dryrun=ns.dryrun, stop_on_error=ns.stop_on_error, sleep_delay=ns.sleep_delay)
-    except OSError:
-        logger.error("Failed to open {}".format(ns.trace_file))
-        sys.exit(1)
+    sweep = None
+    if ns.sweep:
+        try:
+            sweep = read_sweep_file(ns.sweep)
+        except OSError:
+            logger.error("Failed to open {}".format(ns.sweep))
+            sys.exit(1)
+        except ValueError as e:
+            logger.error("Failed to read {}: {}".format(ns.sweep, str(e)))
+            sys.exit(1)
+        if not sweep:
+            logger.error("No parameters to sweep found in {}".format(ns.sweep))
+            sys.exit(1)
+
+    plan = None
+    if ns.plan:
+        try:
+            with open(ns.plan, "rb") as fd:
+                plan = read_plan(fd)
+        except OSError:
+            logger.error("Failed to open {}".format(ns.plan))
+            sys.exit(1)
+        except ValueError as e:
+            logger.error("Failed to read {}: {}".format(ns.plan, str(e)))
+            sys.exit(1)
+
+    output_writer = None
+    if ns.output_dir:
+        try:
+            output_writer = OutputWriter(ns.output_dir)
+        except OSError as e:
+            logger.error("Failed to create {}: {}".format(ns.output_dir, str(e)))
+            sys.exit(1)
+
+    with contextlib.ExitStack() as stack:
+        # only errors opening and loading the trace file are reported as such,
+        # writing the checkpoint and the outputs report their own errors
+        try:
+            fd = stack.enter_context(open(ns.trace_file, "rb"))
+            trace_hash = hash_trace_file(fd) if plan is not None or ns.checkpoint else None
+            if plan is not None and not plan_matches(plan, trace_hash, input_args):
+                logger.warning("The plan {} wasn't made for this trace file or these parameters so finding the connections again".format(ns.plan))
+                plan = None
+            player = stack.enter_context(TracePlayer(
+                input_fd=fd,
+                input_args=input_args,
+                prompt_color=ns.colorize,
+                profile=ns.profile,
+                endpoint=ns.endpoint,
+                region=ns.region,
+                reuse_session=ns.reuse_session,
+                direct=ns.direct))
+        except OSError:
+            logger.error("Failed to open {}".format(ns.trace_file))
+            sys.exit(1)
+
+        player.quiet = ns.quiet
+        player.bounded_pages = ns.bounded_pages
+        player.output_writer = output_writer
+        if ns.cache:
+            player.cache = ResultCache(ns.cache_ttl, ns.cache_size)
+        if ns.throttle or ns.max_rate:
+            player.rate_limiter = RateLimiter(ns.max_rate)
+            player.throttle_retries = ns.throttle_retries
+
+        play_args = dict(dryrun=ns.dryrun, stop_on_error=ns.stop_on_error, sleep_delay=ns.sleep_delay, jobs=ns.jobs,
+                         speed=ns.speed, max_gap=ns.max_gap, poll_timeout=ns.poll_timeout, wait_timeout=ns.wait_timeout)
+        targets = list(itertools.product(ns.profiles or [ns.profile], ns.regions or [ns.region]))
+        if sweep is not None:
+            results = play_sweep(player, sweep, targets, ns.target_jobs, ns.drop_unused_outputs, **play_args)
+            print_play_results(results)
+            if not all(r.ok for r in results):
+                sys.exit(1)
+            return
+
+        if plan is not None:
+            apply_plan(player, plan)
+        else:
+            player.find_connections()
+            player.prune_connections()
+        if ns.drop_unused_outputs:
+            player.drop_unused_outputs()
+
+        if ns.checkpoint:
+            play_checkpointed(player, Checkpoint(ns.checkpoint, trace_hash, input_args), ns.resume, **play_args)
+            return
+        if not ns.profiles and not ns.regions:
+            player.play_trace(**play_args)
+            return
+
+        results = play_targets(player, targets, ns.target_jobs, **play_args)
+        print_play_results(results)
+        if not all(r.ok for r in results):
+            sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,115 @@
+import collections
+import threading
+import time
+
+# error codes AWS services use for throttled calls, as retried by botocore
+THROTTLING_CODES = frozenset((
+    "Throttling", "ThrottlingException", "ThrottledException", "RequestThrottledException", "TooManyRequestsException",
+    "ProvisionedThroughputExceededException", "TransactionInProgressException", "RequestLimitExceeded",
+    "BandwidthLimitExceeded", "LimitExceededException", "RequestThrottled", "SlowDown", "PriorRequestNotComplete",
+    "EC2ThrottledException",
+))
+
+# the rate is halved when throttled and then goes up by one call per second
+# every second again, but never below the minimum rate
+MIN_RATE = 0.5
+RATE_DECREASE = 0.5
+RATE_INCREASE = 1.0
+
+# how many seconds of calls the rate is measured over before the first time
+# a service gets throttled
+RATE_WINDOW = 2.0
+
+
+def is_throttling(error_code):
+    return error_code in THROTTLING_CODES
+
+
+class TokenBucket:
+    # Limits the rate of the calls to a single service. Until the service
+    # throttles a call there is no limit, unless there is a maximum rate. Every
+    # throttled call then halves the rate, starting from the rate measured
+    # before, and every successful call makes it go up a bit again.
+    def __init__(self, max_rate=None):
+        self.max_rate = max_rate
+        self.rate = max_rate
+        self.calls = 0
+        self.throttled = 0
+        self._tokens = max(1.0, max_rate or 0)
+        self._last = None
+        self._first_call = None
+        self._last_call = None
+        self._last_decrease = None
+        self._recent = collections.deque()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            self.calls += 1
+            if self._first_call is None:
+                self._first_call = now
+            self._last_call = now
+            self._recent.append(now)
+            while self._recent[0] < now - RATE_WINDOW:
+                self._recent.popleft()
+            if self.rate is None:
+                return
+            if self._last is not None:
+                self._tokens = min(max(1.0, self.rate), self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            # the token is taken right away, also when it still has to be
+            # waited for, so concurrent calls queue up behind each other
+            self._tokens -= 1
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0
+        if delay > 0:
+            time.sleep(delay)
+
+    def succeeded(self):
+        with self._lock:
+            if self.rate is not None:
+                self.rate = min(self.max_rate or float("inf"), self.rate + RATE_INCREASE / self.rate)
+
+    def was_throttled(self):
+        with self._lock:
+            self.throttled += 1
+            now = time.monotonic()
+            # concurrent calls throttled at the same time only count once
+            if self._last_decrease is not None and self.rate is not None and now - self._last_decrease < 1 / self.rate:
+                return
+            self._last_decrease = now
+            rate = self.rate if self.rate is not None else len(self._recent) / RATE_WINDOW
+            self.rate = max(MIN_RATE, rate * RATE_DECREASE)
+            self._tokens = min(self._tokens, 0)
+            self._last = now
+
+    def get_achieved_rate(self):
+        with self._lock:
+            if self._first_call is None:
+                return 0.0
+            elapsed = self._last_call - self._first_call
+            return self.calls / elapsed if elapsed > 0 else float(self.calls)
+
+
+class RateLimiter:
+    # Keeps a token bucket for every service under every profile and in every
+    # region, as that is what AWS throttles calls by, so that the players of
+    # several targets and sweeps can share it.
+    def __init__(self, max_rate=None):
+        self.max_rate = max_rate
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def get_bucket(self, service_id, profile=None, region=None):
+        key = (service_id, profile, region)
+        with self._lock:
+            if key not in self._buckets:
+                self._buckets[key] = TokenBucket(self.max_rate)
+            return self._buckets[key]
+
+    def get_summary(self):
+        # returns the calls made, the achieved rate and the number of
+        # throttled calls for every service, profile and region
+        with self._lock:
+            buckets = sorted(self._buckets.items(), key=lambda kv: tuple(str(k) for k in kv[0]))
+        return [(key, b.calls, b.get_achieved_rate(), b.throttled) for key, b in buckets]
@@ -2,33 +2,59 @@ import argparse
 import os
 import readline
 import shlex
+import sys
 
+from .tracefile import (COMPRESSIONS, FORMAT_JSON, FORMATS, TraceWriter, guess_compression, guess_format,
+                        open_trace_file, write_traces)
 from .tracer import TraceRunner
-from .utils import json_dumps, process_file_argument
+from .utils import process_file_argument
 
 
 class TraceRecorder(TraceRunner):
-    def __init__(self, filename, prompt_on_save=True):
-        super().__init__()
+    def __init__(self, filename, prompt_on_save=True, reuse_session=True, trace_format=None, flush_every=1, fsync=False, compression=None,
+                 append=False):
+        super().__init__(reuse_session=reuse_session)
         if filename is None:
             raise ValueError("need a filename to save to")
         self._filename = filename
         self.traces = []
         self.prompt_on_save = prompt_on_save
+        self.trace_format = trace_format if trace_format else guess_format(filename)
+        if self.trace_format not in FORMATS:
+            raise ValueError("unknown trace format {}".format(self.trace_format))
+        self.compression = compression if compression else guess_compression(filename)
+        if self.compression not in COMPRESSIONS:
+            raise ValueError("unknown compression {}".format(self.compression))
+
+        # JSON lines and msgpack trace files are appended to as soon as a
+        # trace is added instead of holding on to all of them until the
+        # recording is done. Like JSON trace files they replace an existing
+        # trace file, unless the new recording is added to it instead.
+        self._writer = None
+        if self.trace_format != FORMAT_JSON:
+            self._writer = TraceWriter(filename, flush_every=flush_every, fsync=fsync,
+                                       trace_format=self.trace_format, compression=self.compression, append=append)
+        elif append:
+            raise ValueError("can only append to jsonl or msgpack trace files")
 
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
+        if self._writer:
+            self._writer.close()
+            return
         if self.prompt_on_save:
             if not confirm_prompt("Save cached trace to {}?".format(self._filename)):
                 return
-        with open(self._filename, "wb") as fd:
-            data = []
-            for trace in self.traces:
-                data.append(trace.to_dict())
-            data = json_dumps(data, pretty=True)
-            fd.write(data.encode("utf-8"))
+        with open_trace_file(self._filename, "wb", self.compression) as fd:
+            write_traces(fd, [trace.to_dict() for trace in self.traces])
+
+    def add_trace(self, trace):
+        if self._writer:
+            self._writer.write(trace.to_dict())
+        else:
+            self.traces.append(trace)
 
     def process_file_arguments(self, args):
         ret = []
@@ -41,17 +67,26 @@ class TraceRecorder(TraceRunner):
         return ret
 
     def run_aws_cmd(self, args):
+        command = list(args)
         args = self.process_file_arguments(args)
         if not args:
             return
-        trace = super().run_aws_cmd(args)
-        if not trace:
+        traces = self.run_aws_cmd_traces(args)
+        if not traces:
             return
+        # the calls of a command making several of them, e.g. aws s3 sync, are
+        # stored as a group together with the command itself so the player
+        # can run that command again
+        if len(traces) > 1:
+            for trace in traces:
+                trace.group = traces[0].request_id
+                trace.command = command
         save = True
         if self.prompt_on_save:
             save = confirm_prompt("Add command to trace cache?")
         if save:
-            self.traces.append(trace)
+            for trace in traces:
+                self.add_trace(trace)
 
 
 def confirm_prompt(prompt):
@@ -120,16 +155,38 @@ def opt_parser(args=None):
     parser.add_argument("-d", action="store_false", dest="prompt_on_misc", help="Do not ask for confirmation for shell execute")
     parser.add_argument("-n", action="store_false", dest="prompt_on_save", help="Do not prompt when adding to/saving trace files")
     parser.add_argument("-s", action="store_true", dest="enable_misc_cmd", help="Enable execution of all shell commands")
+    parser.add_argument("--no-session-reuse", action="store_false", dest="reuse_session", help="Create a new AWS CLI session for every command")
+    parser.add_argument("--format", choices=FORMATS, dest="trace_format", default=None, help="Trace file format, jsonl and msgpack append every added command to the trace file immediately (default: based on the file extension)")
+    parser.add_argument("--compress", choices=COMPRESSIONS, dest="compression", default=None, help="Trace file compression (default: based on the file extension)")
+    parser.add_argument("--flush", type=int, metavar="N", dest="flush_every", default=1, help="Flush a jsonl or msgpack trace file after every N added commands")
+    parser.add_argument("--fsync", action="store_true", dest="fsync", help="Sync a jsonl or msgpack trace file to disk when flushing it")
+    parser.add_argument("--append", action="store_true", dest="append", help="Add the commands to an existing jsonl or msgpack trace file instead of replacing it")
     group = parser.add_argument_group("required arguments")
     group.add_argument("--trace-file", metavar="FILE", type=str, required=True, help="output trace file", dest="trace_file")
     ns = parser.parse_args() if not args else parser.parse_args(args)
+    if ns.flush_every < 1:
+        sys.stderr.write("need to flush after at least one command\n")
+        sys.stderr.flush()
+        sys.exit(1)
     return ns
 
 
 def main():
     ns = opt_parser()
 
-    with TraceRecorder(ns.trace_file, ns.prompt_on_save) as recorder:
+    try:
+        recorder = TraceRecorder(ns.trace_file, ns.prompt_on_save, ns.reuse_session,
+                                 trace_format=ns.trace_format,
+                                 flush_every=ns.flush_every,
+                                 fsync=ns.fsync,
+                                 compression=ns.compression,
+                                 append=ns.append)
+    except ValueError as e:
+        sys.stderr.write("Cannot record to {}: {}\n".format(ns.trace_file, str(e)))
+        sys.stderr.flush()
+        sys.exit(1)
+
+    with recorder:
         run(recorder,
             prompt_color=ns.prompt_color,
             prompt_on_misc=ns.prompt_on_misc,
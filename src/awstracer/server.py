@@ -0,0 +1,506 @@
+import argparse
+import base64
+import calendar
+import datetime
+import email.utils
+import json
+import logging
+import re
+import socketserver
+import sys
+import threading
+import time
+import urllib.parse
+import xml.etree.ElementTree as ET
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import botocore.session
+
+from .tracefile import read_traces
+from .tracer import Trace, get_service_name
+from .utils import setup_logging
+
+logger = logging.getLogger("server")
+
+# protocols for which the recorded outputs can be rendered as responses
+PROTOCOLS = ("json", "rest-json", "query", "ec2", "rest-xml")
+
+_CREDENTIAL_SCOPE = re.compile(r"Credential=[^/,]+/[^/,]+/[^/,]+/([^/,]+)/aws4_request")
+
+
+def _epoch(value):
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is None:
+            return calendar.timegm(value.timetuple()) + value.microsecond / 1e6
+        return value.timestamp()
+    if isinstance(value, datetime.date):
+        return calendar.timegm(value.timetuple())
+    return value
+
+
+def _isoformat(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return str(value)
+
+
+def _blob(value):
+    if type(value) == str:
+        value = value.encode("utf-8")
+    return base64.b64encode(value).decode("ascii")
+
+
+def _scalar_text(shape, value):
+    if shape.type_name == "boolean":
+        return "true" if value else "false"
+    if shape.type_name == "timestamp":
+        return _isoformat(value)
+    if shape.type_name == "blob":
+        return _blob(value)
+    return str(value)
+
+
+def _json_value(shape, value):
+    # Renders a recorded value the way the JSON based protocols encode the
+    # given shape. Values that don't fit the shape are passed on as they are.
+    if shape is None or value is None:
+        return value
+    type_name = shape.type_name
+    if type_name == "structure" and type(value) == dict:
+        ret = {}
+        for name, member in shape.members.items():
+            if name in value and "location" not in member.serialization:
+                ret[member.serialization.get("name", name)] = _json_value(member, value[name])
+        return ret
+    if type_name == "list" and type(value) == list:
+        return [_json_value(shape.member, v) for v in value]
+    if type_name == "map" and type(value) == dict:
+        return {k: _json_value(shape.value, v) for k, v in value.items()}
+    if type_name == "timestamp":
+        return _epoch(value)
+    if type_name == "blob":
+        return _blob(value)
+    return value
+
+
+def _xml_member_name(name, shape):
+    # same rules as used by the botocore parsers to find a member
+    if shape.type_name == "list" and shape.serialization.get("flattened"):
+        list_member_name = shape.member.serialization.get("name")
+        if list_member_name is not None:
+            return list_member_name
+    return shape.serialization.get("name", name)
+
+
+def _xml_value(parent, tag, shape, value):
+    # Renders a recorded value as the XML element(s) the XML based protocols
+    # encode the given shape as.
+    if value is None:
+        return
+    type_name = shape.type_name
+    if type_name == "structure" and type(value) == dict:
+        el = ET.SubElement(parent, tag)
+        _xml_members(el, shape, value)
+    elif type_name == "list" and type(value) == list:
+        if shape.serialization.get("flattened"):
+            for v in value:
+                _xml_value(parent, tag, shape.member, v)
+        else:
+            el = ET.SubElement(parent, tag)
+            member_tag = shape.member.serialization.get("name", "member")
+            for v in value:
+                _xml_value(el, member_tag, shape.member, v)
+    elif type_name == "map" and type(value) == dict:
+        key_tag = shape.key.serialization.get("name", "key")
+        value_tag = shape.value.serialization.get("name", "value")
+        if shape.serialization.get("flattened"):
+            entries = [ET.SubElement(parent, tag) for _ in value]
+        else:
+            el = ET.SubElement(parent, tag)
+            entries = [ET.SubElement(el, "entry") for _ in value]
+        for entry, (k, v) in zip(entries, value.items()):
+            _xml_value(entry, key_tag, shape.key, k)
+            _xml_value(entry, value_tag, shape.value, v)
+    else:
+        ET.SubElement(parent, tag).text = _scalar_text(shape, value)
+
+
+def _xml_members(el, shape, value):
+    for name, member in shape.members.items():
+        if name in value and "location" not in member.serialization:
+            _xml_value(el, _xml_member_name(name, member), member, value[name])
+
+
+def _xml_bytes(root):
+    return b'<?xml version="1.0" encoding="UTF-8"?>\n' + ET.tostring(root, encoding="utf-8")
+
+
+class _RestRoute:
+    # Matches requests against the HTTP method and request URI template of an
+    # operation of a REST service, e.g. GET /{Bucket}?tagging
+    def __init__(self, operation_model):
+        self.operation_model = operation_model
+        self.method = operation_model.http.get("method", "POST")
+        path, _, query = operation_model.http.get("requestUri", "/").partition("?")
+        pattern = []
+        literal = 0
+        for part in re.split(r"(\{[^}]+\})", path):
+            if part.startswith("{") and part.endswith("+}"):
+                pattern.append(".+")
+            elif part.startswith("{"):
+                pattern.append("[^/]+")
+            else:
+                pattern.append(re.escape(part))
+                literal += len(part)
+        self._path = re.compile("^{}$".format("".join(pattern)))
+        self._query = urllib.parse.parse_qs(query, keep_blank_values=True)
+        # required query string parameters tell apart operations with the same
+        # template, e.g. DELETE /{Bucket}/{Key+}?uploadId for aborting uploads
+        self._required = []
+        shape = operation_model.input_shape
+        if shape is not None:
+            for name in shape.required_members:
+                member = shape.members[name]
+                if member.serialization.get("location") == "querystring":
+                    self._required.append(member.serialization.get("name", name))
+        # prefer the most specific template when several of them match
+        self.specificity = (len(self._query) + len(self._required), literal)
+
+    def matches(self, method, path, query):
+        if method != self.method or not self._path.match(path):
+            return False
+        for name, values in self._query.items():
+            if name not in query:
+                return False
+            if values != [""] and query[name] != values:
+                return False
+        return all(name in query for name in self._required)
+
+
+class _Service:
+    def __init__(self, service_model):
+        self.model = service_model
+        self.protocol = service_model.protocol
+        self.target_prefix = service_model.metadata.get("targetPrefix")
+        self._routes = None
+
+    def find_operation(self, method, path, query, headers, body):
+        if self.protocol == "json":
+            target = headers.get("X-Amz-Target", "")
+            prefix, _, name = target.rpartition(".")
+            if prefix != self.target_prefix:
+                return None
+            return name if name in self.model.operation_names else None
+        if self.protocol in ("query", "ec2"):
+            params = urllib.parse.parse_qs(body.decode("utf-8"))
+            params.update(query)
+            name = params.get("Action", [None])[0]
+            return name if name in self.model.operation_names else None
+        if self._routes is None:
+            routes = [_RestRoute(self.model.operation_model(name)) for name in self.model.operation_names]
+            self._routes = sorted(routes, key=lambda r: r.specificity, reverse=True)
+        for route in self._routes:
+            if route.matches(method, path, query):
+                return route.operation_model.name
+        return None
+
+
+class TraceServer:
+    # A local HTTP server standing in for the AWS endpoints which answers
+    # every request with the output recorded in a trace for the called
+    # operation, rendered according to the protocol of the service. When an
+    # operation got recorded several times its recorded outputs are returned
+    # in turn, starting over again once they ran out.
+    def __init__(self, traces, host="127.0.0.1", port=0, latencies={}, default_latency=0):
+        self._session = botocore.session.get_session()
+        self._responses = {}
+        self._cursors = {}
+        self._lock = threading.Lock()
+        self._services = {}
+        self.latencies = latencies
+        self.default_latency = default_latency
+        for trace in traces:
+            self._responses.setdefault(trace.fn_name, []).append(trace)
+            self._add_service(trace.fn_name.split(".")[0])
+        self._httpd = _ThreadingHTTPServer((host, port), _RequestHandler)
+        self._httpd.trace_server = self
+        self._thread = None
+
+    def _add_service(self, service_id):
+        if any(s.model.service_id.hyphenize() == service_id for ss in self._services.values() for s in ss):
+            return
+        try:
+            model = self._session.get_service_model(get_service_name(self._session, service_id))
+        except ValueError:
+            logger.warning("Unknown service {} so its traces can't be served".format(service_id))
+            return
+        if model.protocol not in PROTOCOLS:
+            logger.warning("Can't serve the traces for {} as the {} protocol isn't supported".format(service_id, model.protocol))
+            return
+        self._services.setdefault(model.signing_name, []).append(_Service(model))
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+    def serve_forever(self):
+        self._httpd.serve_forever()
+
+    def shutdown(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def find_service(self, method, path, query, headers, body):
+        # The service is taken from the credential scope of the signature and
+        # the operation from the request as the protocol of the service
+        # defines it. Unsigned requests are matched against every service.
+        m = _CREDENTIAL_SCOPE.search(headers.get("Authorization", ""))
+        services = self._services.get(m.group(1), []) if m else [s for ss in self._services.values() for s in ss]
+        for service in services:
+            name = service.find_operation(method, path, query, headers, body)
+            if name is not None:
+                return service, name
+        return (services[0] if len(services) == 1 else None), None
+
+    def next_response(self, fn_name):
+        with self._lock:
+            traces = self._responses.get(fn_name)
+            if not traces:
+                return None
+            i = self._cursors.get(fn_name, 0)
+            self._cursors[fn_name] = (i + 1) % len(traces)
+            return traces[i]
+
+    def get_latency(self, fn_name):
+        return self.latencies.get(fn_name, self.default_latency)
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # clients like the AWS CLI drop the connections they kept open once
+        # they are done, which is nothing worth a traceback
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # the headers and body are written separately so don't wait for the
+    # acknowledgement of the headers before sending the body
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        self._handle()
+
+    def do_PUT(self):
+        self._handle()
+
+    def do_DELETE(self):
+        self._handle()
+
+    def do_HEAD(self):
+        self._handle()
+
+    def do_PATCH(self):
+        self._handle()
+
+    def log_message(self, fmt, *args):
+        return
+
+    def _handle(self):
+        server = self.server.trace_server
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length) if length else b""
+        url = urllib.parse.urlsplit(self.path)
+        query = urllib.parse.parse_qs(url.query, keep_blank_values=True)
+        service, name = server.find_service(self.command, url.path, query, self.headers, body)
+        if service is None:
+            self._send(400, {"Content-Type": "text/plain"}, b"unknown service or operation")
+            logger.warning("No service found for {} {}".format(self.command, self.path))
+            return
+
+        fn_name = "{}.{}".format(service.model.service_id.hyphenize(), name)
+        latency = server.get_latency(fn_name)
+        if latency > 0:
+            time.sleep(latency)
+
+        trace = server.next_response(fn_name) if name is not None else None
+        if trace is None:
+            logger.warning("No recorded response for {}".format(fn_name if name else self.path))
+            self._send_error(service, name, "NoRecordedResponse", "no recorded response for {}".format(fn_name))
+            return
+        logger.debug("Serving recorded response {} for {}".format(trace.request_id, fn_name))
+        self._send_response(service, service.model.operation_model(name), trace)
+
+    def _send(self, status, headers, body):
+        self.send_response(status)
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _send_response(self, service, operation_model, trace):
+        shape = operation_model.output_shape
+        outparams = trace.outparams
+        request_id = trace.request_id
+        headers = {"x-amzn-RequestId": request_id, "x-amz-request-id": request_id}
+        status = operation_model.http.get("responseCode", 200)
+        protocol = service.protocol
+
+        if protocol == "json":
+            headers["Content-Type"] = "application/x-amz-json-{}".format(service.model.metadata.get("jsonVersion", "1.0"))
+            body = json.dumps(_json_value(shape, outparams)).encode("utf-8")
+        elif protocol in ("query", "ec2"):
+            headers["Content-Type"] = "text/xml"
+            root = ET.Element("{}Response".format(operation_model.name))
+            if protocol == "ec2":
+                ET.SubElement(root, "requestId").text = request_id
+            if shape is not None:
+                wrapper = shape.serialization.get("resultWrapper")
+                _xml_members(ET.SubElement(root, wrapper) if wrapper else root, shape, outparams)
+            if protocol == "query":
+                metadata = ET.SubElement(root, "ResponseMetadata")
+                ET.SubElement(metadata, "RequestId").text = request_id
+            body = _xml_bytes(root)
+        else:
+            body = b""
+            payload = shape.serialization.get("payload") if shape is not None else None
+            if shape is not None:
+                for name, member in shape.members.items():
+                    location = member.serialization.get("location")
+                    if name not in outparams or outparams[name] is None:
+                        continue
+                    val = outparams[name]
+                    if location == "statusCode":
+                        status = int(val)
+                    elif location == "header":
+                        if member.type_name == "timestamp" and isinstance(val, datetime.datetime):
+                            val = email.utils.format_datetime(val.astimezone(datetime.timezone.utc), usegmt=True)
+                        elif member.type_name == "boolean":
+                            val = "true" if val else "false"
+                        headers[member.serialization.get("name", name)] = str(val)
+                    elif location == "headers":
+                        for k, v in val.items():
+                            headers["{}{}".format(member.serialization.get("name", ""), k)] = str(v)
+            if payload is not None:
+                member = shape.members[payload]
+                val = outparams.get(payload)
+                if val is None:
+                    pass
+                elif member.type_name in ("blob", "string"):
+                    body = val.encode("utf-8") if type(val) == str else bytes(val)
+                elif protocol == "rest-json":
+                    headers["Content-Type"] = "application/json"
+                    body = json.dumps(_json_value(member, val)).encode("utf-8")
+                else:
+                    headers["Content-Type"] = "text/xml"
+                    root = ET.Element(member.serialization.get("name", payload))
+                    _xml_members(root, member, val)
+                    body = _xml_bytes(root)
+            elif shape is not None and protocol == "rest-json":
+                headers["Content-Type"] = "application/json"
+                body = json.dumps(_json_value(shape, outparams)).encode("utf-8")
+            elif shape is not None:
+                headers["Content-Type"] = "text/xml"
+                root = ET.Element(shape.serialization.get("name", shape.name))
+                _xml_members(root, shape, outparams)
+                body = _xml_bytes(root)
+        self._send(status, headers, body)
+
+    def _send_error(self, service, name, code, message):
+        request_id = "awstracer-no-response"
+        headers = {"x-amzn-RequestId": request_id, "x-amz-request-id": request_id}
+        protocol = service.protocol
+        if protocol in ("json", "rest-json"):
+            headers["Content-Type"] = "application/json"
+            headers["x-amzn-ErrorType"] = code
+            body = json.dumps({"__type": code, "message": message}).encode("utf-8")
+        else:
+            headers["Content-Type"] = "text/xml"
+            if protocol == "ec2":
+                root = ET.Element("Response")
+                error = ET.SubElement(ET.SubElement(root, "Errors"), "Error")
+                ET.SubElement(root, "RequestID").text = request_id
+            elif protocol == "query":
+                root = ET.Element("ErrorResponse")
+                error = ET.SubElement(root, "Error")
+                ET.SubElement(root, "RequestId").text = request_id
+            else:
+                root = error = ET.Element("Error")
+                ET.SubElement(root, "RequestId").text = request_id
+            ET.SubElement(error, "Code").text = code
+            ET.SubElement(error, "Message").text = message
+            body = _xml_bytes(root)
+        self._send(400, headers, body)
+
+
+def opt_parser(args=None):
+    parser = argparse.ArgumentParser(description="AWS CLI Trace Server")
+    parser.add_argument("--host", metavar="HOST", type=str, default="127.0.0.1", dest="host", help="Address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", metavar="PORT", type=int, default=8000, dest="port", help="Port to listen on (default: 8000)")
+    parser.add_argument("--latency", nargs=2, metavar=("FN_NAME", "SECONDS"), action="append", dest="latencies",
+                        help="Wait SECONDS before answering calls to FN_NAME, e.g. dynamodb.ListTables")
+    parser.add_argument("--default-latency", metavar="SECONDS", type=float, default=0, dest="default_latency",
+                        help="Wait SECONDS before answering any other call")
+    parser.add_argument("-c", action="store_false", dest="colorize", help="Turn off colorized output")
+    parser.add_argument("-d", action="store_true", dest="debug", help="Turn on debug output")
+    group = parser.add_argument_group("required arguments")
+    group.add_argument("--trace-file", metavar="FILE", type=str, required=True, help="trace file to serve", dest="trace_file")
+    ns = parser.parse_args() if not args else parser.parse_args(args)
+    latencies = {}
+    for fn_name, secs in ns.latencies or []:
+        try:
+            latencies[fn_name] = float(secs)
+        except ValueError:
+            latencies[fn_name] = -1
+        if latencies[fn_name] < 0:
+            sys.stderr.write("latency for {} should be a non-negative number of seconds\n".format(fn_name))
+            sys.stderr.flush()
+            sys.exit(1)
+    ns.latencies = latencies
+    if ns.default_latency < 0:
+        sys.stderr.write("default latency cannot be negative\n")
+        sys.stderr.flush()
+        sys.exit(1)
+    return ns
+
+
+def main():
+    ns = opt_parser()
+    setup_logging(logger, debug=ns.debug, colorize=ns.colorize)
+    try:
+        with open(ns.trace_file, "rb") as fd:
+            traces = [Trace.from_dict(t) for t in read_traces(fd)]
+    except OSError:
+        logger.error("Failed to open {}".format(ns.trace_file))
+        sys.exit(1)
+
+    server = TraceServer(traces, ns.host, ns.port, ns.latencies, ns.default_latency)
+    logger.info("Serving {} traces on {}".format(len(traces), server.url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
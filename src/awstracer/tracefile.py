@@ -0,0 +1,396 @@
+import bz2
+import gzip
+import io
+import logging
+import lzma
+import os
+import struct
+import zlib
+from datetime import date, datetime, timedelta, timezone
+
+from .utils import json_dumps, json_loads
+
+logger = logging.getLogger("tracefile")
+
+FORMAT_JSON = "json"
+FORMAT_JSONL = "jsonl"
+FORMAT_MSGPACK = "msgpack"
+FORMATS = (FORMAT_JSON, FORMAT_JSONL, FORMAT_MSGPACK)
+
+COMPRESSION_NONE = "none"
+COMPRESSION_GZIP = "gzip"
+COMPRESSION_BZ2 = "bz2"
+COMPRESSION_XZ = "xz"
+COMPRESSION_ZSTD = "zstd"
+COMPRESSIONS = (COMPRESSION_NONE, COMPRESSION_GZIP, COMPRESSION_BZ2, COMPRESSION_XZ, COMPRESSION_ZSTD)
+
+_COMPRESSION_EXTENSIONS = {
+    ".gz": COMPRESSION_GZIP,
+    ".bz2": COMPRESSION_BZ2,
+    ".xz": COMPRESSION_XZ,
+    ".zst": COMPRESSION_ZSTD,
+}
+
+_COMPRESSION_MAGIC = (
+    (b"\x1f\x8b", COMPRESSION_GZIP),
+    (b"BZh", COMPRESSION_BZ2),
+    (b"\xfd7zXZ\x00", COMPRESSION_XZ),
+    (b"\x28\xb5\x2f\xfd", COMPRESSION_ZSTD),
+)
+
+# msgpack extension type used for timestamps, see _msgpack_default()
+_MSGPACK_EXT_DATETIME = 1
+_MSGPACK_DATETIME = struct.Struct(">qIi")
+_MSGPACK_NAIVE = -0x80000000
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _import_msgpack():
+    try:
+        import msgpack
+    except ImportError:
+        raise ValueError("the msgpack trace format requires the msgpack package to be installed")
+    return msgpack
+
+
+def _import_zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError("zstd compression requires the zstandard package to be installed")
+    return zstandard
+
+
+def guess_compression(filename):
+    for ext, compression in _COMPRESSION_EXTENSIONS.items():
+        if filename.endswith(ext):
+            return compression
+    return COMPRESSION_NONE
+
+
+def guess_format(filename):
+    # the compression is a separate extension, e.g. trace.jsonl.gz
+    for ext in _COMPRESSION_EXTENSIONS:
+        if filename.endswith(ext):
+            filename = filename[:-len(ext)]
+            break
+    if filename.endswith(".jsonl"):
+        return FORMAT_JSONL
+    if filename.endswith((".msgpack", ".mpk")):
+        return FORMAT_MSGPACK
+    return FORMAT_JSON
+
+
+def _peek(fd, n):
+    if hasattr(fd, "peek"):
+        return fd.peek(n)[:n]
+    pos = fd.tell()
+    data = fd.read(n)
+    fd.seek(pos)
+    return data
+
+
+class _StreamDecompressor(io.RawIOBase):
+    # Decompresses a file made up of one or more gzip, bzip2 or xz streams as
+    # far as it can. A recording that got interrupted leaves its last stream
+    # without an end behind. The file objects of the standard library refuse
+    # to read such a stream altogether, this still returns whatever could be
+    # decompressed from it.
+    def __init__(self, fd, new_decompressor):
+        self._fd = fd
+        self._new_decompressor = new_decompressor
+        self._decompressor = new_decompressor()
+        self._data = memoryview(b"")
+        self._started = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._data:
+            data = b""
+            if self._decompressor.eof:
+                data = self._decompressor.unused_data
+                self._decompressor = self._new_decompressor()
+                self._started = False
+            if not data:
+                data = self._fd.read(io.DEFAULT_BUFFER_SIZE)
+            if not data:
+                if self._started:
+                    logger.warning("The compressed trace file ends halfway, it probably wasn't closed")
+                    self._started = False
+                return 0
+            self._started = True
+            self._data = memoryview(self._decompressor.decompress(data))
+        n = min(len(b), len(self._data))
+        b[:n] = self._data[:n]
+        self._data = self._data[n:]
+        return n
+
+
+def _decompress(fd, compression):
+    if compression == COMPRESSION_GZIP:
+        return io.BufferedReader(_StreamDecompressor(fd, lambda: zlib.decompressobj(16 + zlib.MAX_WBITS)))
+    if compression == COMPRESSION_BZ2:
+        return io.BufferedReader(_StreamDecompressor(fd, bz2.BZ2Decompressor))
+    if compression == COMPRESSION_XZ:
+        return io.BufferedReader(_StreamDecompressor(fd, lzma.LZMADecompressor))
+    if compression == COMPRESSION_ZSTD:
+        zstd = _import_zstd()
+        return io.BufferedReader(zstd.ZstdDecompressor().stream_reader(fd, read_across_frames=True))
+    return fd
+
+
+def _msgpack_default(obj):
+    # Timestamps are stored as the seconds and microseconds since the epoch of
+    # their wall clock time together with their UTC offset in seconds, which
+    # is a lot more compact and faster to decode than their ISO 8601 format.
+    if isinstance(obj, datetime):
+        offset = obj.utcoffset()
+        offset = _MSGPACK_NAIVE if offset is None else int(offset.total_seconds())
+        diff = obj.replace(tzinfo=None) - _EPOCH
+        data = _MSGPACK_DATETIME.pack(diff.days * 86400 + diff.seconds, diff.microseconds, offset)
+        return _import_msgpack().ExtType(_MSGPACK_EXT_DATETIME, data)
+    if isinstance(obj, date):
+        return _msgpack_default(datetime(obj.year, obj.month, obj.day))
+    raise TypeError("Type {} is not serializable".format(type(obj)))
+
+
+def _msgpack_ext_hook(code, data):
+    if code != _MSGPACK_EXT_DATETIME:
+        raise ValueError("unknown msgpack extension type {}".format(code))
+    secs, usecs, offset = _MSGPACK_DATETIME.unpack(data)
+    ret = _EPOCH + timedelta(seconds=secs, microseconds=usecs)
+    if offset != _MSGPACK_NAIVE:
+        ret = ret.replace(tzinfo=timezone.utc if offset == 0 else timezone(timedelta(seconds=offset)))
+    return ret
+
+
+def _json_loads_outparams(data):
+    return json_loads(data)["outparams"]
+
+
+def msgpack_dumps(obj):
+    return _import_msgpack().packb(obj, use_bin_type=True, default=_msgpack_default)
+
+
+def msgpack_loads(data):
+    return _import_msgpack().unpackb(data, raw=False, ext_hook=_msgpack_ext_hook)
+
+
+class LazyValue:
+    # A value which is kept encoded, e.g. as the raw bytes it was read as from
+    # a trace file, until it gets decoded. This takes a lot less memory than
+    # the decoded value when that consists of lots of small objects.
+    __slots__ = ("_data", "_decode")
+
+    def __init__(self, data, decode):
+        self._data = data
+        self._decode = decode
+
+    def decode(self):
+        return self._decode(self._data)
+
+
+def _msgpack_loads_lazy(data):
+    # Decodes a single trace except for its outputs, which are skipped over
+    # without building any objects and kept as the bytes they were packed as.
+    msgpack = _import_msgpack()
+    unpacker = msgpack.Unpacker(raw=False, ext_hook=_msgpack_ext_hook)
+    unpacker.feed(data)
+    try:
+        n = unpacker.read_map_header()
+    except ValueError:
+        return msgpack_loads(data)
+    trace = {}
+    for _ in range(n):
+        key = unpacker.unpack()
+        if key == "outparams":
+            start = unpacker.tell()
+            unpacker.skip()
+            trace[key] = LazyValue(data[start:unpacker.tell()], msgpack_loads)
+        else:
+            trace[key] = unpacker.unpack()
+    return trace
+
+
+def _msgpack_lazy_traces(fd):
+    # Splits a msgpack file into the bytes of its traces, by skipping over
+    # them, to decode these one by one without their outputs. A partial
+    # trace at the end of the file is ignored like the Unpacker does.
+    msgpack = _import_msgpack()
+    unpacker = msgpack.Unpacker(raw=False, ext_hook=_msgpack_ext_hook)
+    data = bytearray()
+    offset = 0
+    while True:
+        chunk = fd.read(io.DEFAULT_BUFFER_SIZE)
+        unpacker.feed(chunk)
+        data += chunk
+        start = offset
+        while True:
+            try:
+                unpacker.skip()
+            except msgpack.OutOfData:
+                break
+            end = unpacker.tell()
+            yield _msgpack_loads_lazy(bytes(data[start - offset:end - offset]))
+            start = end
+        del data[:start - offset]
+        offset = start
+        if not chunk:
+            return
+
+
+def read_traces(fd, lazy_outparams=False):
+    # Yields the trace dictionaries from a trace file without having to know
+    # its format up front. Compressed files are detected by their magic bytes
+    # and msgpack files by not starting with a JSON array or object. Files
+    # containing a single JSON array of traces are loaded in one go. JSON
+    # lines and msgpack files are decoded one trace at a time. The file object
+    # can be opened in either text or binary mode.
+    #
+    # With lazy_outparams the outputs of the traces in JSON lines and msgpack
+    # files are returned as a LazyValue instead. The outputs in msgpack files
+    # are skipped over and kept as the bytes they were packed as. JSON lines
+    # can't be decoded partially, so every line is still decoded completely
+    # once while loading and kept as is, after which its decoded outputs are
+    # dropped again. Accessing them decodes the line a second time. The
+    # outputs of all the traces in an array file are decoded in one go anyway
+    # so these are always returned decoded.
+    head = _peek(fd, 6)
+    if type(head) == bytes:
+        for magic, compression in _COMPRESSION_MAGIC:
+            if head.startswith(magic):
+                fd = _decompress(fd, compression)
+                head = _peek(fd, 1)
+                break
+        if head[:1] and head[:1] not in b"[{ \t\r\n":
+            if lazy_outparams:
+                yield from _msgpack_lazy_traces(fd)
+                return
+            yield from _import_msgpack().Unpacker(fd, raw=False, ext_hook=_msgpack_ext_hook)
+            return
+
+    line = fd.readline()
+    while line and not line.strip():
+        line = fd.readline()
+    if line.lstrip()[:1] in ("[", b"["):
+        yield from json_loads(line + fd.read())
+        return
+
+    while line:
+        if line.strip():
+            try:
+                trace = json_loads(line)
+            except ValueError:
+                # a recording that got interrupted halfway through writing a
+                # trace leaves a partial last line behind which we skip
+                if line[-1:] in ("\n", b"\n"):
+                    raise
+                logger.warning("Skipping incomplete trace at the end of the trace file")
+                return
+            if lazy_outparams and type(trace) == dict and "outparams" in trace:
+                trace["outparams"] = LazyValue(line, _json_loads_outparams)
+            yield trace
+        line = fd.readline()
+
+
+def open_trace_file(filename, mode="rb", compression=None):
+    # Opens a trace file for reading, in which case any compression is dealt
+    # with by read_traces(), or for (over)writing or appending to it with the
+    # compression picked based on the file extension if not specified.
+    if mode == "rb":
+        return open(filename, mode)
+    if compression is None:
+        compression = guess_compression(filename)
+    if compression == COMPRESSION_GZIP:
+        return gzip.open(filename, mode)
+    if compression == COMPRESSION_BZ2:
+        return bz2.open(filename, mode)
+    if compression == COMPRESSION_XZ:
+        return lzma.open(filename, mode)
+    if compression == COMPRESSION_ZSTD:
+        zstd = _import_zstd()
+        return zstd.ZstdCompressor().stream_writer(open(filename, mode))
+    if compression != COMPRESSION_NONE:
+        raise ValueError("unknown compression {}".format(compression))
+    return open(filename, mode)
+
+
+def encode_trace(trace, trace_format):
+    # encodes a single trace dictionary for the streaming trace formats
+    if trace_format == FORMAT_JSONL:
+        return json_dumps(trace).encode("utf-8") + b"\n"
+    if trace_format == FORMAT_MSGPACK:
+        return msgpack_dumps(trace)
+    raise ValueError("cannot stream traces in the {} format".format(trace_format))
+
+
+def write_traces(fd, traces, trace_format=FORMAT_JSON):
+    if trace_format == FORMAT_JSON:
+        # writes all the trace dictionaries as a single JSON array
+        data = json_dumps(traces, pretty=True)
+        fd.write(data.encode("utf-8"))
+        return
+    for trace in traces:
+        fd.write(encode_trace(trace, trace_format))
+
+
+class TraceWriter:
+    # Appends traces one by one to a JSON lines or msgpack trace file. The file
+    # is flushed after every flush_every traces and optionally synced to disk
+    # as well so a crash only loses the traces written since then. Unlike
+    # gzip and zstd, bzip2 and xz can't flush what they compressed so far
+    # without ending the compressed stream, so for these every flush ends the
+    # stream and the next write starts a new one. An existing file is
+    # replaced once the first trace is written unless appending to it.
+    def __init__(self, filename, flush_every=1, fsync=False, trace_format=FORMAT_JSONL, compression=None, append=False):
+        if flush_every < 1:
+            raise ValueError("need to flush after at least one trace")
+        if trace_format not in (FORMAT_JSONL, FORMAT_MSGPACK):
+            raise ValueError("cannot stream traces in the {} format".format(trace_format))
+        self._filename = filename
+        self._fd = None
+        self.flush_every = flush_every
+        self.fsync = fsync
+        self.trace_format = trace_format
+        self.compression = compression if compression else guess_compression(filename)
+        self.append = append
+        self._pending = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write(self, trace):
+        # only create the file once there is something to write to it
+        if self._fd is None:
+            self._fd = open_trace_file(self._filename, "ab" if self.append else "wb", self.compression)
+            self.append = True
+        self._fd.write(encode_trace(trace, self.trace_format))
+        self._pending += 1
+        if self._pending >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if self._fd is None:
+            return
+        if self.compression in (COMPRESSION_BZ2, COMPRESSION_XZ):
+            self._fd.close()
+            self._fd = None
+            if self.fsync:
+                with open(self._filename, "rb") as fd:
+                    os.fsync(fd.fileno())
+        else:
+            self._fd.flush()
+            if self.fsync:
+                os.fsync(self._fd.fileno())
+        self._pending = 0
+
+    def close(self):
+        self.flush()
+        if self._fd is not None:
+            self._fd.close()
+            self._fd = None
@@ -1,17 +1,79 @@
+import copy
 import datetime
+import json
+import math
 import shlex
+import sys
 import textwrap
+import threading
 
 import awscli
 import awscli.clidriver as clidriver
 import botocore
+import botocore.exceptions
 import botocore.hooks
+import botocore.loaders
+import botocore.paginate
+import botocore.session
+import botocore.utils
+import jmespath
 from awscli.plugin import load_plugins
+from botocore import xform_name
 
-from .utils import convert_from_camelcase, json_dumps
+from .tracefile import LazyValue
+from .utils import convert_from_camelcase, json_display_helper, json_dumps
+
+
+def get_path_value(params, path):
+    # Paths are the names of nested parameters separated by dots, with list
+    # items referred to by their index, e.g. Reservations.0.Instances.0.InstanceId
+    d = params
+    for name in path.split("."):
+        if type(d) == dict:
+            if name not in d:
+                return None
+            d = d[name]
+        elif type(d) == list:
+            if not name.isdigit() or int(name) >= len(d):
+                return None
+            d = d[int(name)]
+        else:
+            return None
+    return d
+
+
+def replace_path_values(params, replace_vars):
+    # Applies replacements keyed on (nested) paths and returns the toplevel
+    # parameters that changed as a result. Nested parameters are copied
+    # before changing them so the original parameters are left alone. The
+    # nested values of a parameter that is replaced as a whole, e.g. with -p,
+    # are left alone: they might not exist in the new value, which can also
+    # be the output of an earlier trace that mustn't change.
+    ret = {}
+    for path in sorted(replace_vars, key=lambda p: p.count(".")):
+        names = path.split(".")
+        if any(".".join(names[:i]) in replace_vars for i in range(1, len(names))):
+            continue
+        if len(names) == 1:
+            ret[path] = replace_vars[path]
+            continue
+        if names[0] not in ret:
+            ret[names[0]] = copy.deepcopy(params[names[0]])
+        d = ret[names[0]]
+        for name in names[1:-1]:
+            d = d[int(name)] if type(d) == list else d[name]
+        if type(d) == list:
+            d[int(names[-1])] = replace_vars[path]
+        else:
+            d[names[-1]] = replace_vars[path]
+    return ret
 
 
 class Trace:
+    # Slots as there can be a lot of these loaded at the same time
+    __slots__ = ("request_id", "fn_name", "inparams", "_outparams", "_lazy_outparams", "ts_start", "ts_end", "pages", "_page_start",
+                 "group", "command")
+
     def __init__(self):
         self.request_id = "<not set>"
         self.fn_name = "<not set>"
@@ -19,21 +81,69 @@ class Trace:
         self.outparams = {}
         self.ts_start = None
         self.ts_end = None
+        # the seconds every page took for paginated calls spanning more than
+        # one page, whose outputs are then merged
+        self.pages = None
+        self._page_start = None
+        # the calls made by a single AWS CLI command that made several of them
+        # share a group, the request id of the first call, and the arguments
+        # of that command
+        self.group = None
+        self.command = None
 
     def start(self):
         self.ts_start = datetime.datetime.now()
+        self.pages = None
 
     def finish(self):
         self.ts_end = datetime.datetime.now()
+        self._page_start = None
+
+    @property
+    def outparams(self):
+        # Outputs loaded lazily are decoded when they are first needed. The
+        # same trace can be read by several threads at once so the encoded
+        # outputs are only looked up once, as another thread can decode them
+        # and drop them in the meantime.
+        lazy = self._lazy_outparams
+        if lazy is not None:
+            outparams = lazy.decode()
+            self._outparams = outparams
+            self._lazy_outparams = None
+            return outparams
+        return self._outparams
+
+    @outparams.setter
+    def outparams(self, values):
+        if isinstance(values, LazyValue):
+            self._outparams, self._lazy_outparams = None, values
+        else:
+            self._outparams, self._lazy_outparams = values, None
+
+    def peek_outparams(self):
+        # Returns the outputs without holding on to them if they still have
+        # to be decoded, for when they are only needed once.
+        lazy = self._lazy_outparams
+        if lazy is not None:
+            return lazy.decode()
+        return self._outparams
+
+    def keep_outputs(self, paths):
+        # Drops all the toplevel output parameters except for the ones the
+        # given paths point into. Nothing is decoded if nothing is kept.
+        if not paths:
+            self.outparams = {}
+            return
+        outparams = self.peek_outparams()
+        kept = {}
+        for path in paths:
+            name = path if path in outparams else path.split(".", 1)[0]
+            if name in outparams:
+                kept[name] = outparams[name]
+        self.outparams = kept
 
     def get_output_value(self, name):
-        names = name.split(".")
-        d = self.outparams
-        for name in names:
-            if name not in d:
-                return None
-            d = d[name]
-        return d
+        return get_path_value(self.outparams, name)
 
     def set_input(self, fn_name, params):
         self.fn_name = fn_name
@@ -46,8 +156,23 @@ class Trace:
         self.request_id = request_id
         self.outparams = values
 
+    def start_page(self):
+        self._page_start = datetime.datetime.now()
+
+    def add_page(self, values, config):
+        # merges the outputs of the next page of a paginated call
+        now = datetime.datetime.now()
+        if self.pages is None:
+            self.pages = [(self.ts_end - self.ts_start).total_seconds()]
+            # the first page was handed out as is so it is left alone
+            self.outparams = copy.deepcopy(self.outparams)
+        self.pages.append((now - self._page_start).total_seconds())
+        self.outparams = merge_page(self.outparams, values, config)
+        self.ts_end = now
+        self._page_start = None
+
     def to_dict(self):
-        return {
+        ret = {
             "request_id": self.request_id,
             "fn_name": self.fn_name,
             "inparams": self.inparams,
@@ -55,6 +180,12 @@ class Trace:
             "ts_start": self.ts_start,
             "ts_end": self.ts_end
         }
+        if self.pages:
+            ret["pages"] = self.pages
+        if self.group is not None:
+            ret["group"] = self.group
+            ret["command"] = self.command
+        return ret
 
     @staticmethod
     def from_dict(d):
@@ -63,6 +194,9 @@ class Trace:
             if n not in d:
                 raise ValueError("invalid input")
             setattr(obj, n, d[n])
+        obj.pages = d.get("pages")
+        obj.group = d.get("group")
+        obj.command = d.get("command")
         return obj
 
     def get_shell_var(self, name, val):
@@ -105,11 +239,91 @@ class Trace:
             textwrap.indent("\n".join(out_str), "    "))
 
 
+# pagination configurations of the operations by service name and version
+_paginator_configs = {}
+_paginator_configs_lock = threading.Lock()
+
+
+def get_paginator_config(operation_model):
+    service_model = operation_model.service_model
+    key = (service_model.service_name, service_model.api_version)
+    with _paginator_configs_lock:
+        if key not in _paginator_configs:
+            try:
+                model = botocore.loaders.create_loader().load_service_model(
+                    service_model.service_name, "paginators-1", service_model.api_version)
+                _paginator_configs[key] = model.get("pagination", {})
+            except botocore.exceptions.DataNotFoundError:
+                _paginator_configs[key] = {}
+        return _paginator_configs[key].get(operation_model.name)
+
+
+def _as_list(val):
+    return val if type(val) == list else [val] if val else []
+
+
+def is_next_page(config, params):
+    return config is not None and any(params.get(name) for name in _as_list(config.get("input_token")))
+
+
+def merge_page(result, page, config):
+    # Merges the next page of a paginated response into the pages before it
+    # the way botocore builds the full result. The results are added up and
+    # everything else is taken from the last page, which also drops the tokens
+    # for getting the next page once there is none.
+    result_keys = _as_list(config.get("result_key"))
+    for expr in result_keys:
+        val = jmespath.search(expr, page)
+        if val is None:
+            continue
+        existing = jmespath.search(expr, result)
+        if existing is None:
+            botocore.utils.set_value_from_jmespath(result, expr, copy.copy(val))
+        elif type(existing) == list and type(val) == list:
+            existing.extend(val)
+        elif type(existing) in (int, float, str) and type(existing) == type(val):
+            botocore.utils.set_value_from_jmespath(result, expr, existing + val)
+    toplevel = set(expr.split(".")[0] for expr in result_keys)
+    for name in list(result.keys()):
+        if name not in toplevel and name not in page:
+            del result[name]
+    for name, val in page.items():
+        if name not in toplevel:
+            result[name] = val
+    return result
+
+
 class EventCapturer(botocore.hooks.HierarchicalEmitter):
+    # Captures a trace for every call made by a command, in the order the
+    # calls were made in. Commands like aws s3 sync make their calls from
+    # several threads at once so the calls are told apart by their thread.
     def __init__(self):
         super().__init__()
-        self.trace = Trace()
+        self.reset()
+
+    def reset(self):
+        # re-arm the capturer for the next command without touching the
+        # handlers registered by botocore and the awscli plugins; the old
+        # traces are left alone as they were handed out to the caller. The
+        # clients of a command get a copy of the capturer so everything the
+        # copies have to share is kept in objects that are changed in place.
+        self.traces = []
         self.events_captured = []
+        self._calls = {}
+
+    def get_handlers(self):
+        # a copy of the handlers registered so far
+        return copy.copy(self._handlers), copy.copy(self._unique_id_handlers)
+
+    def set_handlers(self, handlers):
+        self._handlers = copy.copy(handlers[0])
+        self._unique_id_handlers = copy.copy(handlers[1])
+        self._lookup_cache = {}
+
+    @property
+    def trace(self):
+        # the trace of the last call made
+        return self.traces[-1] if self.traces else Trace()
 
     def emit(self, event_name, **kwargs):
         if event_name.startswith("provide-client-params"):
@@ -119,8 +333,18 @@ class EventCapturer(botocore.hooks.HierarchicalEmitter):
             if "params" not in kwargs:
                 raise ValueError("unexpected input")
             params = kwargs["params"]
-            self.trace.start()
-            self.trace.set_input(fn_name, params)
+            # the calls for the next pages of a paginated call end up in the
+            # same trace, which keeps the parameters of the first call
+            config = get_paginator_config(kwargs["model"]) if "model" in kwargs else None
+            trace = self._calls.get(threading.get_ident())
+            if trace is not None and trace.fn_name == fn_name and trace.ts_end is not None and is_next_page(config, params):
+                trace.start_page()
+            else:
+                trace = Trace()
+                trace.start()
+                trace.set_input(fn_name, params)
+                self.traces.append(trace)
+                self._calls[threading.get_ident()] = trace
         elif event_name.startswith("after-call"):
             fn_name = event_name[len("after-call") + 1:]
             if len(fn_name) == 0:
@@ -134,37 +358,348 @@ class EventCapturer(botocore.hooks.HierarchicalEmitter):
                 raise ValueError("unexpected input")
             req_id = parsed["ResponseMetadata"]["RequestId"]
             del parsed["ResponseMetadata"]
-            self.trace.set_output(req_id, fn_name, parsed)
-            self.trace.finish()
+            trace = self._calls.get(threading.get_ident(), self.trace)
+            if trace._page_start is not None and "Error" not in parsed:
+                trace.add_page(parsed, get_paginator_config(kwargs["model"]))
+            else:
+                trace.set_output(req_id, fn_name, parsed)
+                trace.finish()
         self.events_captured.append(event_name)
         return super().emit(event_name, **kwargs)
 
 
-class TraceRunner:
-    def __init__(self):
+def get_session_key(args):
+    # The global options below end up in the botocore session configuration
+    # once a driver has parsed them, so a session can only be shared between
+    # commands that agree on them. Note that argparse accepts unique prefixes
+    # which is why --endpoint is matched as well as --endpoint-url.
+    opts = {"--profile": None, "--region": None, "--endpoint-url": None}
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        name, sep, val = arg.partition("=")
+        for opt in opts:
+            if len(name) > 2 and opt.startswith(name):
+                if not sep:
+                    i += 1
+                    val = args[i] if i < len(args) else None
+                opts[opt] = val
+                break
+        i += 1
+    return (opts["--profile"], opts["--region"], opts["--endpoint-url"])
+
+
+def coerce_params(operation_model, params):
+    # Parameters overridden from the command-line are always strings whereas
+    # the AWS CLI would have converted them to the type the operation expects
+    # from its arguments. Do the same for the toplevel parameters here.
+    input_shape = operation_model.input_shape
+    if input_shape is None:
+        return params
+    ret = dict(params)
+    for name, val in params.items():
+        if type(val) != str or name not in input_shape.members:
+            continue
+        type_name = input_shape.members[name].type_name
+        if type_name in ("integer", "long"):
+            ret[name] = int(val)
+        elif type_name in ("float", "double"):
+            ret[name] = float(val)
+        elif type_name == "boolean":
+            ret[name] = val.lower() == "true"
+        elif type_name in ("structure", "list", "map"):
+            ret[name] = json.loads(val)
+    return ret
+
+
+# service ids as used in the event names of the traces mapped to the service
+# names used to create clients with
+_service_names = {}
+_service_names_lock = threading.Lock()
+
+
+def get_service_name(session, service_id):
+    # The service name is usually the same as its hyphenized id but not
+    # always, e.g. the es service has elasticsearch-service as its id. Only
+    # when it's not are all the service models loaded to find it.
+    if service_id in _service_names:
+        return _service_names[service_id]
+    try:
+        if session.get_service_model(service_id).service_id.hyphenize() == service_id:
+            _service_names[service_id] = service_id
+            return service_id
+    except botocore.exceptions.UnknownServiceError:
         pass
+    with _service_names_lock:
+        if service_id not in _service_names:
+            for name in session.get_available_services():
+                _service_names[session.get_service_model(name).service_id.hyphenize()] = name
+    if service_id not in _service_names:
+        raise ValueError("unknown service {}".format(service_id))
+    return _service_names[service_id]
+
+
+# states of the waiters for a created resource, the more useful ones first
+WAITER_STATES = ("available", "active", "running", "completed", "exists")
+
+# seconds between the calls of a waiter, a lot less than most waiters default
+# to as the whole point is to continue as soon as the resource is ready
+WAITER_DELAY = 2
+
+
+def find_waiter(client, operation_name):
+    # Finds the waiter for the resource created by a Create* operation, e.g.
+    # table_exists for dynamodb CreateTable or function_active for lambda
+    # CreateFunction.
+    if not operation_name.startswith("Create"):
+        return None
+    resource = xform_name(operation_name[len("Create"):])
+    for state in WAITER_STATES:
+        name = "{}_{}".format(resource, state)
+        if name in client.waiter_names:
+            return name
+    return None
+
+
+def get_waiter_params(input_shape, inparams, outparams):
+    # Picks the parameters for a waiter from the input and output of the
+    # operation that created the resource, e.g. the TableName of CreateTable
+    # or the VpcIds for the vpc_available waiter from the VpcId nested in the
+    # output of CreateVpc. Returns None if not all required ones are found.
+    values = {}
+
+    def walk(val):
+        if type(val) == dict:
+            for k, v in val.items():
+                if type(v) == str:
+                    values.setdefault(k, v)
+                else:
+                    walk(v)
+        elif type(val) == list:
+            for v in val:
+                walk(v)
+
+    walk(outparams)
+    values.update((k, v) for k, v in inparams.items() if type(v) == str)
+    ret = {}
+    for name, member in input_shape.members.items():
+        if name in values:
+            ret[name] = values[name]
+        elif member.type_name == "list" and name.endswith("s") and name[:-1] in values:
+            ret[name] = [values[name[:-1]]]
+    if any(name not in ret for name in input_shape.required_members):
+        return None
+    return ret
+
+
+def get_error_code(trace):
+    # failed calls get captured as well, with the error as their output
+    outparams = trace.peek_outparams()
+    error = outparams.get("Error") if type(outparams) == dict else None
+    return error.get("Code") if type(error) == dict else None
+
+
+class QuietOperationCaller(clidriver.CLIOperationCaller):
+    # Hands the response of a command to the runner instead of to the output
+    # formatter of the AWS CLI. All the pages of a paginated response are still
+    # fetched as the trace is only captured while doing so.
+    def __init__(self, session, runner):
+        super().__init__(session)
+        self._runner = runner
+
+    def _display_response(self, command_name, response, parsed_globals):
+        if isinstance(response, botocore.paginate.PageIterator):
+            response = response.build_full_result()
+        self._runner.write_output(response)
+        if not self._runner.quiet:
+            super()._display_response(command_name, response, parsed_globals)
+
+
+class TraceRunner:
+    def __init__(self, reuse_session=True):
+        self.reuse_session = reuse_session
+        self.quiet = False
+        self.output_writer = None
+        self._local = threading.local()
+
+    def get_error_code(self):
+        # the error code of the last call made by this thread if it failed
+        return getattr(self._local, "error_code", None)
+
+    def stopped_early(self):
+        # whether the last call made by this thread stopped fetching pages
+        # before the last one as enough() was satisfied
+        return getattr(self._local, "stopped_early", False)
 
     def run_aws_cmd(self, args):
+        # returns the trace of the last call made by the command
+        traces = self.run_aws_cmd_traces(args)
+        if traces is None:
+            return None
+        return traces[-1] if traces else Trace()
+
+    def run_aws_cmd_traces(self, args):
+        # returns the traces of all the calls made by the command
+        self._local.error_code = None
+        self._local.stopped_early = False
         try:
-            ev = EventCapturer()
-            driver = self._create_clidriver(ev)
+            ev, driver = self._get_clidriver(args)
             retval = driver.main(args=args)
             # command failed so we don't record this trace and
             # can now simply bail out
             if retval != 0:
+                self._local.error_code = get_error_code(ev.trace)
                 return None
         except Exception as e:
             print("unknown exception occured: {}".format(str(e)))
             return None
+        return list(ev.traces)
+
+    def _get_clidriver(self, args):
+        if not self.reuse_session:
+            ev = EventCapturer()
+            return ev, self._create_clidriver(ev)
+
+        # Creating the session and loading the plugins is by far the most
+        # expensive part of running a single command so we only do that once
+        # for every unique set of session options. The driver is built again
+        # for every command though, on top of the handlers the session had
+        # before running any, as the AWS CLI registers handlers for every
+        # command it runs that would otherwise pile up. Neither the session
+        # nor the capturer can be shared between threads so every thread
+        # running commands keeps its own set.
+        sessions = self._local.__dict__.setdefault("cli_sessions", {})
+        key = get_session_key(args)
+        if key not in sessions:
+            ev = EventCapturer()
+            sessions[key] = (ev, self._create_cli_session(ev), ev.get_handlers())
+        ev, session, handlers = sessions[key]
+        ev.reset()
+        ev.set_handlers(handlers)
+        return ev, clidriver.CLIDriver(session=session)
+
+    def run_api_call(self, fn_name, params, profile=None, region=None, endpoint=None, enough=None):
+        # Calls the operation of a trace directly with a botocore client
+        # instead of rendering it as an AWS CLI command which then needs to
+        # be parsed again. The trace is captured in exactly the same way.
+        # Paginated operations fetch all pages like the AWS CLI does, unless
+        # enough() says the outputs of the pages fetched so far are enough.
+        self._local.error_code = None
+        self._local.stopped_early = False
+        try:
+            ev, client, operation_name = self._get_client(fn_name, profile, region, endpoint)
+            params = coerce_params(client.meta.service_model.operation_model(operation_name), params)
+            method = xform_name(operation_name)
+            if client.can_paginate(method):
+                for _ in client.get_paginator(method).paginate(**params):
+                    if enough is not None and enough(ev.trace.outparams):
+                        self._local.stopped_early = True
+                        break
+                response = ev.trace.outparams
+            else:
+                response = getattr(client, method)(**params)
+        except (botocore.exceptions.ClientError, botocore.exceptions.BotoCoreError) as e:
+            if isinstance(e, botocore.exceptions.ClientError):
+                self._local.error_code = e.response.get("Error", {}).get("Code")
+            sys.stderr.write("\n{}\n".format(str(e)))
+            sys.stderr.flush()
+            return None
+        except Exception as e:
+            print("unknown exception occured: {}".format(str(e)))
+            return None
+        self.print_output(response)
         return ev.trace
 
-    def _create_clidriver(self, ev):
+    def print_output(self, values):
+        self.write_output(values)
+        if values and not self.quiet:
+            print(json.dumps(values, indent=4, default=json_display_helper, ensure_ascii=False))
+
+    def set_output_name(self, name):
+        # name of the file the output of the next call made by this thread is
+        # written to by the output writer
+        self._local.output_name = name
+
+    def write_output(self, values):
+        name = getattr(self._local, "output_name", None)
+        if self.output_writer is not None and name is not None:
+            self.output_writer.write(name, values)
+
+    def wait_for_resource(self, trace, timeout, profile=None, region=None, endpoint=None):
+        # Waits for the resource created by the call in trace to be ready with
+        # the matching botocore waiter. Returns None when there is no waiter
+        # for it and otherwise whether the resource got ready in time.
+        _, client, operation_name = self._get_client(trace.fn_name, profile, region, endpoint)
+        name = find_waiter(client, operation_name)
+        if name is None:
+            return None
+        waiter = client.get_waiter(name)
+        input_shape = client.meta.service_model.operation_model(waiter.config.operation).input_shape
+        params = get_waiter_params(input_shape, trace.inparams, trace.peek_outparams())
+        if params is None:
+            return None
+        delay = min(waiter.config.delay, WAITER_DELAY)
+        config = {"Delay": delay, "MaxAttempts": max(1, int(math.ceil(timeout / delay)))}
+        try:
+            waiter.wait(WaiterConfig=config, **params)
+        except botocore.exceptions.WaiterError as e:
+            sys.stderr.write("\n{}\n".format(str(e)))
+            sys.stderr.flush()
+            return False
+        return True
+
+    def _get_client(self, fn_name, profile, region, endpoint):
+        parts = fn_name.split(".")
+        if len(parts) != 2:
+            raise ValueError("invalid fn_name")
+        service_id, operation_name = parts
+
+        # Just like the drivers the sessions and clients are only created once
+        # for every profile, region and endpoint and every thread. Every client
+        # gets its own copy of the event capturer of the session.
+        if not self.reuse_session:
+            session = self._create_session(profile)
+            client = session.create_client(get_service_name(session, service_id), region_name=region, endpoint_url=endpoint)
+            return client.meta.events, client, operation_name
+
+        sessions = self._local.__dict__.setdefault("sessions", {})
+        clients = self._local.__dict__.setdefault("clients", {})
+        key = (profile, region, endpoint, service_id)
+        if key not in clients:
+            if profile not in sessions:
+                sessions[profile] = self._create_session(profile)
+            session = sessions[profile]
+            clients[key] = session.create_client(get_service_name(session, service_id), region_name=region, endpoint_url=endpoint)
+        client = clients[key]
+        client.meta.events.reset()
+        return client.meta.events, client, operation_name
+
+    def _create_session(self, profile):
         session = botocore.session.Session(awscli.EnvironmentVariables)
-        # registering the event emitter needs to be done here immediately to
-        # prevent argparsing errors
-        session.register_component("event_emitter", ev)
+        session.register_component("event_emitter", EventCapturer())
+        awscli.clidriver._set_user_agent_for_session(session)
+        if profile:
+            session.set_config_variable("profile", profile)
+        return session
+
+    def _create_clidriver(self, ev):
+        return clidriver.CLIDriver(session=self._create_cli_session(ev))
+
+    def _create_cli_session(self, ev):
+        # the capturer has to be the emitter of the session itself, not just
+        # the one handed to the clients, as otherwise the handlers the AWS CLI
+        # registers never see the events the driver emits and commands like
+        # aws s3 sync don't exist
+        session = botocore.session.Session(awscli.EnvironmentVariables, event_hooks=ev)
         awscli.clidriver._set_user_agent_for_session(session)
         load_plugins(session.full_config.get('plugins', {}),
                      event_hooks=session.get_component('event_emitter'))
-        driver = clidriver.CLIDriver(session=session)
-        return driver
+        if self.quiet or self.output_writer is not None:
+            session.register("building-command-table", self._replace_operation_callers)
+        return session
+
+    def _replace_operation_callers(self, command_table, session, **kwargs):
+        # commands customized by the AWS CLI keep displaying their output
+        for command in command_table.values():
+            if type(getattr(command, "_operation_caller", None)) == clidriver.CLIOperationCaller:
+                command._operation_caller = QuietOperationCaller(session, self)
@@ -1,6 +1,8 @@
+import gc
 import json
 import logging
 import sys
+from contextlib import contextmanager
 from datetime import date, datetime, timedelta, timezone
 
 
@@ -105,12 +107,25 @@ def _fromisoformat(dtstr):
     return datetime(*(date_components + time_components))
 
 
+# skip the check above when the built-in one is there as this gets called a lot
+if hasattr(datetime, "fromisoformat"):
+    _fromisoformat = datetime.fromisoformat  # noqa: F811
+
+
 def json_serialize_helper(obj):
     if isinstance(obj, (datetime, date)):
         return {"_isoformat": obj.isoformat()}
     raise TypeError("Type {} is not serializable".format(type(obj)))
 
 
+def json_display_helper(obj):
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, bytes):
+        return obj.decode("utf-8", "replace")
+    raise TypeError("Type {} is not serializable".format(type(obj)))
+
+
 def json_deserialize_helper(obj):
     _isoformat = obj.get("_isoformat")
     if _isoformat is not None:
@@ -118,6 +133,26 @@ def json_deserialize_helper(obj):
     return obj
 
 
+# the garbage collector is only worth pausing for documents of at least this
+# size, for smaller ones enabling it again costs more than pausing it saves
+GC_PAUSE_SIZE = 1 << 20
+
+
+@contextmanager
+def gc_paused(pause=True):
+    # Decoding large documents creates so many objects that the cyclic garbage
+    # collector keeps kicking in while none of them can be garbage yet. This
+    # easily takes up more time than the actual decoding does.
+    enabled = gc.isenabled()
+    if pause:
+        gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
 def json_dumps(obj, pretty=False):
     if pretty:
         return json.dumps(obj, sort_keys=True, indent=1, default=json_serialize_helper)
@@ -125,11 +160,13 @@ def json_dumps(obj, pretty=False):
 
 
 def json_load(fd):
-    return json.load(fd, object_hook=json_deserialize_helper)
+    with gc_paused():
+        return json.load(fd, object_hook=json_deserialize_helper)
 
 
 def json_loads(s):
-    return json.loads(s, object_hook=json_deserialize_helper)
+    with gc_paused(len(s) >= GC_PAUSE_SIZE):
+        return json.loads(s, object_hook=json_deserialize_helper)
 
 
 def convert_from_camelcase(s):
@@ -0,0 +1,49 @@
+import unittest
+from unittest import mock
+
+
+class TestCache(unittest.TestCase):
+    def test_is_read_only(self):
+        from awstracer.cache import is_read_only
+        self.assertTrue(is_read_only("dynamodb.DescribeTable"))
+        self.assertTrue(is_read_only("iam.ListUsers"))
+        self.assertTrue(is_read_only("s3.GetObject"))
+        self.assertFalse(is_read_only("dynamodb.PutItem"))
+        self.assertFalse(is_read_only("iam.CreateUser"))
+        # these return something new every time
+        self.assertFalse(is_read_only("secrets-manager.GetRandomPassword"))
+        self.assertFalse(is_read_only("cognito-identity.GetId"))
+        self.assertFalse(is_read_only("sts.GetSessionToken"))
+        self.assertTrue(is_read_only("sts.GetCallerIdentity"))
+
+    def test_cache_key(self):
+        from awstracer.cache import get_cache_key
+        k1 = get_cache_key("iam.GetUser", {"UserName": "u", "Path": "/"}, "p", "r")
+        k2 = get_cache_key("iam.GetUser", {"Path": "/", "UserName": "u"}, "p", "r")
+        self.assertEqual(k1, k2)
+        self.assertNotEqual(k1, get_cache_key("iam.GetUser", {"Path": "/", "UserName": "u"}, "p", "other"))
+        self.assertNotEqual(k1, get_cache_key("iam.GetUser", {"Path": "/", "UserName": "other"}, "p", "r"))
+
+    def test_cache(self):
+        from awstracer.cache import ResultCache
+        with self.assertRaises(ValueError):
+            ResultCache(max_entries=0)
+
+        with mock.patch("awstracer.cache.time.monotonic", return_value=100):
+            cache = ResultCache(ttl=10, max_entries=2)
+            cache.put(("iam.GetUser", "1"), "t1")
+            cache.put(("iam.GetUser", "2"), "t2")
+            self.assertEqual(cache.get(("iam.GetUser", "1")), "t1")
+            # the least recently used result gets dropped
+            cache.put(("dynamodb.DescribeTable", "3"), "t3")
+            self.assertEqual(len(cache), 2)
+            self.assertIsNone(cache.get(("iam.GetUser", "2")))
+            self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+            cache.invalidate("iam")
+            self.assertIsNone(cache.get(("iam.GetUser", "1")))
+            self.assertEqual(cache.get(("dynamodb.DescribeTable", "3")), "t3")
+
+        with mock.patch("awstracer.cache.time.monotonic", return_value=110):
+            self.assertIsNone(cache.get(("dynamodb.DescribeTable", "3")))
+            self.assertEqual(len(cache), 0)
@@ -0,0 +1,69 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+
+def _trace(fn_name, inparams, request_id, outparams):
+    from awstracer.tracer import Trace
+    t = Trace()
+    t.start()
+    t.set_input(fn_name, inparams)
+    t.set_output(request_id, fn_name, outparams)
+    t.finish()
+    return t
+
+
+class TestCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, "play.checkpoint")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_checkpoint(self):
+        from awstracer.checkpoint import Checkpoint
+        t1 = _trace("iam.CreateUser", {"UserName": "u"}, "reqid1", {"User": {"UserName": "u"}})
+        t2 = _trace("iam.CreatePolicy", {"PolicyName": "p"}, "reqid2", {"Policy": {"PolicyName": "p"}})
+
+        # nothing to resume from yet
+        self.assertEqual(Checkpoint(self.filename, "abc", {"UserName": "u"}).load(), {})
+
+        with Checkpoint(self.filename, "abc", {"UserName": "u"}) as cp:
+            cp.start()
+            cp.add(1, t1)
+        with Checkpoint(self.filename, "abc", {"UserName": "u"}) as cp:
+            results = cp.load()
+            self.assertEqual(list(results.keys()), [1])
+            self.assertEqual(results[1].request_id, "reqid1")
+            self.assertEqual(results[1].outparams, t1.outparams)
+            cp.start(results)
+            cp.add(2, t2)
+
+        # a crash halfway through writing a result leaves an incomplete line
+        with open(self.filename, "ab") as fd:
+            fd.write(b'{"position": 3, "tra')
+        with Checkpoint(self.filename, "abc", {"UserName": "u"}) as cp:
+            results = cp.load()
+            self.assertEqual(sorted(results.keys()), [1, 2])
+            cp.start(results)
+        with open(self.filename, "rb") as fd:
+            self.assertEqual(len(fd.read().splitlines()), 3)
+
+        # a crash while starting over keeps the old checkpoint
+        with Checkpoint(self.filename, "abc", {"UserName": "u"}) as cp:
+            results = cp.load()
+            with mock.patch("awstracer.checkpoint.os.replace", side_effect=OSError("crash")):
+                with self.assertRaises(OSError):
+                    cp.start(results)
+            self.assertEqual(sorted(cp.load().keys()), [1, 2])
+            cp.start(results)
+        self.assertFalse(os.path.exists("{}.tmp".format(self.filename)))
+        self.assertEqual(sorted(Checkpoint(self.filename, "abc", {"UserName": "u"}).load().keys()), [1, 2])
+
+        with self.assertRaises(ValueError):
+            Checkpoint(self.filename, "def", {"UserName": "u"}).load()
+        with self.assertRaises(ValueError):
+            Checkpoint(self.filename, "abc", {"UserName": "other"}).load()
@@ -0,0 +1,87 @@
+import io
+import unittest
+from contextlib import redirect_stderr, redirect_stdout
+
+
+def _traces():
+    from awstracer.tracer import Trace
+    t1 = Trace()
+    t1.start()
+    t1.set_input("iam.CreateUser", {"UserName": "u"})
+    t1.set_output("reqid1", "iam.CreateUser", {"User": {"UserName": "u", "Arn": "arn:aws:iam::1:user/u"}})
+    t1.finish()
+    t2 = Trace()
+    t2.start()
+    t2.set_input("iam.CreatePolicy", {"PolicyName": "p", "PolicyDocument": "{}"})
+    t2.set_output("reqid2", "iam.CreatePolicy", {"Policy": {"PolicyName": "p", "Arn": "arn:aws:iam::1:policy/p"}})
+    t2.finish()
+    t3 = Trace()
+    t3.start()
+    t3.set_input("iam.AttachUserPolicy", {"UserName": "u", "PolicyArn": "arn:aws:iam::1:policy/p"})
+    t3.set_output("reqid3", "iam.AttachUserPolicy", {})
+    t3.finish()
+    return [t1, t2, t3]
+
+
+class TestCompiler(unittest.TestCase):
+    def test_options(self):
+        from awstracer.compiler import opt_parser
+        with self.assertRaises(SystemExit):
+            with redirect_stdout(io.StringIO()):
+                with redirect_stderr(io.StringIO()):
+                    opt_parser(["--trace-file", "bla"])
+        with self.assertRaises(SystemExit):
+            with redirect_stderr(io.StringIO()):
+                opt_parser(["--trace-file", "bla", "--output", "bla"])
+        ns = opt_parser(["--trace-file", "bla", "--output", "bla.plan", "-p", "user-name"])
+        self.assertEqual(ns.trace_file, "bla")
+        self.assertEqual(ns.output_file, "bla.plan")
+        self.assertEqual(ns.params, ["user-name"])
+
+    def test_plan(self):
+        from awstracer.plan import apply_plan, compile_plan, hash_trace_file, plan_matches, read_plan, write_plan
+        from awstracer.player import TracePlayer
+        from awstracer.tracefile import write_traces
+
+        data = io.BytesIO()
+        write_traces(data, [t.to_dict() for t in _traces()])
+        trace_hash = hash_trace_file(data)
+        self.assertEqual(data.tell(), 0)
+        self.assertEqual(len(trace_hash), 64)
+
+        with TracePlayer(data, {}, prompt_color=False) as tp:
+            plan = compile_plan(tp, trace_hash, {"UserName"})
+        out = io.BytesIO()
+        write_plan(out, plan)
+        plan = read_plan(io.BytesIO(out.getvalue()))
+        self.assertTrue(plan_matches(plan, trace_hash, {"UserName": "other"}))
+        self.assertFalse(plan_matches(plan, trace_hash, {}))
+        self.assertFalse(plan_matches(plan, "0" * 64, {"UserName": "other"}))
+        self.assertEqual([t["fn_name"] for t in plan["traces"][1:]], ["iam.CreateUser", "iam.CreatePolicy", "iam.AttachUserPolicy"])
+        self.assertEqual(sorted(plan["traces"][3]["replaced"]), ["PolicyArn", "UserName"])
+
+        # playing with the plan is the same as finding the connections again
+        outputs = []
+        for use_plan in (False, True):
+            data.seek(0)
+            with TracePlayer(data, {"UserName": "other"}, prompt_color=False) as tp:
+                if use_plan:
+                    apply_plan(tp, plan)
+                else:
+                    tp.find_connections()
+                    tp.prune_connections()
+                f = io.StringIO()
+                with redirect_stdout(f):
+                    tp.play_trace(dryrun=True, sleep_delay=0)
+                outputs.append(f.getvalue())
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertNotEqual(outputs[1].find("aws iam attach-user-policy --policy-arn arn:aws:iam::1:policy/p --user-name other"), -1)
+
+        # plans for other traces are refused
+        data = io.BytesIO()
+        write_traces(data, [t.to_dict() for t in _traces()[:2]])
+        with TracePlayer(data, {}, prompt_color=False) as tp:
+            with self.assertRaises(ValueError):
+                apply_plan(tp, plan)
+        with self.assertRaises(ValueError):
+            read_plan(io.BytesIO(b"[]"))
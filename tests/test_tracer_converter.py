@@ -0,0 +1,53 @@
+import io
+import unittest
+from contextlib import redirect_stderr, redirect_stdout
+
+
+class TestConverter(unittest.TestCase):
+    def test_options(self):
+        try:
+            from awstracer.converter import opt_parser
+        except Exception:
+            self.fail("cannot import opt_parser")
+        with self.assertRaises(SystemExit):
+            with redirect_stdout(io.StringIO()):
+                with redirect_stderr(io.StringIO()):
+                    opt_parser([])
+        with self.assertRaises(SystemExit):
+            with redirect_stderr(io.StringIO()):
+                opt_parser(["--trace-file", "bla", "--output", "bla"])
+        ns = opt_parser(["--trace-file", "bla", "--output", "bla.jsonl"])
+        self.assertEqual(ns.trace_file, "bla")
+        self.assertEqual(ns.output_file, "bla.jsonl")
+        self.assertIsNone(ns.trace_format)
+        self.assertIsNone(ns.compression)
+        ns = opt_parser(["--trace-file", "bla", "--output", "bla2", "--format", "jsonl", "--compress", "gzip"])
+        self.assertEqual(ns.trace_format, "jsonl")
+        self.assertEqual(ns.compression, "gzip")
+
+    def test_convert(self):
+        from awstracer.converter import convert
+        from awstracer.tracefile import read_traces, write_traces
+        from awstracer.tracer import Trace
+        t = Trace()
+        t.start()
+        t.set_input("bla.wut", {"a": "b"})
+        t.set_output("reqid", "bla.wut", {"c": "d"})
+        t.finish()
+        traces = [t.to_dict(), t.to_dict()]
+        inp = io.BytesIO()
+        convert(io.StringIO("[]"), inp, "json")
+        inp.seek(0)
+        self.assertEqual(list(read_traces(inp)), [])
+
+        # json -> jsonl -> json round trip
+        inp = io.BytesIO()
+        write_traces(inp, traces)
+        inp.seek(0)
+        out = io.BytesIO()
+        convert(inp, out, "jsonl")
+        self.assertEqual(len(out.getvalue().splitlines()), 2)
+        out.seek(0)
+        out2 = io.BytesIO()
+        convert(out, out2, "json")
+        self.assertEqual(out2.getvalue(), inp.getvalue())
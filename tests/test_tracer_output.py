@@ -0,0 +1,33 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timezone
+
+
+class TestOutput(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def test_output_name(self):
+        from awstracer.output import get_output_name
+        self.assertEqual(get_output_name(None, 3, "iam.ListUsers"), "00003-iam.ListUsers")
+        self.assertEqual(get_output_name("dev/us-east-1", 12, "iam.ListUsers"), "dev_us-east-1-00012-iam.ListUsers")
+        self.assertEqual(get_output_name("#2 dev/default", 1, "iam.ListUsers"), "2_dev_default-00001-iam.ListUsers")
+
+    def test_output_writer(self):
+        from awstracer.output import OutputWriter
+        directory = os.path.join(self.tmpdir, "out")
+        with OutputWriter(directory, max_pending=1) as writer:
+            for i in range(5):
+                user = {"UserName": "u{}".format(i), "CreateDate": datetime(2020, 1, 1, tzinfo=timezone.utc)}
+                writer.write("{:05d}-iam.GetUser".format(i), {"User": user})
+            writer.write("unserializable", {"Value": object()})
+        self.assertEqual(writer.written, 5)
+        self.assertEqual(writer.failed, 1)
+        with open(os.path.join(directory, "00004-iam.GetUser.json"), "r") as fd:
+            self.assertEqual(json.load(fd), {"User": {"UserName": "u4", "CreateDate": "2020-01-01T00:00:00+00:00"}})
+        # closing again is fine
+        writer.close()
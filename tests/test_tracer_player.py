@@ -15,6 +15,9 @@ class TestPlayer(unittest.TestCase):
                     opt_parser([])
                     # sleep delay cannot be negative so should exit
                     opt_parser(["--trace-file", "bla", "-s", "-1"])
+        with self.assertRaises(SystemExit):
+            with redirect_stderr(io.StringIO()):
+                opt_parser(["--trace-file", "bla", "-j", "0"])
         ns = opt_parser(["--trace-file", "bla"])
         self.assertEqual(ns.trace_file, "bla")
         # check default settings for options
@@ -27,6 +30,67 @@ class TestPlayer(unittest.TestCase):
         self.assertIsNone(ns.sleep_delay)
         self.assertTrue(ns.colorize)
         self.assertTrue(ns.stop_on_error)
+        self.assertTrue(ns.reuse_session)
+        self.assertFalse(ns.drop_unused_outputs)
+        self.assertFalse(ns.direct)
+        self.assertEqual(ns.jobs, 1)
+        self.assertEqual(ns.speed, 1)
+        self.assertIsNone(ns.max_gap)
+        self.assertIsNone(ns.poll_timeout)
+        self.assertIsNone(ns.wait_timeout)
+        for opt in ("--speed", "--max-gap", "--poll", "--wait-for-resources"):
+            with self.assertRaises(SystemExit):
+                with redirect_stderr(io.StringIO()):
+                    opt_parser(["--trace-file", "bla", opt, "-1"])
+        ns = opt_parser(["--trace-file", "bla", "--speed", "0.5", "--max-gap", "3", "--poll", "30", "-s", "0.5", "--wait-for-resources", "60"])
+        self.assertEqual(ns.speed, 0.5)
+        self.assertEqual(ns.max_gap, 3)
+        self.assertEqual(ns.poll_timeout, 30)
+        self.assertEqual(ns.sleep_delay, 0.5)
+        self.assertEqual(ns.wait_timeout, 60)
+        with self.assertRaises(SystemExit):
+            with redirect_stderr(io.StringIO()):
+                opt_parser(["--trace-file", "bla", "--region", "r1", "--regions", "r1,r2"])
+        ns = opt_parser(["--trace-file", "bla", "--regions", "r1, r2", "--profiles", "p1", "--target-jobs", "2"])
+        self.assertEqual(ns.regions, ["r1", "r2"])
+        self.assertEqual(ns.profiles, ["p1"])
+        self.assertEqual(ns.target_jobs, 2)
+        with self.assertRaises(SystemExit):
+            with redirect_stderr(io.StringIO()):
+                opt_parser(["--trace-file", "bla", "--plan", "bla.plan", "--sweep", "bla.csv"])
+        ns = opt_parser(["--trace-file", "bla", "--plan", "bla.plan"])
+        self.assertEqual(ns.plan, "bla.plan")
+        with self.assertRaises(SystemExit):
+            with redirect_stderr(io.StringIO()):
+                opt_parser(["--trace-file", "bla", "--resume"])
+        with self.assertRaises(SystemExit):
+            with redirect_stderr(io.StringIO()):
+                opt_parser(["--trace-file", "bla", "--checkpoint", "bla.checkpoint", "--regions", "r1,r2"])
+        with self.assertRaises(SystemExit):
+            with redirect_stderr(io.StringIO()):
+                opt_parser(["--trace-file", "bla", "--cache", "--cache-size", "0"])
+        with self.assertRaises(SystemExit):
+            with redirect_stderr(io.StringIO()):
+                opt_parser(["--trace-file", "bla", "--max-rate", "0"])
+        ns = opt_parser(["--trace-file", "bla", "--max-rate", "10", "--throttle-retries", "2"])
+        self.assertEqual(ns.max_rate, 10)
+        self.assertEqual(ns.throttle_retries, 2)
+        with self.assertRaises(SystemExit):
+            with redirect_stderr(io.StringIO()):
+                opt_parser(["--trace-file", "bla", "--bounded-pages"])
+        ns = opt_parser(["--trace-file", "bla", "--bounded-pages", "--direct"])
+        self.assertTrue(ns.bounded_pages)
+        ns = opt_parser(["--trace-file", "bla", "--cache", "--cache-ttl", "5"])
+        self.assertTrue(ns.cache)
+        self.assertEqual(ns.cache_ttl, 5)
+        ns = opt_parser(["--trace-file", "bla", "--checkpoint", "bla.checkpoint", "--resume"])
+        self.assertEqual(ns.checkpoint, "bla.checkpoint")
+        self.assertTrue(ns.resume)
+        ns = opt_parser(["--trace-file", "bla", "--no-session-reuse", "--jobs", "4", "--drop-unused-outputs", "--direct"])
+        self.assertFalse(ns.reuse_session)
+        self.assertTrue(ns.drop_unused_outputs)
+        self.assertTrue(ns.direct)
+        self.assertEqual(ns.jobs, 4)
         ns = opt_parser(["--trace-file", "bla", "--dryrun", "--region", "bl1", "--profile", "bl2", "--endpoint", "bl3", "-s", "2", "-d", "-f", "-c"])
         self.assertTrue(ns.dryrun)
         self.assertEqual(ns.region, "bl1")
@@ -227,3 +291,874 @@ class TestPlayer(unittest.TestCase):
                 self.assertEqual(len(tp.connections), 4)
                 c = tp.connections[-1]
                 self.assertEqual(c.trace_from.fn_name, "bla.wut")
+
+    def test_player_parallel(self):
+        from awstracer.player import TracePlayer
+        from awstracer.tracer import Trace
+        from awstracer.utils import json_dumps
+
+        def make_trace(fn_name, reqid, inparams, outparams):
+            t = Trace()
+            t.start()
+            t.set_input(fn_name, inparams)
+            t.set_output(reqid, fn_name, outparams)
+            t.finish()
+            return t
+
+        # wut1 and wut3 are independent, wut2 depends on wut1 and wut4 on wut2
+        tt = [make_trace("bla.wut1", "r1", {"a": "1"}, {"b": "val-b"}),
+              make_trace("bla.wut2", "r2", {"b": "val-b"}, {"c": "val-c"}),
+              make_trace("bla.wut3", "r3", {"x": "1"}, {}),
+              make_trace("bla.wut4", "r4", {"c": "val-c"}, {})]
+        inp = io.StringIO(json_dumps([x.to_dict() for x in tt]))
+        with TracePlayer(inp, {}, prompt_color=False) as tp:
+            tp.find_connections()
+            tp.prune_connections()
+            deps = tp.get_dependencies()
+            self.assertEqual(deps, [set(), set(), {1}, set(), {2}])
+
+            f = io.StringIO()
+            with redirect_stdout(f):
+                tp.play_trace(dryrun=True, sleep_delay=0, jobs=4)
+            for fn in ("wut1", "wut2", "wut3", "wut4"):
+                self.assertNotEqual(f.getvalue().find("aws bla {}".format(fn)), -1)
+            self.assertEqual(len(tp._play_results), 5)
+
+            # make wut2 fail and check that only its dependent is not started
+            played = []
+            orig = tp.play_single_trace
+
+            def play_single_trace(trace, dryrun=False, is_first=False):
+                played.append(trace.fn_name)
+                if trace.fn_name == "bla.wut2":
+                    return None
+                return orig(trace, dryrun, is_first)
+            tp.play_single_trace = play_single_trace
+            with redirect_stdout(io.StringIO()):
+                tp.play_trace(dryrun=True, stop_on_error=True, sleep_delay=0, jobs=2)
+            self.assertNotIn("bla.wut4", played)
+            self.assertIn("bla.wut3", played)
+            played.clear()
+            with redirect_stdout(io.StringIO()):
+                tp.play_trace(dryrun=True, stop_on_error=False, sleep_delay=0, jobs=2)
+            self.assertIn("bla.wut4", played)
+
+        # traces using the same table are played in order, except for the
+        # ones only reading it
+        table = {"TableDescription": {"TableName": "music"}}
+        tt = [make_trace("dynamodb.CreateTable", "r1", {"TableName": "music"}, table),
+              make_trace("dynamodb.PutItem", "r2", {"TableName": "music", "Item": {"a": {"S": "1"}}}, {}),
+              make_trace("dynamodb.PutItem", "r3", {"TableName": "music", "Item": {"a": {"S": "2"}}}, {}),
+              make_trace("dynamodb.GetItem", "r4", {"TableName": "music", "Key": {"a": {"S": "1"}}}, {}),
+              make_trace("dynamodb.Scan", "r5", {"TableName": "music"}, {}),
+              make_trace("dynamodb.DeleteTable", "r6", {"TableName": "music"}, table)]
+        inp = io.StringIO(json_dumps([x.to_dict() for x in tt]))
+        with TracePlayer(inp, {}, prompt_color=False) as tp:
+            tp.find_connections()
+            tp.prune_connections()
+            self.assertEqual(tp.get_dependencies(), [set(), set(), {1}, {1, 2}, {1, 3}, {1, 3}, {1, 3, 4, 5}])
+
+        # also when the table name is given on the command line
+        inp = io.StringIO(json_dumps([x.to_dict() for x in tt]))
+        with TracePlayer(inp, {"TableName": "other"}, prompt_color=False) as tp:
+            tp.find_connections()
+            tp.prune_connections()
+            self.assertEqual(tp.get_dependencies(), [set(), set(), {1}, {2}, {3}, {3}, {3, 4, 5}])
+
+    def test_player_find_connections_index(self):
+        import random
+        from awstracer.player import TracePlayer
+        from awstracer.tracer import Trace
+        from awstracer.utils import json_dumps
+
+        # generate traces with a small pool of names and values so that
+        # plenty of connections of all kinds show up
+        rnd = random.Random(1)
+        names = ["Name", "Arn", "Id", "Value", "Other"]
+        values = ["v1", "v2", "v3", 1, True, ["v1"], {"Id": "v2"}]
+
+        def random_params():
+            params = {}
+            for name in rnd.sample(names, rnd.randint(0, 4)):
+                if rnd.random() < 0.2:
+                    params[name] = {n: rnd.choice(values) for n in rnd.sample(names, 2)}
+                else:
+                    params[name] = rnd.choice(values)
+            return params
+
+        tt = []
+        for i in range(40):
+            t = Trace()
+            t.start()
+            t.set_input("bla.wut{}".format(i), random_params())
+            t.set_output("reqid{}".format(i), "bla.wut{}".format(i), random_params())
+            t.finish()
+            tt.append(t)
+
+        def describe(connections):
+            return [(type(c), c.trace_from.fn_name, c.trace_to.fn_name, c.varname_from, c.varname_to) for c in connections]
+
+        inp = io.StringIO(json_dumps([x.to_dict() for x in tt]))
+        with TracePlayer(inp, {"Name": "bla"}, prompt_color=False) as tp:
+            tp.find_connections()
+            indexed = describe(tp.connections)
+            tp.connections = []
+            for i, trace in enumerate(tp.traces):
+                for older_trace in tp.traces[:i]:
+                    tp.find_connections_between_traces(older_trace, trace)
+            pairwise = describe(tp.connections)
+        self.assertGreater(len(pairwise), 100)
+        self.assertEqual(indexed, pairwise)
+
+    def test_player_nested_connections(self):
+        from awstracer.player import TracePlayer, MatchingValueEdge, flatten_params
+        from awstracer.tracer import Trace
+        from awstracer.utils import json_dumps
+
+        flat = flatten_params({"A": [{"B": "b"}], "C": "c"})
+        self.assertEqual([(f[0], f[1], f[2]) for f in flat],
+                         [("A", 0, 0), ("A.0", 0, 1), ("A.0.B", 0, 2), ("C", 1, 0)])
+        self.assertEqual(len(set(f[4] for f in flatten_params({"A": {"B": 1}, "C": {"B": 1.0}}))), 2)
+
+        t = Trace()
+        t.start()
+        t.set_input("ec2.RunInstances", {"ImageId": "ami-1"})
+        t.set_output("reqid1", "ec2.RunInstances", {"Instances": [{"InstanceId": "i-old", "State": {"Name": "pending"}}]})
+        t.finish()
+        t2 = Trace()
+        t2.start()
+        t2.set_input("ec2.CreateTags", {"Resources": ["i-old"], "Tags": [{"Key": "k", "Value": "v"}]})
+        t2.set_output("reqid2", "ec2.CreateTags", {})
+        t2.finish()
+        inp = io.StringIO(json_dumps([t.to_dict(), t2.to_dict()]))
+        with TracePlayer(inp, {}, prompt_color=False) as tp:
+            tp.find_connections()
+            tp.prune_connections()
+            self.assertEqual(len(tp.connections), 1)
+            c = tp.connections[0]
+            self.assertIsInstance(c, MatchingValueEdge)
+            self.assertEqual(c.varname_from, "Instances.0.InstanceId")
+            self.assertEqual(c.varname_to, "Resources.0")
+
+            # pretend the instance was played back and got a new id
+            tp._play_results = {}
+            played = Trace()
+            played.set_input("ec2.RunInstances", {"ImageId": "ami-1"})
+            played.set_output("reqid1", "ec2.RunInstances", {"Instances": [{"InstanceId": "i-new"}]})
+            tp._play_results[1] = played
+            f = io.StringIO()
+            with redirect_stdout(f):
+                tp.play_single_trace(tp.traces[2], dryrun=True)
+            self.assertNotEqual(f.getvalue().find("--resources '[\"i-new\"]'"), -1)
+            self.assertEqual(tp.traces[2].inparams["Resources"], ["i-old"])
+
+        # equal numbers and flags below the toplevel don't connect traces
+        t = Trace()
+        t.start()
+        t.set_input("s3.ListObjectsV2", {"Bucket": "b"})
+        t.set_output("reqid1", "s3.ListObjectsV2", {"KeyCount": 5, "Contents": [{"Key": "k", "Size": 10}], "IsTruncated": True})
+        t.finish()
+        t2 = Trace()
+        t2.start()
+        t2.set_input("dynamodb.CreateTable", {"TableName": "t", "ProvisionedThroughput": {"ReadCapacityUnits": 5, "WriteCapacityUnits": 10},
+                                              "StreamSpecification": {"StreamEnabled": True}})
+        t2.set_output("reqid2", "dynamodb.CreateTable", {})
+        t2.finish()
+        inp = io.StringIO(json_dumps([t.to_dict(), t2.to_dict()]))
+        with TracePlayer(inp, {}, prompt_color=False) as tp:
+            tp.find_connections()
+            tp.prune_connections()
+            self.assertEqual(tp.connections, [])
+
+    def test_player_replaced_parameter(self):
+        from awstracer.player import TracePlayer
+        from awstracer.tracer import Trace
+        from awstracer.utils import json_dumps
+
+        t = Trace()
+        t.start()
+        t.set_input("iam.CreateUser", {"UserName": "bob"})
+        t.set_output("reqid1", "iam.CreateUser", {"User": {"UserName": "bob", "UserId": "id1"}})
+        t.finish()
+        t2 = Trace()
+        t2.start()
+        t2.set_input("dynamodb.PutItem", {"TableName": "users", "Item": {"user": {"S": "bob"}}})
+        t2.set_output("reqid2", "dynamodb.PutItem", {})
+        t2.finish()
+        inp = io.StringIO(json_dumps([t.to_dict(), t2.to_dict()]))
+        # the item given on the command line replaces the recorded one as a
+        # whole, including the user name matching the output of CreateUser
+        with TracePlayer(inp, {"Item": "{\"user\": {\"S\": \"other\"}}"}, prompt_color=False) as tp:
+            tp.find_connections()
+            tp.prune_connections()
+            self.assertIn("Item.user.S", [c.varname_to for c in tp.connections])
+            f = io.StringIO()
+            with redirect_stdout(f):
+                tp.play_trace(dryrun=True, sleep_delay=0)
+        self.assertNotEqual(f.getvalue().find("--item '{\"user\": {\"S\": \"other\"}}'"), -1)
+
+    def test_player_incoming_connections(self):
+        from awstracer.player import TracePlayer
+        from awstracer.tracer import Trace
+        from awstracer.utils import json_dumps
+
+        tt = []
+        for i in range(3):
+            t = Trace()
+            t.start()
+            t.set_input("bla.wut{}".format(i), {"In": "v{}".format(i)})
+            t.set_output("reqid", "bla.wut{}".format(i), {"Out": "v{}".format(i + 1)})
+            t.finish()
+            tt.append(t)
+        inp = io.StringIO(json_dumps([x.to_dict() for x in tt]))
+        with TracePlayer(inp, {}, prompt_color=False) as tp:
+            self.assertEqual(tp._incoming, [[], [], [], []])
+            tp.find_connections()
+            tp.prune_connections()
+            self.assertEqual([len(e) for e in tp._incoming], [0, 0, 1, 1])
+            self.assertIs(tp._incoming[2][0].trace_from, tp.traces[1])
+            self.assertIs(tp._incoming[3][0].trace_from, tp.traces[2])
+
+            # all traces share the same request id but results are kept apart
+            with redirect_stdout(io.StringIO()):
+                tp.play_trace(dryrun=True, sleep_delay=0)
+            self.assertEqual(sorted(tp._play_results), [0, 1, 2, 3])
+            for i, trace in enumerate(tp.traces):
+                self.assertIs(tp._play_results[i], trace)
+
+    def test_player_jsonl(self):
+        from awstracer.player import TracePlayer
+        from awstracer.tracer import Trace
+        from awstracer.utils import json_dumps
+        t = Trace()
+        t.start()
+        t.set_input("bla.wut", {"a": "b"})
+        t.set_output("reqid", "bla.wut", {"c": "d"})
+        t.finish()
+        inp = io.BytesIO("{}\n{}\n".format(json_dumps(t.to_dict()), json_dumps(t.to_dict())).encode("utf-8"))
+        with TracePlayer(inp, {}) as tp:
+            self.assertEqual(len(tp.traces), 3)
+            self.assertEqual(tp.traces[1].to_dict(), t.to_dict())
+
+    def test_player_lazy_outputs(self):
+        from awstracer.player import TracePlayer
+        from awstracer.tracer import Trace
+        from awstracer.tracefile import encode_trace
+
+        tt = []
+        for i in range(3):
+            t = Trace()
+            t.start()
+            t.set_input("bla.wut{}".format(i), {"In": "v{}".format(i)})
+            t.set_output("reqid", "bla.wut{}".format(i), {"Out": "v{}".format(i + 1), "Big": [{"x": i}] * 100})
+            t.finish()
+            tt.append(t)
+        data = b"".join(encode_trace(t.to_dict(), "jsonl") for t in tt)
+        with TracePlayer(io.BytesIO(data), {}, prompt_color=False) as tp:
+            # finding connections doesn't keep the outputs around
+            tp.find_connections()
+            tp.prune_connections()
+            self.assertEqual(len(tp.connections), 2)
+            for trace in tp.traces[1:]:
+                self.assertIsNotNone(trace._lazy_outparams)
+
+            tp.drop_unused_outputs()
+            self.assertEqual([t.outparams for t in tp.traces[1:]], [{"Out": "v1"}, {"Out": "v2"}, {}])
+            f = io.StringIO()
+            with redirect_stdout(f):
+                tp.play_trace(dryrun=True, sleep_delay=0)
+            self.assertNotEqual(f.getvalue().find("bla wut2 --in v2"), -1)
+
+        # everything is still there when loading eagerly
+        with TracePlayer(io.BytesIO(data), {}, prompt_color=False, lazy_outputs=False) as tp:
+            self.assertEqual([t.to_dict() for t in tp.traces[1:]], [t.to_dict() for t in tt])
+
+    def test_player_lazy_logging(self):
+        import logging
+        from awstracer.player import TracePlayer, logger
+        from awstracer.tracer import Trace
+
+        formatted = []
+
+        class Value:
+            def __eq__(self, other):
+                return isinstance(other, Value)
+
+            def __hash__(self):
+                return 1
+
+            def __bool__(self):
+                return True
+
+            def __format__(self, spec):
+                formatted.append(spec)
+                return "value"
+
+            def __str__(self):
+                formatted.append("str")
+                return "value"
+
+        with TracePlayer(io.StringIO("[]"), {}, prompt_color=False) as tp:
+            for i in range(3):
+                t = Trace()
+                t.set_input("bla.wut{}".format(i), {"In": Value()})
+                t.set_output("reqid", "bla.wut{}".format(i), {"Out": Value(), "In": [Value()]})
+                tp.traces.append(t)
+            tp._index_connections()
+
+            level = logger.level
+            try:
+                logger.setLevel(logging.INFO)
+                tp.find_connections()
+                self.assertEqual(len(tp.connections), 6)
+                tp.prune_connections()
+                self.assertEqual(len(tp.connections), 2)
+                self.assertEqual(formatted, [])
+
+                logger.setLevel(logging.DEBUG)
+                tp.find_connections()
+                self.assertNotEqual(formatted, [])
+            finally:
+                logger.setLevel(level)
+
+    def test_player_direct(self):
+        from botocore.stub import Stubber
+        from awstracer.player import TracePlayer
+        from awstracer.tracer import Trace
+        from awstracer.utils import json_dumps
+
+        t1 = Trace()
+        t1.start()
+        t1.set_input("dynamodb.CreateTable", {"TableName": "music", "BillingMode": "PAY_PER_REQUEST",
+                                              "AttributeDefinitions": [{"AttributeName": "a", "AttributeType": "S"}],
+                                              "KeySchema": [{"AttributeName": "a", "KeyType": "HASH"}]})
+        t1.set_output("reqid1", "dynamodb.CreateTable", {"TableDescription": {"TableName": "music"}})
+        t1.finish()
+        t2 = Trace()
+        t2.start()
+        t2.set_input("dynamodb.DescribeTable", {"TableName": "music"})
+        t2.set_output("reqid2", "dynamodb.DescribeTable", {"Table": {"TableName": "music"}})
+        t2.finish()
+        inp = io.StringIO(json_dumps([t1.to_dict(), t2.to_dict()]))
+        with TracePlayer(inp, {"TableName": "other"}, prompt_color=False, region="us-east-1", direct=True) as tp:
+            tp.find_connections()
+            tp.prune_connections()
+            _, client, _ = tp._get_client("dynamodb.CreateTable", None, "us-east-1", None)
+            with Stubber(client) as stubber:
+                expected = dict(t1.inparams, TableName="other")
+                stubber.add_response("create_table", {"TableDescription": {"TableName": "other"},
+                                                      "ResponseMetadata": {"RequestId": "reqid3"}}, expected)
+                stubber.add_response("describe_table", {"Table": {"TableName": "other"},
+                                                        "ResponseMetadata": {"RequestId": "reqid4"}}, {"TableName": "other"})
+                f = io.StringIO()
+                with redirect_stdout(f):
+                    tp.play_trace(sleep_delay=0)
+                stubber.assert_no_pending_responses()
+            self.assertEqual(tp._play_results[2].request_id, "reqid4")
+            self.assertNotEqual(f.getvalue().find("(play) aws dynamodb describe-table --table-name other"), -1)
+
+    def test_player_bounded_pages(self):
+        from botocore.stub import Stubber
+        from awstracer.cache import ResultCache
+        from awstracer.player import TracePlayer
+        from awstracer.tracer import Trace
+        from awstracer.utils import json_dumps
+
+        t1 = Trace()
+        t1.start()
+        t1.set_input("dynamodb.ListTables", {})
+        t1.set_output("reqid1", "dynamodb.ListTables", {"TableNames": ["tab1", "tab2", "tab3"]})
+        t1.finish()
+        t2 = Trace()
+        t2.start()
+        t2.set_input("dynamodb.DescribeTable", {"TableName": "tab2"})
+        t2.set_output("reqid2", "dynamodb.DescribeTable", {"Table": {"TableName": "tab2"}})
+        t2.finish()
+        with TracePlayer(io.StringIO(json_dumps([t1.to_dict(), t2.to_dict()])), {}, prompt_color=False, region="us-east-1",
+                         direct=True) as tp:
+            tp.find_connections()
+            tp.prune_connections()
+            tp.bounded_pages = True
+            _, client, _ = tp._get_client("dynamodb.ListTables", None, "us-east-1", None)
+            with Stubber(client) as stubber:
+                # the second page isn't fetched as the table needed is on the first one
+                stubber.add_response("list_tables", {"TableNames": ["tab1", "tab2"], "LastEvaluatedTableName": "tab2",
+                                                     "ResponseMetadata": {"RequestId": "reqid3"}}, {})
+                stubber.add_response("describe_table", {"Table": {"TableName": "tab2"}, "ResponseMetadata": {"RequestId": "reqid4"}},
+                                     {"TableName": "tab2"})
+                with redirect_stdout(io.StringIO()):
+                    tp.play_trace(sleep_delay=0)
+                stubber.assert_no_pending_responses()
+            self.assertEqual(tp._play_results[2].request_id, "reqid4")
+
+            # results that are missing pages aren't cached, unlike the
+            # result of describing the table
+            tp.cache = ResultCache()
+            with Stubber(client) as stubber:
+                for i in range(2):
+                    stubber.add_response("list_tables", {"TableNames": ["tab1", "tab2"], "LastEvaluatedTableName": "tab2",
+                                                         "ResponseMetadata": {"RequestId": "reqid5"}}, {})
+                    if i == 0:
+                        stubber.add_response("describe_table", {"Table": {"TableName": "tab2"}, "ResponseMetadata": {"RequestId": "reqid6"}},
+                                             {"TableName": "tab2"})
+                    with redirect_stdout(io.StringIO()):
+                        tp.play_trace(sleep_delay=0)
+                stubber.assert_no_pending_responses()
+            self.assertEqual(len(tp.cache), 1)
+            self.assertEqual(tp._play_results[2].request_id, "reqid6")
+
+    def test_player_cache(self):
+        from botocore.stub import Stubber
+        from awstracer.cache import ResultCache
+        from awstracer.player import TracePlayer
+        from awstracer.tracer import Trace
+        from awstracer.utils import json_dumps
+
+        traces = []
+        for i, fn_name in enumerate(("dynamodb.DescribeTable", "dynamodb.DescribeTable", "dynamodb.UpdateTable", "dynamodb.DescribeTable")):
+            t = Trace()
+            t.start()
+            t.set_input(fn_name, {"TableName": "music", "BillingMode": "PAY_PER_REQUEST"} if i == 2 else {"TableName": "music"})
+            t.set_output("reqid{}".format(i), fn_name, {})
+            t.finish()
+            traces.append(t.to_dict())
+        with TracePlayer(io.StringIO(json_dumps(traces)), {}, prompt_color=False, region="us-east-1", direct=True) as tp:
+            tp.find_connections()
+            tp.prune_connections()
+            tp.cache = ResultCache()
+            _, client, _ = tp._get_client("dynamodb.DescribeTable", None, "us-east-1", None)
+            with Stubber(client) as stubber:
+                table = {"Table": {"TableName": "music"}}
+                stubber.add_response("describe_table", dict(table, ResponseMetadata={"RequestId": "reqid4"}), {"TableName": "music"})
+                stubber.add_response("update_table", {"ResponseMetadata": {"RequestId": "reqid5"}})
+                stubber.add_response("describe_table", dict(table, ResponseMetadata={"RequestId": "reqid6"}), {"TableName": "music"})
+                with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+                    tp.play_trace(sleep_delay=0)
+                stubber.assert_no_pending_responses()
+            self.assertEqual([tp._play_results[i].request_id for i in range(1, 5)], ["reqid4", "reqid4", "reqid5", "reqid6"])
+            self.assertEqual((tp.cache.hits, tp.cache.misses), (1, 2))
+
+    def test_player_throttle(self):
+        from unittest import mock
+        from botocore.stub import Stubber
+        from awstracer.player import TracePlayer
+        from awstracer.ratelimit import RateLimiter
+        from awstracer.tracer import Trace
+        from awstracer.utils import json_dumps
+
+        traces = []
+        for i in range(2):
+            t = Trace()
+            t.start()
+            t.set_input("dynamodb.DescribeTable", {"TableName": "music"})
+            t.set_output("reqid{}".format(i), "dynamodb.DescribeTable", {})
+            t.finish()
+            traces.append(t.to_dict())
+        table = {"Table": {"TableName": "music"}}
+        with TracePlayer(io.StringIO(json_dumps(traces)), {}, prompt_color=False, region="us-east-1", direct=True) as tp:
+            tp.find_connections()
+            tp.prune_connections()
+            tp.rate_limiter = RateLimiter()
+            tp.throttle_retries = 1
+            _, client, _ = tp._get_client("dynamodb.DescribeTable", None, "us-east-1", None)
+            with Stubber(client) as stubber, mock.patch("awstracer.player.time.sleep") as sleep, \
+                    mock.patch("awstracer.player.random.uniform", return_value=0.25):
+                # the first call succeeds after a retry, the second one is given up on
+                stubber.add_client_error("describe_table", "ThrottlingException", response_meta={"RequestId": "reqid2"})
+                stubber.add_response("describe_table", dict(table, ResponseMetadata={"RequestId": "reqid3"}))
+                stubber.add_client_error("describe_table", "ThrottlingException", response_meta={"RequestId": "reqid4"})
+                stubber.add_client_error("describe_table", "ThrottlingException", response_meta={"RequestId": "reqid5"})
+                with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+                    tp.play_trace(sleep_delay=0)
+                stubber.assert_no_pending_responses()
+            # the limiter slows down the calls as well
+            self.assertEqual(sleep.call_args_list.count(mock.call(0.25)), 2)
+            self.assertEqual(tp._play_results[1].request_id, "reqid3")
+            self.assertIsNone(tp._play_results[2])
+            self.assertEqual(tp.get_error_code(), "ThrottlingException")
+            summary = tp.rate_limiter.get_summary()
+            self.assertEqual(summary[0][0], ("dynamodb", None, "us-east-1"))
+            self.assertEqual(summary[0][1], 4)
+            self.assertEqual(summary[0][3], 3)
+
+            # other errors aren't retried
+            tp._play_results = {}
+            with Stubber(client) as stubber, mock.patch("awstracer.player.time.sleep"), \
+                    mock.patch("awstracer.player.random.uniform") as uniform:
+                stubber.add_client_error("describe_table", "ResourceNotFoundException", response_meta={"RequestId": "reqid6"})
+                with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+                    tp.play_trace(sleep_delay=0)
+                stubber.assert_no_pending_responses()
+            uniform.assert_not_called()
+
+    def test_player_resume(self):
+        import datetime
+        import os
+        import shutil
+        import tempfile
+        from unittest import mock
+        from botocore.stub import Stubber
+        from awstracer.checkpoint import Checkpoint
+        from awstracer.player import TracePlayer, play_checkpointed
+        from awstracer.tracer import Trace
+        from awstracer.utils import json_dumps
+
+        traces = []
+        for i, fn_name in enumerate(("iam.CreateUser", "iam.CreateGroup", "iam.AddUserToGroup")):
+            t = Trace()
+            t.start()
+            t.set_input(fn_name, {"UserName": "u", "GroupName": "g"} if i == 2 else {("UserName", "GroupName")[i]: "ug"[i]})
+            t.set_output("reqid{}".format(i), fn_name, {})
+            t.finish()
+            # recorded 9 seconds apart
+            t.ts_start = datetime.datetime(2020, 4, 1, 12, 0, 9 * i)
+            t.ts_end = t.ts_start
+            traces.append(t.to_dict())
+        data = json_dumps(traces)
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmpdir, "play.checkpoint")
+
+            # the first run stops when adding the user to the group fails
+            with TracePlayer(io.StringIO(data), {"UserName": "x"}, prompt_color=False, region="us-east-1", direct=True) as tp:
+                tp.find_connections()
+                tp.prune_connections()
+                _, client, _ = tp._get_client("iam.CreateUser", None, "us-east-1", None)
+                with Stubber(client) as stubber:
+                    stubber.add_response("create_user", {"User": {"UserName": "x", "Path": "/", "UserId": "a" * 16,
+                                                                  "Arn": "arn:aws:iam::123456789012:user/x",
+                                                                  "CreateDate": "2020-01-01T00:00:00Z"},
+                                                         "ResponseMetadata": {"RequestId": "reqid3"}})
+                    stubber.add_response("create_group", {"Group": {"GroupName": "g", "Path": "/", "GroupId": "b" * 16,
+                                                                    "Arn": "arn:aws:iam::123456789012:group/g",
+                                                                    "CreateDate": "2020-01-01T00:00:00Z"},
+                                                          "ResponseMetadata": {"RequestId": "reqid4"}})
+                    stubber.add_client_error("add_user_to_group", "NoSuchEntity", response_meta={"RequestId": "reqid5"})
+                    with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+                        play_checkpointed(tp, Checkpoint(filename, "abc", {"UserName": "x"}), sleep_delay=0)
+                    stubber.assert_no_pending_responses()
+
+            # resuming only plays what failed before
+            with TracePlayer(io.StringIO(data), {"UserName": "x"}, prompt_color=False, region="us-east-1", direct=True) as tp:
+                tp.find_connections()
+                tp.prune_connections()
+                _, client, _ = tp._get_client("iam.CreateUser", None, "us-east-1", None)
+                with Stubber(client) as stubber:
+                    stubber.add_response("add_user_to_group", {"ResponseMetadata": {"RequestId": "reqid6"}},
+                                         {"UserName": "x", "GroupName": "g"})
+                    f = io.StringIO()
+                    # the recorded gaps before and after the resumed traces
+                    # aren't waited for
+                    with redirect_stdout(f), redirect_stderr(io.StringIO()), mock.patch("awstracer.player.time.sleep") as sleep:
+                        play_checkpointed(tp, Checkpoint(filename, "abc", {"UserName": "x"}), resume=True)
+                    stubber.assert_no_pending_responses()
+                    sleep.assert_not_called()
+                self.assertEqual(f.getvalue().count("(play)"), 1)
+                self.assertEqual(tp._play_results[1].request_id, "reqid3")
+                self.assertEqual(tp._play_results[3].request_id, "reqid6")
+            self.assertEqual(sorted(Checkpoint(filename, "abc", {"UserName": "x"}).load().keys()), [1, 2, 3])
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_player_main_errors(self):
+        import os
+        import shutil
+        import tempfile
+        from unittest import mock
+        from awstracer.player import main
+        from awstracer.tracer import Trace
+        from awstracer.utils import json_dumps
+
+        t = Trace()
+        t.start()
+        t.set_input("iam.CreateUser", {"UserName": "u"})
+        t.set_output("reqid1", "iam.CreateUser", {})
+        t.finish()
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmpdir, "trace.json")
+            with open(filename, "w") as fd:
+                fd.write(json_dumps([t.to_dict()]))
+            missing = os.path.join(tmpdir, "missing", "play.checkpoint")
+            for args, expected in ((["--trace-file", filename + ".missing"], "Failed to open {}.missing".format(filename)),
+                                   (["--trace-file", filename, "--checkpoint", missing], "Failed to write the checkpoint {}".format(missing))):
+                with mock.patch("sys.argv", ["awstrace-play"] + args), redirect_stdout(io.StringIO()), \
+                        redirect_stderr(io.StringIO()), self.assertLogs("player", "ERROR") as logs, self.assertRaises(SystemExit):
+                    main()
+                self.assertEqual(len(logs.records), 1)
+                self.assertTrue(logs.records[0].getMessage().startswith(expected), logs.records[0].getMessage())
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_player_group_fewer_calls(self):
+        from unittest import mock
+        from awstracer.player import TracePlayer
+        from awstracer.tracer import Trace
+        from awstracer.utils import json_dumps
+
+        def make_trace(fn_name, inparams, outparams, group=None):
+            t = Trace()
+            t.start()
+            t.set_input(fn_name, inparams)
+            t.set_output("reqid", fn_name, outparams)
+            t.finish()
+            if group is not None:
+                t.group = group
+                t.command = ["s3", "sync", ".", "s3://bucket-1/"]
+            return t
+
+        # the second upload of the sync isn't made when it is played again
+        # so only the command depending on it can't be played
+        traces = [make_trace("s3.ListObjectsV2", {"Bucket": "bucket-1"}, {"KeyCount": 0}, "sync"),
+                  make_trace("s3.PutObject", {"Bucket": "bucket-1", "Key": "file-1"}, {"ETag": "etag-1"}, "sync"),
+                  make_trace("s3.PutObject", {"Bucket": "bucket-1", "Key": "file-2"}, {"VersionId": "version-2"}, "sync"),
+                  make_trace("s3.HeadObject", {"Bucket": "bucket-1", "Key": "file-2", "VersionId": "version-2"}, {}),
+                  make_trace("s3.ListBuckets", {}, {"Buckets": []})]
+        data = json_dumps([t.to_dict() for t in traces])
+        for jobs in (1, 2):
+            with TracePlayer(io.StringIO(data), {}, prompt_color=False) as tp:
+                tp.find_connections()
+                tp.prune_connections()
+                played = [Trace.from_dict(t.to_dict()) for t in traces[:2]]
+                with mock.patch.object(tp, "run_aws_cmd_traces", return_value=played), \
+                        mock.patch.object(tp, "_run_trace", side_effect=lambda trace, poc, replace_vars: trace) as run, \
+                        redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+                    tp.play_trace(sleep_delay=0, jobs=jobs)
+                self.assertEqual([c.args[0].fn_name for c in run.call_args_list], ["s3.ListBuckets"])
+                self.assertEqual(sorted(tp._play_results), [0, 1, 2, 5])
+                self.assertEqual(tp.get_play_summary(), (3, 0, 2))
+
+    def test_player_speed_and_poll(self):
+        from datetime import timedelta
+        from unittest import mock
+        from botocore.stub import Stubber
+        from awstracer.player import TracePlayer
+        from awstracer.tracer import Trace
+        from awstracer.utils import json_dumps
+
+        t1 = Trace()
+        t1.start()
+        t1.set_input("dynamodb.CreateTable", {"TableName": "music", "BillingMode": "PAY_PER_REQUEST",
+                                              "AttributeDefinitions": [{"AttributeName": "a", "AttributeType": "S"}],
+                                              "KeySchema": [{"AttributeName": "a", "KeyType": "HASH"}]})
+        t1.set_output("reqid1", "dynamodb.CreateTable", {"TableDescription": {"TableName": "music"}})
+        t1.finish()
+        t2 = Trace()
+        t2.set_input("dynamodb.DescribeTable", {"TableName": "music"})
+        t2.set_output("reqid2", "dynamodb.DescribeTable", {"Table": {"TableName": "music"}})
+        t2.ts_start = t1.ts_end + timedelta(seconds=10)
+        t2.ts_end = t2.ts_start
+        inp = io.StringIO(json_dumps([t1.to_dict(), t2.to_dict()]))
+        with TracePlayer(inp, {}, prompt_color=False, region="us-east-1", direct=True) as tp:
+            tp.find_connections()
+            tp.prune_connections()
+            self.assertEqual(tp.get_gap(2), 10)
+            self.assertEqual(tp.get_gap(2, speed=10), 1)
+            self.assertEqual(tp.get_gap(2, speed=0.5), 20)
+            self.assertEqual(tp.get_gap(2, speed=0.5, max_gap=5), 5)
+            self.assertEqual(tp.get_gap(2, speed=0), 0)
+
+            # with polling the gap isn't replayed but the dependent call is
+            # retried until it succeeds
+            _, client, _ = tp._get_client("dynamodb.CreateTable", None, "us-east-1", None)
+            with Stubber(client) as stubber, mock.patch("awstracer.player.time.sleep") as sleep:
+                stubber.add_response("create_table", {"TableDescription": {"TableName": "music"},
+                                                      "ResponseMetadata": {"RequestId": "reqid3"}})
+                stubber.add_client_error("describe_table", "ResourceNotFoundException",
+                                         response_meta={"RequestId": "reqid4"})
+                stubber.add_response("describe_table", {"Table": {"TableName": "music"},
+                                                        "ResponseMetadata": {"RequestId": "reqid5"}})
+                with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+                    tp.play_trace(poll_timeout=60)
+                stubber.assert_no_pending_responses()
+            self.assertEqual(tp._play_results[2].request_id, "reqid5")
+            self.assertEqual([c.args[0] for c in sleep.call_args_list], [0.5])
+
+            # calls that don't depend on anything aren't retried
+            with Stubber(client) as stubber, mock.patch("awstracer.player.time.sleep") as sleep:
+                stubber.add_client_error("create_table", "LimitExceededException", response_meta={"RequestId": "reqid6"})
+                with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+                    tp.play_trace(poll_timeout=60)
+                stubber.assert_no_pending_responses()
+            self.assertIsNone(tp._play_results[1])
+            sleep.assert_not_called()
+
+    def test_player_wait_for_resources(self):
+        from unittest import mock
+        from botocore.stub import Stubber
+        from awstracer.player import TracePlayer
+        from awstracer.tracer import Trace
+        from awstracer.utils import json_dumps
+
+        t1 = Trace()
+        t1.start()
+        t1.set_input("dynamodb.CreateTable", {"TableName": "music", "BillingMode": "PAY_PER_REQUEST",
+                                              "AttributeDefinitions": [{"AttributeName": "a", "AttributeType": "S"}],
+                                              "KeySchema": [{"AttributeName": "a", "KeyType": "HASH"}]})
+        t1.set_output("reqid1", "dynamodb.CreateTable", {"TableDescription": {"TableName": "music"}})
+        t1.finish()
+        t2 = Trace()
+        t2.start()
+        t2.set_input("dynamodb.PutItem", {"TableName": "music", "Item": {"a": {"S": "b"}}})
+        t2.set_output("reqid2", "dynamodb.PutItem", {})
+        t2.finish()
+        inp = io.StringIO(json_dumps([t1.to_dict(), t2.to_dict()]))
+        with TracePlayer(inp, {}, prompt_color=False, region="us-east-1", direct=True) as tp:
+            tp.find_connections()
+            tp.prune_connections()
+            _, client, _ = tp._get_client("dynamodb.CreateTable", None, "us-east-1", None)
+            with Stubber(client) as stubber, mock.patch("time.sleep") as sleep:
+                stubber.add_response("create_table", {"TableDescription": {"TableName": "music", "TableStatus": "CREATING"},
+                                                      "ResponseMetadata": {"RequestId": "reqid3"}})
+                # the table_exists waiter keeps describing the table until it is active
+                for status in ("CREATING", "ACTIVE"):
+                    stubber.add_response("describe_table", {"Table": {"TableName": "music", "TableStatus": status},
+                                                            "ResponseMetadata": {"RequestId": "reqid4"}}, {"TableName": "music"})
+                stubber.add_response("put_item", {"ResponseMetadata": {"RequestId": "reqid5"}}, t2.inparams)
+                with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+                    tp.play_trace(wait_timeout=60)
+                stubber.assert_no_pending_responses()
+            self.assertEqual(tp._play_results[2].request_id, "reqid5")
+            self.assertEqual([c.args[0] for c in sleep.call_args_list], [2])
+
+        # the trace gets retried instead when the waiter can't be used at all
+        from botocore.exceptions import ClientError, NoCredentialsError, ParamValidationError
+        errors = [ValueError("unknown service"), NoCredentialsError(), ParamValidationError(report="bad"),
+                  ClientError({"Error": {"Code": "AccessDeniedException"}}, "DescribeTable")]
+        for error in errors:
+            inp.seek(0)
+            with TracePlayer(inp, {}, prompt_color=False, region="us-east-1", direct=True) as tp:
+                tp.find_connections()
+                tp.prune_connections()
+                _, client, _ = tp._get_client("dynamodb.CreateTable", None, "us-east-1", None)
+                with Stubber(client) as stubber, mock.patch("time.sleep") as sleep, \
+                        mock.patch.object(tp, "wait_for_resource", side_effect=error):
+                    stubber.add_response("create_table", {"TableDescription": {"TableName": "music"},
+                                                          "ResponseMetadata": {"RequestId": "reqid3"}})
+                    stubber.add_client_error("put_item", "ResourceNotFoundException", response_meta={"RequestId": "reqid4"})
+                    stubber.add_response("put_item", {"ResponseMetadata": {"RequestId": "reqid5"}}, t2.inparams)
+                    with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+                        tp.play_trace(wait_timeout=60)
+                    stubber.assert_no_pending_responses()
+                self.assertEqual(tp._play_results[2].request_id, "reqid5")
+                self.assertEqual(sleep.call_count, 1)
+
+    def test_play_players_jobs(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from unittest import mock
+        from awstracer.player import TARGET_JOBS, play_players
+
+        def make_player(i):
+            tp = mock.Mock(label="#{}".format(i))
+            tp.get_play_summary.return_value = (1, 0, 0)
+            return tp
+
+        # at most TARGET_JOBS players are played at the same time by default
+        with mock.patch("awstracer.player.ThreadPoolExecutor", wraps=ThreadPoolExecutor) as pool:
+            play_players([make_player(i) for i in range(3)])
+            results = play_players([make_player(i) for i in range(20)])
+            play_players([make_player(i) for i in range(20)], 12)
+        self.assertEqual([c.kwargs["max_workers"] for c in pool.call_args_list], [3, TARGET_JOBS, 12])
+        self.assertEqual([(r.label, r.ok) for r in results], [("#{}".format(i), True) for i in range(20)])
+
+    def test_player_targets(self):
+        import os
+        from unittest import mock
+        from awstracer.player import TracePlayer, play_targets, print_play_results
+        from awstracer.server import TraceServer
+        from awstracer.tracer import Trace
+        from awstracer.utils import json_dumps
+
+        t1 = Trace()
+        t1.start()
+        t1.set_input("dynamodb.CreateTable", {"TableName": "music", "BillingMode": "PAY_PER_REQUEST",
+                                              "AttributeDefinitions": [{"AttributeName": "a", "AttributeType": "S"}],
+                                              "KeySchema": [{"AttributeName": "a", "KeyType": "HASH"}]})
+        t1.set_output("reqid1", "dynamodb.CreateTable", {"TableDescription": {"TableName": "music"}})
+        t1.finish()
+        t2 = Trace()
+        t2.start()
+        t2.set_input("dynamodb.DescribeTable", {"TableName": "music"})
+        t2.set_output("reqid2", "dynamodb.DescribeTable", {"Table": {"TableName": "music"}})
+        t2.finish()
+        inp = io.StringIO(json_dumps([t1.to_dict(), t2.to_dict()]))
+        with TracePlayer(inp, {}, prompt_color=False) as tp:
+            tp.find_connections()
+            tp.prune_connections()
+            targets = [(None, "us-east-1"), (None, "eu-west-1"), (None, "ap-south-1")]
+            f = io.StringIO()
+            with redirect_stdout(f):
+                results = play_targets(tp, targets, dryrun=True, sleep_delay=0)
+            self.assertEqual([(r.label, r.succeeded, r.failed, r.skipped, r.ok) for r in results],
+                             [("default/" + region, 2, 0, 0, True) for _, region in targets])
+            self.assertNotEqual(f.getvalue().find("(play default/eu-west-1) aws dynamodb describe-table --table-name music --region eu-west-1"), -1)
+            # the original player is left alone
+            self.assertIsNone(tp.region)
+            self.assertIsNone(tp.label)
+
+            # every target gets its own results
+            env = {"AWS_ACCESS_KEY_ID": "akid", "AWS_SECRET_ACCESS_KEY": "secret"}
+            with mock.patch.dict(os.environ, env), TraceServer([Trace.from_dict(t1.to_dict())]) as server:
+                tp.endpoint = server.url
+                tp.direct = True
+                with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+                    results = play_targets(tp, targets, 2, sleep_delay=0, jobs=1)
+            self.assertEqual([(r.succeeded, r.failed, r.skipped, r.ok) for r in results], [(1, 1, 0, False)] * 3)
+
+            f = io.StringIO()
+            with redirect_stdout(f):
+                print_play_results(results)
+            self.assertNotEqual(f.getvalue().find("0 out of 3 replays played without errors"), -1)
+
+    def test_player_sweep(self):
+        import os
+        import tempfile
+        from unittest import mock
+        from awstracer.player import TracePlayer, play_sweep, read_sweep_file
+        from awstracer.tracer import Trace
+        from awstracer.utils import json_dumps
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fn = os.path.join(tmpdir, "sweep.csv")
+            with open(fn, "w") as fd:
+                fd.write("table-name,BillingMode\nt1,\nt2,PROVISIONED\n")
+            self.assertEqual(read_sweep_file(fn), [{"TableName": "t1"}, {"TableName": "t2", "BillingMode": "PROVISIONED"}])
+            fn = os.path.join(tmpdir, "sweep.jsonl")
+            with open(fn, "w") as fd:
+                fd.write("{\"table-name\": \"t1\"}\n\n{\"TableName\": \"t2\"}\n")
+            self.assertEqual(read_sweep_file(fn), [{"TableName": "t1"}, {"TableName": "t2"}])
+            with open(fn, "w") as fd:
+                fd.write("[1]\n")
+            with self.assertRaises(ValueError):
+                read_sweep_file(fn)
+
+        t1 = Trace()
+        t1.start()
+        t1.set_input("dynamodb.CreateTable", {"TableName": "music", "BillingMode": "PAY_PER_REQUEST"})
+        t1.set_output("reqid1", "dynamodb.CreateTable", {"TableDescription": {"TableName": "music"}})
+        t1.finish()
+        t2 = Trace()
+        t2.start()
+        t2.set_input("dynamodb.DescribeTable", {"TableName": "music"})
+        t2.set_output("reqid2", "dynamodb.DescribeTable", {"Table": {"TableName": "music"}})
+        t2.finish()
+        inp = io.StringIO(json_dumps([t1.to_dict(), t2.to_dict()]))
+        sweep = [{"TableName": "table{}".format(i)} for i in range(5)] + [{"BillingMode": "PROVISIONED"}]
+        with TracePlayer(inp, {"BillingMode": "ON_DEMAND"}, prompt_color=False) as tp:
+            f = io.StringIO()
+            with redirect_stdout(f), mock.patch.object(tp, "find_connections", wraps=tp.find_connections) as find:
+                results = play_sweep(tp, sweep, target_jobs=2, dryrun=True, sleep_delay=0, jobs=2)
+            # the connections are only found once for every set of parameter names
+            self.assertEqual(find.call_count, 2)
+            self.assertEqual([(r.label, r.ok) for r in results], [("#{}".format(i + 1), True) for i in range(6)])
+            out = f.getvalue()
+            for i in range(5):
+                self.assertNotEqual(out.find("(play #{}) aws dynamodb create-table --table-name table{} --billing-mode ON_DEMAND".format(i + 1, i)), -1)
+                self.assertNotEqual(out.find("(play #{}) aws dynamodb describe-table --table-name table{}".format(i + 1, i)), -1)
+            self.assertNotEqual(out.find("(play #6) aws dynamodb create-table --table-name music --billing-mode PROVISIONED"), -1)
+            self.assertNotEqual(out.find("(play #6) aws dynamodb describe-table --table-name music"), -1)
+
+            # and every set is played under every target
+            with redirect_stdout(io.StringIO()):
+                results = play_sweep(tp, sweep[:2], [(None, "r1"), (None, "r2")], dryrun=True, sleep_delay=0)
+            self.assertEqual([r.label for r in results], ["#1 default/r1", "#1 default/r2", "#2 default/r1", "#2 default/r2"])
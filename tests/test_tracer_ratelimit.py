@@ -0,0 +1,75 @@
+import unittest
+from unittest import mock
+
+
+class TestRateLimit(unittest.TestCase):
+    def test_is_throttling(self):
+        from awstracer.ratelimit import is_throttling
+        self.assertTrue(is_throttling("ThrottlingException"))
+        self.assertTrue(is_throttling("RequestLimitExceeded"))
+        self.assertFalse(is_throttling("AccessDenied"))
+        self.assertFalse(is_throttling(None))
+
+    def test_token_bucket(self):
+        from awstracer.ratelimit import MIN_RATE, TokenBucket
+        now = [100.0]
+        with mock.patch("awstracer.ratelimit.time.monotonic", side_effect=lambda: now[0]), \
+                mock.patch("awstracer.ratelimit.time.sleep") as sleep:
+            # no limit until throttled
+            b = TokenBucket()
+            for _ in range(10):
+                b.acquire()
+            sleep.assert_not_called()
+
+            # then half of the rate measured before
+            b.was_throttled()
+            self.assertEqual(b.throttled, 1)
+            self.assertEqual(b.rate, 2.5)
+            b.acquire()
+            sleep.assert_called_once_with(0.4)
+            b.succeeded()
+            self.assertEqual(b.rate, 2.9)
+
+            # throttled calls at the same time only count once
+            now[0] += 1
+            b.was_throttled()
+            b.was_throttled()
+            self.assertEqual(b.throttled, 3)
+            self.assertEqual(b.rate, 1.45)
+            for _ in range(10):
+                now[0] += 1
+                b.was_throttled()
+            self.assertEqual(b.rate, MIN_RATE)
+
+            # a maximum rate limits the calls from the start
+            sleep.reset_mock()
+            b = TokenBucket(max_rate=2)
+            b.acquire()
+            b.acquire()
+            sleep.assert_not_called()
+            b.acquire()
+            sleep.assert_called_once_with(0.5)
+            for _ in range(10):
+                b.succeeded()
+            self.assertEqual(b.rate, 2)
+
+            b = TokenBucket()
+            self.assertEqual(b.get_achieved_rate(), 0)
+            for _ in range(3):
+                b.acquire()
+                now[0] += 1
+            self.assertEqual(b.get_achieved_rate(), 1.5)
+
+    def test_rate_limiter(self):
+        from awstracer.ratelimit import RateLimiter
+        limiter = RateLimiter(max_rate=100)
+        b1 = limiter.get_bucket("iam", "p1", "r1")
+        self.assertIs(b1, limiter.get_bucket("iam", "p1", "r1"))
+        self.assertIsNot(b1, limiter.get_bucket("iam", "p2", "r1"))
+        b1.acquire()
+        b1.was_throttled()
+        summary = limiter.get_summary()
+        self.assertEqual([s[0] for s in summary], [("iam", "p1", "r1"), ("iam", "p2", "r1")])
+        self.assertEqual(summary[0][1], 1)
+        self.assertEqual(summary[0][3], 1)
+        self.assertEqual(summary[1][1:], (0, 0.0, 0))
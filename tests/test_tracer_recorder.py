@@ -1,4 +1,5 @@
 import io
+import os
 import tempfile
 import unittest
 import uuid
@@ -16,7 +17,7 @@ class TestRecorder(unittest.TestCase):
                 with redirect_stderr(io.StringIO()):
                     opt_parser([])
         ns = opt_parser(["--trace-file", "bla"])
-        opts = ("prompt_color", "prompt_on_misc", "prompt_on_save", "enable_misc_cmd", "trace_file")
+        opts = ("prompt_color", "prompt_on_misc", "prompt_on_save", "enable_misc_cmd", "reuse_session", "trace_file")
         for opt in opts:
             self.assertIn(opt, ns)
         self.assertEqual(ns.trace_file, "bla")
@@ -25,6 +26,19 @@ class TestRecorder(unittest.TestCase):
         self.assertTrue(ns.prompt_on_save)
         self.assertTrue(ns.prompt_on_misc)
         self.assertFalse(ns.enable_misc_cmd)
+        self.assertTrue(ns.reuse_session)
+        self.assertIsNone(ns.trace_format)
+        self.assertEqual(ns.flush_every, 1)
+        self.assertFalse(ns.fsync)
+        self.assertFalse(ns.append)
+        ns = opt_parser(["--trace-file", "bla", "--format", "jsonl", "--flush", "10", "--fsync", "--append"])
+        self.assertEqual(ns.trace_format, "jsonl")
+        self.assertEqual(ns.flush_every, 10)
+        self.assertTrue(ns.fsync)
+        self.assertTrue(ns.append)
+        with self.assertRaises(SystemExit):
+            with redirect_stderr(io.StringIO()):
+                opt_parser(["--trace-file", "bla", "--flush", "0"])
         ns = opt_parser(["--trace-file", "bla", "-c", "-n", "-s", "-d"])
         self.assertFalse(ns.prompt_color)
         self.assertFalse(ns.prompt_on_save)
@@ -67,3 +81,73 @@ class TestRecorder(unittest.TestCase):
         args = tr.process_file_arguments(["aws", "bla", "bla", "file://{}".format(tp.name)])
         self.assertEqual(len(args), 4)
         self.assertEqual(args[3], "hello w0rld")
+
+    def test_recorder_formats(self):
+        from awstracer.recorder import TraceRecorder
+        from awstracer.tracefile import read_traces
+        from awstracer.tracer import Trace
+        with self.assertRaises(ValueError):
+            TraceRecorder(uuid.uuid4().hex, trace_format="bla")
+
+        t = Trace()
+        t.start()
+        t.set_input("bla.wut", {"a": "b"})
+        t.set_output("reqid", "bla.wut", {"c": "d"})
+        t.finish()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            # traces are only written on exit for the json format
+            fn = "{}/trace.json".format(tmpdir)
+            with TraceRecorder(fn, prompt_on_save=False) as tr:
+                self.assertEqual(tr.trace_format, "json")
+                tr.add_trace(t)
+                self.assertEqual(len(tr.traces), 1)
+                self.assertFalse(os.path.exists(fn))
+            with open(fn, "rb") as fd:
+                self.assertEqual(list(read_traces(fd)), [t.to_dict()])
+
+            # and immediately for the jsonl format
+            fn = "{}/trace.jsonl".format(tmpdir)
+            with TraceRecorder(fn, prompt_on_save=False) as tr:
+                self.assertEqual(tr.trace_format, "jsonl")
+                tr.add_trace(t)
+                tr.add_trace(t)
+                self.assertEqual(len(tr.traces), 0)
+                with open(fn, "rb") as fd:
+                    self.assertEqual(list(read_traces(fd)), [t.to_dict(), t.to_dict()])
+
+            # a new recording replaces the old one unless appending to it
+            with TraceRecorder(fn, prompt_on_save=False) as tr:
+                tr.add_trace(t)
+            with open(fn, "rb") as fd:
+                self.assertEqual(len(list(read_traces(fd))), 1)
+            with TraceRecorder(fn, prompt_on_save=False, append=True) as tr:
+                tr.add_trace(t)
+            with open(fn, "rb") as fd:
+                self.assertEqual(len(list(read_traces(fd))), 2)
+            with self.assertRaises(ValueError):
+                TraceRecorder("{}/trace.json".format(tmpdir), append=True)
+
+    def test_recorder_compression(self):
+        from awstracer.recorder import TraceRecorder, opt_parser
+        from awstracer.tracefile import read_traces
+        from awstracer.tracer import Trace
+        ns = opt_parser(["--trace-file", "bla"])
+        self.assertIsNone(ns.compression)
+        ns = opt_parser(["--trace-file", "bla", "--compress", "xz"])
+        self.assertEqual(ns.compression, "xz")
+        with self.assertRaises(ValueError):
+            TraceRecorder(uuid.uuid4().hex, compression="bla")
+
+        t = Trace()
+        t.start()
+        t.set_input("bla.wut", {"a": "b"})
+        t.finish()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for fn in ("trace.json.gz", "trace.jsonl.bz2"):
+                fn = "{}/{}".format(tmpdir, fn)
+                with TraceRecorder(fn, prompt_on_save=False) as tr:
+                    tr.add_trace(t)
+                with open(fn, "rb") as fd:
+                    self.assertNotEqual(fd.read(1), b"[")
+                    fd.seek(0)
+                    self.assertEqual(list(read_traces(fd)), [t.to_dict()])
@@ -0,0 +1,231 @@
+import io
+import json
+import os
+import time
+import unittest
+from contextlib import redirect_stderr, redirect_stdout
+from datetime import datetime, timezone
+from unittest import mock
+
+_CREDENTIALS = {"AWS_ACCESS_KEY_ID": "akid", "AWS_SECRET_ACCESS_KEY": "secret", "AWS_DEFAULT_REGION": "us-east-1"}
+
+
+def _trace(fn_name, outparams, request_id="reqid", inparams={}):
+    from awstracer.tracer import Trace
+    t = Trace()
+    t.start()
+    t.set_input(fn_name, inparams)
+    t.set_output(request_id, fn_name, outparams)
+    t.finish()
+    return t
+
+
+class TestServer(unittest.TestCase):
+    def setUp(self):
+        # awscli adds its data path to the environment when it is imported,
+        # which restoring the environment would otherwise undo
+        import awscli  # noqa: F401
+        patcher = mock.patch.dict(os.environ, _CREDENTIALS)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _client(self, server, service_name):
+        import botocore.session
+        session = botocore.session.get_session()
+        return session.create_client(service_name, endpoint_url=server.url, region_name="us-east-1")
+
+    def test_options(self):
+        from awstracer.server import opt_parser
+        with self.assertRaises(SystemExit):
+            with redirect_stdout(io.StringIO()):
+                with redirect_stderr(io.StringIO()):
+                    opt_parser([])
+        with self.assertRaises(SystemExit):
+            with redirect_stderr(io.StringIO()):
+                opt_parser(["--trace-file", "bla", "--latency", "dynamodb.ListTables", "-1"])
+        with self.assertRaises(SystemExit):
+            with redirect_stderr(io.StringIO()):
+                opt_parser(["--trace-file", "bla", "--default-latency", "-1"])
+        ns = opt_parser(["--trace-file", "bla"])
+        self.assertEqual(ns.trace_file, "bla")
+        self.assertEqual(ns.host, "127.0.0.1")
+        self.assertEqual(ns.port, 8000)
+        self.assertEqual(ns.latencies, {})
+        self.assertEqual(ns.default_latency, 0)
+        ns = opt_parser(["--trace-file", "bla", "--latency", "dynamodb.ListTables", "0.5", "--default-latency", "0.1"])
+        self.assertEqual(ns.latencies, {"dynamodb.ListTables": 0.5})
+        self.assertEqual(ns.default_latency, 0.1)
+
+    def test_serve_protocols(self):
+        from awstracer.server import TraceServer
+        created = datetime(2020, 4, 1, 12, 30, 1, tzinfo=timezone.utc)
+        traces = [
+            # json
+            _trace("dynamodb.ListTables", {"TableNames": ["table1", "table2"]}, "reqid1"),
+            _trace("dynamodb.DescribeTable", {"Table": {"TableName": "table1", "CreationDateTime": created,
+                                                        "ItemCount": 3}}, "reqid2"),
+            # query
+            _trace("iam.GetUser", {"User": {"UserName": "u", "UserId": "id", "Path": "/", "Arn": "arn:aws:iam::1:user/u",
+                                            "CreateDate": created, "Tags": [{"Key": "k", "Value": "v"}]}}, "reqid3"),
+            # ec2
+            _trace("ec2.DescribeVpcs", {"Vpcs": [{"VpcId": "vpc-1", "IsDefault": True, "CidrBlock": "10.0.0.0/16"}]}, "reqid4"),
+            # rest-json
+            _trace("lambda.GetFunction", {"Configuration": {"FunctionName": "f", "MemorySize": 128},
+                                          "Tags": {"a": "b"}}, "reqid5"),
+            # rest-xml
+            _trace("s3.ListBuckets", {"Buckets": [{"Name": "b1", "CreationDate": created}],
+                                      "Owner": {"ID": "o"}}, "reqid6"),
+        ]
+        with TraceServer(traces) as server:
+            ret = self._client(server, "dynamodb").list_tables()
+            self.assertEqual(ret["TableNames"], ["table1", "table2"])
+            self.assertEqual(ret["ResponseMetadata"]["RequestId"], "reqid1")
+            ret = self._client(server, "dynamodb").describe_table(TableName="table1")
+            self.assertEqual(ret["Table"], traces[1].outparams["Table"])
+
+            ret = self._client(server, "iam").get_user()
+            self.assertEqual(ret["User"], traces[2].outparams["User"])
+            self.assertEqual(ret["ResponseMetadata"]["RequestId"], "reqid3")
+
+            ret = self._client(server, "ec2").describe_vpcs()
+            self.assertEqual(ret["Vpcs"], traces[3].outparams["Vpcs"])
+
+            ret = self._client(server, "lambda").get_function(FunctionName="f")
+            self.assertEqual(ret["Configuration"], traces[4].outparams["Configuration"])
+            self.assertEqual(ret["Tags"], {"a": "b"})
+
+            ret = self._client(server, "s3").list_buckets()
+            self.assertEqual(ret["Buckets"], traces[5].outparams["Buckets"])
+            self.assertEqual(ret["Owner"], {"ID": "o"})
+
+            # nothing got recorded for this call so it fails
+            from botocore.exceptions import ClientError
+            with self.assertRaises(ClientError) as cm:
+                self._client(server, "iam").list_users()
+            self.assertEqual(cm.exception.response["Error"]["Code"], "NoRecordedResponse")
+
+    def test_serve_in_turn(self):
+        from awstracer.server import TraceServer
+        traces = [_trace("dynamodb.ListTables", {"TableNames": ["table{}".format(i)]}) for i in range(2)]
+        with TraceServer(traces, latencies={"dynamodb.ListTables": 0.2}) as server:
+            client = self._client(server, "dynamodb")
+            start = time.time()
+            names = [client.list_tables()["TableNames"][0] for _ in range(3)]
+            self.assertGreaterEqual(time.time() - start, 0.6)
+        self.assertEqual(names, ["table0", "table1", "table0"])
+
+    def test_play_against_server(self):
+        from awstracer.player import TracePlayer
+        from awstracer.server import TraceServer
+        from awstracer.utils import json_dumps
+        t1 = _trace("iam.CreateUser", {"User": {"UserName": "u", "UserId": "id", "Path": "/", "Arn": "arn:aws:iam::1:user/u",
+                                                "CreateDate": datetime.now(timezone.utc)}},
+                    "reqid1", {"UserName": "u"})
+        t2 = _trace("iam.AttachUserPolicy", {}, "reqid2", {"UserName": "u", "PolicyArn": "arn:aws:iam::1:policy/p"})
+        with TraceServer([t1, t2]) as server:
+            inp = io.StringIO(json_dumps([t1.to_dict(), t2.to_dict()]))
+            with TracePlayer(inp, {}, prompt_color=False, endpoint=server.url, direct=True) as tp:
+                tp.find_connections()
+                tp.prune_connections()
+                with redirect_stdout(io.StringIO()):
+                    tp.play_trace(sleep_delay=0)
+                self.assertEqual(tp._play_results[1].request_id, "reqid1")
+                self.assertEqual(tp._play_results[2].request_id, "reqid2")
+
+    def test_play_quiet(self):
+        import shutil
+        import tempfile
+        from awstracer.output import OutputWriter
+        from awstracer.player import TracePlayer
+        from awstracer.server import TraceServer
+        from awstracer.utils import json_dumps
+        t1 = _trace("dynamodb.ListTables", {"TableNames": ["music"]}, "reqid1")
+        t2 = _trace("dynamodb.DescribeTable", {"Table": {"TableName": "music"}}, "reqid2", {"TableName": "music"})
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        with TraceServer([t1, t2]) as server:
+            for direct in (False, True):
+                directory = os.path.join(tmpdir, "direct" if direct else "cli")
+                inp = io.StringIO(json_dumps([t1.to_dict(), t2.to_dict()]))
+                with TracePlayer(inp, {}, prompt_color=False, endpoint=server.url, direct=direct) as tp:
+                    tp.find_connections()
+                    tp.prune_connections()
+                    tp.quiet = True
+                    tp.output_writer = OutputWriter(directory)
+                    f = io.StringIO()
+                    with redirect_stdout(f):
+                        tp.play_trace(sleep_delay=0)
+                    self.assertEqual(tp._play_results[1].outparams, {"TableNames": ["music"]})
+                    self.assertEqual(tp._play_results[2].request_id, "reqid2")
+                # only the commands are shown
+                self.assertEqual([line.split()[:3] for line in f.getvalue().splitlines()],
+                                 [["(play)", "aws", "dynamodb"], ["(play)", "aws", "dynamodb"]])
+                self.assertEqual(sorted(os.listdir(directory)), ["00001-dynamodb.ListTables.json", "00002-dynamodb.DescribeTable.json"])
+                with open(os.path.join(directory, "00002-dynamodb.DescribeTable.json"), "r") as fd:
+                    self.assertEqual(json.load(fd)["Table"], {"TableName": "music"})
+
+    def test_reuse_session_handlers(self):
+        from awstracer.server import TraceServer
+        from awstracer.tracer import TraceRunner
+        traces = [_trace("dynamodb.ListTables", {"TableNames": ["music"]})]
+        with TraceServer(traces) as server:
+            tr = TraceRunner()
+            args = ["dynamodb", "list-tables", "--endpoint-url", server.url]
+            counts = []
+            for _ in range(4):
+                with redirect_stdout(io.StringIO()):
+                    self.assertEqual(tr.run_aws_cmd(args).outparams, {"TableNames": ["music"]})
+                ev = tr._local.cli_sessions[(None, None, server.url)][0]
+                counts.append(len(list(ev._handlers.prefix_search("after-call.dynamodb.ListTables"))))
+            # the handlers the AWS CLI registers for every command don't pile up
+            self.assertEqual(len(set(counts)), 1)
+
+    def test_route_required_query(self):
+        from awstracer.server import TraceServer
+        traces = [_trace("s3.DeleteObject", {}, "reqid1"), _trace("s3.AbortMultipartUpload", {}, "reqid2")]
+        with TraceServer(traces) as server:
+            client = self._client(server, "s3")
+            # both operations share DELETE /{Bucket}/{Key+} but only aborting
+            # an upload has the required uploadId
+            self.assertEqual(client.delete_object(Bucket="b", Key="k")["ResponseMetadata"]["RequestId"], "reqid1")
+            resp = client.abort_multipart_upload(Bucket="b", Key="k", UploadId="u")
+            self.assertEqual(resp["ResponseMetadata"]["RequestId"], "reqid2")
+
+    def test_record_and_play_group(self):
+        import tempfile
+        from awstracer.player import TracePlayer
+        from awstracer.recorder import TraceRecorder
+        from awstracer.server import TraceServer
+        from awstracer.utils import json_dumps
+        modified = datetime(2020, 4, 1, 12, 30, 1, tzinfo=timezone.utc)
+        contents = [{"Key": key, "Size": 1, "LastModified": modified} for key in ("k1", "k2")]
+        traces = [_trace("s3.ListObjectsV2", {"Contents": contents, "KeyCount": 2, "IsTruncated": False}, "reqid1", {"Bucket": "b"}),
+                  _trace("s3.DeleteObject", {}, "reqid2", {"Bucket": "b", "Key": "k1"})]
+        with TraceServer(traces) as server:
+            command = ["s3", "rm", "s3://b/", "--recursive", "--endpoint-url", server.url]
+            with tempfile.NamedTemporaryFile(suffix=".json") as tmp:
+                tr = TraceRecorder(tmp.name, prompt_on_save=False)
+                with redirect_stdout(io.StringIO()):
+                    tr.run_aws_cmd(command)
+            # every call made by the command is recorded as part of a group
+            self.assertEqual([t.fn_name for t in tr.traces], ["s3.ListObjectsV2", "s3.DeleteObject", "s3.DeleteObject"])
+            self.assertEqual(sorted(t.inparams.get("Key") for t in tr.traces[1:]), ["k1", "k2"])
+            self.assertTrue(all(t.group == tr.traces[0].request_id for t in tr.traces))
+            self.assertTrue(all(t.command == command for t in tr.traces))
+
+            for dryrun in (True, False):
+                inp = io.StringIO(json_dumps([t.to_dict() for t in tr.traces]))
+                with TracePlayer(inp, {}, prompt_color=False, endpoint=server.url) as tp:
+                    tp.find_connections()
+                    tp.prune_connections()
+                    f = io.StringIO()
+                    with redirect_stdout(f):
+                        tp.play_trace(sleep_delay=0, dryrun=dryrun)
+                # the command is played once, as it was recorded
+                prompts = [line for line in f.getvalue().splitlines() if line.startswith("(play)")]
+                self.assertEqual(len(prompts), 1)
+                self.assertTrue(prompts[0].startswith("(play) aws s3 rm s3://b/ --recursive"))
+                self.assertEqual([tp._play_results[i].fn_name for i in range(1, 4)],
+                                 ["s3.ListObjectsV2", "s3.DeleteObject", "s3.DeleteObject"])
+                if not dryrun:
+                    self.assertEqual(tp._play_results[1].outparams["KeyCount"], 2)
@@ -0,0 +1,224 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stderr
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class TestTraceFile(unittest.TestCase):
+
+    def test_guess_format(self):
+        from awstracer.tracefile import guess_format, guess_compression
+        self.assertEqual(guess_format("bla.trace"), "json")
+        self.assertEqual(guess_format("bla.json"), "json")
+        self.assertEqual(guess_format("bla.jsonl"), "jsonl")
+        self.assertEqual(guess_format("bla.jsonl.gz"), "jsonl")
+        self.assertEqual(guess_format("bla.msgpack"), "msgpack")
+        self.assertEqual(guess_format("bla.mpk.zst"), "msgpack")
+        self.assertEqual(guess_format("bla.trace.xz"), "json")
+        self.assertEqual(guess_compression("bla.trace"), "none")
+        self.assertEqual(guess_compression("bla.trace.gz"), "gzip")
+        self.assertEqual(guess_compression("bla.jsonl.bz2"), "bz2")
+        self.assertEqual(guess_compression("bla.jsonl.xz"), "xz")
+        self.assertEqual(guess_compression("bla.msgpack.zst"), "zstd")
+
+    def test_read_traces(self):
+        from awstracer.tracefile import read_traces, write_traces
+        from awstracer.utils import json_dumps
+        traces = [{"a": 1, "ts": datetime.now()}, {"b": [2]}]
+
+        # array files as written by older versions
+        out = io.BytesIO()
+        write_traces(out, traces)
+        out.seek(0)
+        self.assertEqual(list(read_traces(out)), traces)
+        self.assertEqual(list(read_traces(io.StringIO("\n  [{\"a\": 1}]"))), [{"a": 1}])
+        self.assertEqual(list(read_traces(io.StringIO("[]"))), [])
+
+        # json lines files
+        data = "\n".join(json_dumps(t) for t in traces) + "\n"
+        self.assertEqual(list(read_traces(io.StringIO(data))), traces)
+        self.assertEqual(list(read_traces(io.BytesIO(data.encode("utf-8")))), traces)
+        self.assertEqual(list(read_traces(io.StringIO("\n" + data + "\n\n"))), traces)
+        self.assertEqual(list(read_traces(io.StringIO(""))), [])
+
+        # the traces should be read one by one
+        gen = read_traces(io.StringIO(data + "{broken\n"))
+        self.assertEqual(next(gen), traces[0])
+        self.assertEqual(next(gen), traces[1])
+        with self.assertRaises(ValueError):
+            next(gen)
+
+        # an incomplete last line is skipped
+        with redirect_stderr(io.StringIO()):
+            self.assertEqual(list(read_traces(io.StringIO(data + "{\"c\": [1, "))), traces)
+
+    def test_timestamps(self):
+        from awstracer.tracefile import read_traces, write_traces
+        now = datetime.now(timezone.utc)
+        traces = [{"a": [{"ts": now}, {"ts": "now"}]}, {"b": [now]}, {"c": 3}]
+        for fmt in ["json", "jsonl"]:
+            out = io.BytesIO()
+            write_traces(out, traces, fmt)
+            self.assertNotIn(b"_timestamps", out.getvalue())
+            out.seek(0)
+            self.assertEqual(list(read_traces(out)), traces)
+
+    def test_lazy_outparams(self):
+        from awstracer.tracefile import read_traces, write_traces, LazyValue
+        now = datetime.now()
+        traces = [{"inparams": {"a": 1}, "outparams": {"b": [{"ts": now}]}}, {"inparams": {}, "outparams": {}}]
+        formats = ["json", "jsonl"] + (["msgpack"] if msgpack else [])
+        for fmt in formats:
+            out = io.BytesIO()
+            write_traces(out, traces, fmt)
+            out.seek(0)
+            ret = list(read_traces(out, lazy_outparams=True))
+            self.assertEqual([t["inparams"] for t in ret], [t["inparams"] for t in traces])
+            for trace, expected in zip(ret, traces):
+                if fmt == "json":
+                    # array files are decoded in one go anyway
+                    self.assertEqual(trace["outparams"], expected["outparams"])
+                    continue
+                self.assertIsInstance(trace["outparams"], LazyValue)
+                self.assertEqual(trace["outparams"].decode(), expected["outparams"])
+
+    @unittest.skipIf(msgpack is None, "msgpack is not installed")
+    def test_lazy_msgpack_outparams(self):
+        from awstracer.tracefile import read_traces, write_traces
+        now = datetime.now()
+        traces = [{"inparams": {"a": i}, "outparams": {"b": [{"ts": now}] * i}} for i in range(200)] + [[1, 2]]
+        out = io.BytesIO()
+        write_traces(out, traces, "msgpack")
+        data = out.getvalue()
+        self.assertGreater(len(data), io.DEFAULT_BUFFER_SIZE)
+
+        # the outputs are never decoded while loading
+        with mock.patch("awstracer.tracefile._msgpack_ext_hook", side_effect=AssertionError):
+            ret = list(read_traces(io.BytesIO(data), lazy_outparams=True))
+        self.assertEqual(ret[:-1], [{"inparams": t["inparams"], "outparams": mock.ANY} for t in traces[:-1]])
+        self.assertEqual([t["outparams"].decode() for t in ret[:-1]], [t["outparams"] for t in traces[:-1]])
+        self.assertEqual(ret[-1], [1, 2])
+
+        # a partial trace at the end is skipped like before
+        ret = list(read_traces(io.BytesIO(data[:-5]), lazy_outparams=True))
+        self.assertEqual(len(ret), len(traces) - 2)
+
+    def test_trace_writer(self):
+        from awstracer.tracefile import TraceWriter, read_traces
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fn = os.path.join(tmpdir, "trace.jsonl")
+            with self.assertRaises(ValueError):
+                TraceWriter(fn, flush_every=0)
+            with TraceWriter(fn, flush_every=2) as writer:
+                # nothing is created until the first trace is written
+                self.assertFalse(os.path.exists(fn))
+                writer.write({"a": 1})
+                with open(fn, "rb") as fd:
+                    self.assertEqual(fd.read(), b"")
+                writer.write({"b": 2})
+                with open(fn, "rb") as fd:
+                    self.assertEqual(list(read_traces(fd)), [{"a": 1}, {"b": 2}])
+                writer.write({"c": 3})
+            with open(fn, "rb") as fd:
+                self.assertEqual(len(list(read_traces(fd))), 3)
+
+            # existing files are appended to when asked for
+            with TraceWriter(fn, fsync=True, append=True) as writer:
+                writer.write({"d": 4})
+                with open(fn, "rb") as fd:
+                    self.assertEqual(len(list(read_traces(fd))), 4)
+
+            # and replaced otherwise, but only once there is a trace
+            with TraceWriter(fn) as writer:
+                with open(fn, "rb") as fd:
+                    self.assertEqual(len(list(read_traces(fd))), 4)
+                writer.write({"e": 5})
+                writer.write({"f": 6})
+            with open(fn, "rb") as fd:
+                self.assertEqual(list(read_traces(fd)), [{"e": 5}, {"f": 6}])
+
+    def test_formats_and_compressions(self):
+        from awstracer.tracefile import FORMATS, COMPRESSIONS, TraceWriter, open_trace_file, read_traces, write_traces
+        traces = [
+            {"a": 1, "ts": datetime.now(), "b": {"c": [1, "2", None, True, 1.5]}},
+            {"ts": datetime(2020, 4, 1, 12, 30, 1, 5, tzinfo=timezone.utc)},
+            {"ts": datetime(1960, 4, 1, 12, 30, 1, tzinfo=timezone(timedelta(hours=-5, minutes=-30)))},
+        ]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for trace_format in FORMATS:
+                if trace_format == "msgpack" and msgpack is None:
+                    continue
+                for compression in COMPRESSIONS:
+                    if compression == "zstd" and zstandard is None:
+                        continue
+                    fn = os.path.join(tmpdir, "trace.{}.{}".format(trace_format, compression))
+                    with open_trace_file(fn, "wb", compression) as fd:
+                        write_traces(fd, traces, trace_format)
+                    with open_trace_file(fn) as fd:
+                        self.assertEqual(list(read_traces(fd)), traces, fn)
+                    if trace_format == "json":
+                        continue
+
+                    # streamed formats can be appended to
+                    with TraceWriter(fn, trace_format=trace_format, compression=compression, append=True) as writer:
+                        writer.write({"d": 4})
+                        writer.write({"e": 5})
+                    with open_trace_file(fn) as fd:
+                        self.assertEqual(list(read_traces(fd)), traces + [{"d": 4}, {"e": 5}], fn)
+            with self.assertRaises(ValueError):
+                TraceWriter(fn, trace_format="json")
+            with self.assertRaises(ValueError):
+                open_trace_file(fn, "wb", "bla")
+
+    def test_unclosed_compressed_writer(self):
+        from awstracer.tracefile import TraceWriter, read_traces
+        traces = [{"a": 1}, {"b": "x" * 100}, {"c": 3}]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for trace_format in ("jsonl", "msgpack"):
+                if trace_format == "msgpack" and msgpack is None:
+                    continue
+                for compression in ("gzip", "bz2", "xz", "zstd"):
+                    if compression == "zstd" and zstandard is None:
+                        continue
+                    fn = os.path.join(tmpdir, "trace.{}.{}".format(trace_format, compression))
+                    writer = TraceWriter(fn, trace_format=trace_format, compression=compression)
+                    for trace in traces:
+                        writer.write(trace)
+                    # everything flushed can be read while still recording
+                    with self.assertLogs("tracefile", "WARNING") if compression == "gzip" else contextlib.nullcontext():
+                        with open(fn, "rb") as fd:
+                            self.assertEqual(list(read_traces(fd)), traces, fn)
+                    # and also when the recording got killed halfway through
+                    # writing the last trace
+                    with open(fn, "rb") as fd:
+                        data = fd.read()
+                    if compression == "zstd":
+                        # zstandard reads the blocks it can without warning
+                        read = list(read_traces(io.BytesIO(data[:-8])))
+                    else:
+                        with self.assertLogs("tracefile", "WARNING"):
+                            read = list(read_traces(io.BytesIO(data[:-8])))
+                        self.assertGreaterEqual(len(read), 2, fn)
+                    self.assertEqual(read, traces[:len(read)], fn)
+                    writer.close()
+
+    @unittest.skipIf(msgpack is None, "msgpack is not installed")
+    def test_msgpack_size(self):
+        from awstracer.tracefile import msgpack_dumps
+        from awstracer.utils import json_dumps
+        d = {"ts": datetime.now()}
+        self.assertLess(len(msgpack_dumps(d)), len(json_dumps(d)) / 2)
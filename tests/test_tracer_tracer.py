@@ -193,3 +193,290 @@ class TestTracer(unittest.TestCase):
         ret = tr._create_clidriver(ev)
         self.assertIsNotNone(ret)
         self.assertIsInstance(ret, awscli.clidriver.CLIDriver)
+
+    def test_event_capturer_reset(self):
+        from awstracer.tracer import EventCapturer
+        ev = EventCapturer()
+        ev.emit("provide-client-params.bla.Wut", **{"params": {"a": "b"}})
+        old = ev.trace
+        ev.reset()
+        self.assertIsNot(old, ev.trace)
+        self.assertEqual(old.fn_name, "bla.Wut")
+        self.assertEqual(ev.trace.fn_name, "<not set>")
+        self.assertEqual(len(ev.events_captured), 0)
+
+    def test_session_key(self):
+        from awstracer.tracer import get_session_key
+        self.assertEqual(get_session_key(["s3", "ls"]), (None, None, None))
+        key = get_session_key(["--profile", "p1", "s3", "ls", "--region=r1", "--endpoint", "http://bla"])
+        self.assertEqual(key, ("p1", "r1", "http://bla"))
+        key = get_session_key(["ec2", "describe-regions", "--region-names", "r1", "--endpoint-url"])
+        self.assertEqual(key, (None, None, None))
+
+    def test_tracerunner_reuse(self):
+        from awstracer.tracer import TraceRunner
+        tr = TraceRunner()
+        self.assertTrue(tr.reuse_session)
+        ev1, driver1 = tr._get_clidriver(["s3", "ls"])
+        ev2, driver2 = tr._get_clidriver(["s3", "ls", "--region", "bla"])
+        ev3, driver3 = tr._get_clidriver(["s3", "ls"])
+        self.assertIs(driver1.session, driver3.session)
+        self.assertIs(ev1, ev3)
+        self.assertIsNot(driver1.session, driver2.session)
+        tr = TraceRunner(reuse_session=False)
+        ev1, driver1 = tr._get_clidriver(["s3", "ls"])
+        ev2, driver2 = tr._get_clidriver(["s3", "ls"])
+        self.assertIsNot(driver1, driver2)
+
+    def test_trace_paths(self):
+        from awstracer.tracer import get_path_value, replace_path_values
+        t = self.t
+        t.set_input("bla", {})
+        t.set_output("reqid", "bla", {"Reservations": [{"Instances": [{"InstanceId": "i-1"}, {"InstanceId": "i-2"}]}], "Id": "x"})
+        self.assertEqual(t.get_output_value("Id"), "x")
+        self.assertEqual(t.get_output_value("Reservations.0.Instances.1.InstanceId"), "i-2")
+        self.assertEqual(t.get_output_value("Reservations.0.Instances.1"), {"InstanceId": "i-2"})
+        self.assertIsNone(t.get_output_value("Reservations.1"))
+        self.assertIsNone(t.get_output_value("Reservations.x"))
+        self.assertIsNone(t.get_output_value("Id.x"))
+        self.assertIsNone(get_path_value({}, "bla"))
+
+        params = {"A": "a", "B": {"C": ["c1", "c2"], "D": "d"}}
+        ret = replace_path_values(params, {"A": "x", "B.C.1": "y", "B.D": "z"})
+        self.assertEqual(ret, {"A": "x", "B": {"C": ["c1", "y"], "D": "z"}})
+        # the original parameters should not have changed
+        self.assertEqual(params, {"A": "a", "B": {"C": ["c1", "c2"], "D": "d"}})
+        # nested values of replaced parameters are left alone, whatever the
+        # parameter was replaced with
+        value = {"C": ["a", "b"]}
+        ret = replace_path_values(params, {"B.C.0": "y", "B": value})
+        self.assertEqual(ret, {"B": {"C": ["a", "b"]}})
+        self.assertEqual(value, {"C": ["a", "b"]})
+        ret = replace_path_values(params, {"B.C.0": "y", "B": "x", "A": "z"})
+        self.assertEqual(ret, {"B": "x", "A": "z"})
+        ret = replace_path_values(params, {"B.C": value, "B.C.0": "y", "B.D": "z"})
+        self.assertEqual(ret, {"B": {"C": {"C": ["a", "b"]}, "D": "z"}})
+        self.assertEqual(value, {"C": ["a", "b"]})
+
+    def test_trace_lazy_outparams(self):
+        from awstracer.tracefile import LazyValue
+        decoded = []
+
+        def decode(data):
+            decoded.append(data)
+            return {"A": {"B": data}, "C": "c", "D": "d"}
+
+        t = self.t
+        t.outparams = LazyValue("x", decode)
+        self.assertEqual(t.peek_outparams(), {"A": {"B": "x"}, "C": "c", "D": "d"})
+        self.assertEqual(t.peek_outparams(), {"A": {"B": "x"}, "C": "c", "D": "d"})
+        self.assertEqual(len(decoded), 2)
+        self.assertEqual(t.get_output_value("A.B"), "x")
+        self.assertEqual(t.outparams["C"], "c")
+        self.assertEqual(len(decoded), 3)
+        self.assertEqual(t.to_dict()["outparams"], {"A": {"B": "x"}, "C": "c", "D": "d"})
+
+        t.keep_outputs(["A.B", "C"])
+        self.assertEqual(t.outparams, {"A": {"B": "x"}, "C": "c"})
+        t.outparams = LazyValue("y", decode)
+        t.keep_outputs([])
+        self.assertEqual(t.outparams, {})
+        self.assertEqual(len(decoded), 3)
+
+    def test_trace_lazy_outparams_threads(self):
+        import linecache
+        import sys
+        import threading
+        from awstracer.tracefile import LazyValue
+
+        # one thread is stopped right before it decodes the outputs while
+        # another thread decodes and drops them
+        paused = threading.Event()
+        resume = threading.Event()
+        results = []
+
+        def tracer(frame, event, arg):
+            if frame.f_code.co_name not in ("outparams", "peek_outparams"):
+                return None
+            if event == "line" and "decode()" in linecache.getline(frame.f_code.co_filename, frame.f_lineno) \
+                    and not paused.is_set():
+                paused.set()
+                resume.wait()
+            return tracer
+
+        def read(fn):
+            sys.settrace(tracer)
+            try:
+                results.append(fn())
+            except Exception as e:
+                results.append(e)
+            finally:
+                sys.settrace(None)
+
+        for name in ("outparams", "peek_outparams"):
+            paused.clear()
+            resume.clear()
+            results.clear()
+            t = self.t
+            t.outparams = LazyValue("x", lambda data: {"A": data})
+            fn = t.peek_outparams if name == "peek_outparams" else (lambda: t.outparams)
+            th = threading.Thread(target=read, args=(fn,))
+            th.start()
+            self.assertTrue(paused.wait(5))
+            self.assertEqual(t.outparams, {"A": "x"})
+            resume.set()
+            th.join()
+            self.assertEqual(results, [{"A": "x"}], name)
+
+    def test_tracerunner_api_call(self):
+        import io
+        from contextlib import redirect_stderr, redirect_stdout
+        from botocore.stub import Stubber
+        from awstracer.tracer import TraceRunner, coerce_params
+
+        tr = TraceRunner()
+        ev, client, operation_name = tr._get_client("dynamodb.ListTables", None, "us-east-1", None)
+        self.assertEqual(operation_name, "ListTables")
+        self.assertIs(tr._get_client("dynamodb.ListTables", None, "us-east-1", None)[1], client)
+        self.assertIsNot(tr._get_client("dynamodb.ListTables", None, "us-west-2", None)[1], client)
+
+        operation_model = client.meta.service_model.operation_model("ListTables")
+        self.assertEqual(coerce_params(operation_model, {"Limit": "5", "ExclusiveStartTableName": "t"}),
+                         {"Limit": 5, "ExclusiveStartTableName": "t"})
+
+        with Stubber(client) as stubber:
+            stubber.add_response("list_tables", {"TableNames": ["table1"], "ResponseMetadata": {"RequestId": "reqid1"}}, {"Limit": 5})
+            stubber.add_client_error("list_tables", "ResourceNotFoundException", "no tables", response_meta={"RequestId": "reqid2"})
+            out = io.StringIO()
+            with redirect_stdout(out):
+                trace = tr.run_api_call("dynamodb.ListTables", {"Limit": "5"}, region="us-east-1")
+            self.assertEqual(trace.fn_name, "dynamodb.ListTables")
+            self.assertEqual(trace.request_id, "reqid1")
+            self.assertEqual(trace.inparams, {"Limit": 5})
+            self.assertEqual(trace.outparams, {"TableNames": ["table1"]})
+            self.assertNotEqual(out.getvalue().find("\"table1\""), -1)
+
+            err = io.StringIO()
+            with redirect_stderr(err):
+                self.assertIsNone(tr.run_api_call("dynamodb.ListTables", {}, region="us-east-1"))
+            self.assertNotEqual(err.getvalue().find("ResourceNotFoundException"), -1)
+
+    def test_event_capturer_pages(self):
+        import botocore.session
+        from awstracer.tracer import EventCapturer, Trace
+
+        model = botocore.session.get_session().get_service_model("s3").operation_model("ListObjectsV2")
+        ev = EventCapturer()
+
+        def call(params, parsed):
+            ev.emit("provide-client-params.s3.ListObjectsV2", params=params, model=model)
+            ev.emit("after-call.s3.ListObjectsV2", parsed=parsed, model=model)
+
+        page1 = {"Contents": [{"Key": "k1"}], "KeyCount": 1, "IsTruncated": True, "NextContinuationToken": "t1"}
+        call({"Bucket": "b"}, dict(page1, ResponseMetadata={"RequestId": "req1"}))
+        call({"Bucket": "b", "ContinuationToken": "t1"},
+             {"Contents": [{"Key": "k2"}], "CommonPrefixes": [{"Prefix": "p/"}], "KeyCount": 2, "IsTruncated": True,
+              "NextContinuationToken": "t2", "ResponseMetadata": {"RequestId": "req2"}})
+        call({"Bucket": "b", "ContinuationToken": "t2"},
+             {"Contents": [{"Key": "k3"}], "KeyCount": 1, "IsTruncated": False, "ResponseMetadata": {"RequestId": "req3"}})
+
+        # the pages make up a single trace with the first call's parameters
+        self.assertEqual(ev.trace.inparams, {"Bucket": "b"})
+        self.assertEqual(ev.trace.request_id, "req1")
+        self.assertEqual(ev.trace.outparams, {"Contents": [{"Key": "k1"}, {"Key": "k2"}, {"Key": "k3"}],
+                                              "CommonPrefixes": [{"Prefix": "p/"}], "KeyCount": 1, "IsTruncated": False})
+        self.assertEqual(len(ev.trace.pages), 3)
+        self.assertEqual(Trace.from_dict(ev.trace.to_dict()).pages, ev.trace.pages)
+        # the first page as handed out isn't changed
+        self.assertEqual(page1["Contents"], [{"Key": "k1"}])
+
+        # another call without a token is a trace of its own
+        call({"Bucket": "b"}, {"Contents": [], "ResponseMetadata": {"RequestId": "req4"}})
+        self.assertEqual(ev.trace.request_id, "req4")
+        self.assertEqual(ev.trace.outparams, {"Contents": []})
+        self.assertIsNone(ev.trace.pages)
+        self.assertNotIn("pages", ev.trace.to_dict())
+
+    def test_event_capturer_threads(self):
+        import threading
+        from awstracer.tracer import EventCapturer, Trace
+
+        ev = EventCapturer()
+        self.assertEqual(ev.traces, [])
+        self.assertEqual(ev.trace.request_id, "<not set>")
+        started = threading.Event()
+        done = threading.Event()
+
+        def other():
+            ev.emit("provide-client-params.s3.DeleteObject", params={"Bucket": "b", "Key": "k2"})
+            started.set()
+            done.wait()
+            ev.emit("after-call.s3.DeleteObject", parsed={"ResponseMetadata": {"RequestId": "req2"}})
+
+        # the calls made by two threads at the same time end up in their own
+        # traces in the order they were started in
+        ev.emit("provide-client-params.s3.DeleteObject", params={"Bucket": "b", "Key": "k1"})
+        th = threading.Thread(target=other)
+        th.start()
+        started.wait()
+        ev.emit("after-call.s3.DeleteObject", parsed={"ResponseMetadata": {"RequestId": "req1"}})
+        done.set()
+        th.join()
+        self.assertEqual([t.request_id for t in ev.traces], ["req1", "req2"])
+        self.assertEqual([t.inparams["Key"] for t in ev.traces], ["k1", "k2"])
+        self.assertTrue(all(t.ts_end is not None for t in ev.traces))
+
+        # the group a trace belongs to is only stored when it has one
+        t = ev.traces[0]
+        self.assertNotIn("group", t.to_dict())
+        t.group = "req1"
+        t.command = ["aws", "s3", "rm", "s3://b/", "--recursive"]
+        t2 = Trace.from_dict(t.to_dict())
+        self.assertEqual(t2.group, "req1")
+        self.assertEqual(t2.command, t.command)
+        self.assertIsNone(Trace.from_dict(ev.traces[1].to_dict()).group)
+
+        ev.reset()
+        self.assertEqual(ev.traces, [])
+
+    def test_tracerunner_api_call_pages(self):
+        import io
+        from contextlib import redirect_stdout
+        from botocore.stub import Stubber
+        from awstracer.tracer import TraceRunner
+
+        tr = TraceRunner()
+        _, client, _ = tr._get_client("dynamodb.ListTables", None, "us-east-1", None)
+        with Stubber(client) as stubber:
+            for enough in (None, lambda out: "tab2" in out["TableNames"]):
+                stubber.add_response("list_tables", {"TableNames": ["tab1", "tab2"], "LastEvaluatedTableName": "tab2",
+                                                     "ResponseMetadata": {"RequestId": "reqid1"}}, {})
+                if enough is None:
+                    stubber.add_response("list_tables", {"TableNames": ["tab3"], "ResponseMetadata": {"RequestId": "reqid2"}},
+                                         {"ExclusiveStartTableName": "tab2"})
+                with redirect_stdout(io.StringIO()):
+                    trace = tr.run_api_call("dynamodb.ListTables", {}, region="us-east-1", enough=enough)
+                stubber.assert_no_pending_responses()
+                self.assertEqual(trace.inparams, {})
+                self.assertEqual(trace.outparams["TableNames"], ["tab1", "tab2", "tab3"] if enough is None else ["tab1", "tab2"])
+
+    def test_find_waiter(self):
+        from awstracer.tracer import TraceRunner, find_waiter, get_waiter_params
+
+        tr = TraceRunner()
+        _, dynamodb, _ = tr._get_client("dynamodb.CreateTable", None, "us-east-1", None)
+        _, ec2, _ = tr._get_client("ec2.CreateVpc", None, "us-east-1", None)
+        _, lambda_, _ = tr._get_client("lambda.CreateFunction", None, "us-east-1", None)
+        self.assertEqual(find_waiter(dynamodb, "CreateTable"), "table_exists")
+        self.assertEqual(find_waiter(ec2, "CreateVpc"), "vpc_available")
+        self.assertEqual(find_waiter(lambda_, "CreateFunction"), "function_active")
+        self.assertIsNone(find_waiter(dynamodb, "DescribeTable"))
+        self.assertIsNone(find_waiter(dynamodb, "CreateBackup"))
+
+        input_shape = dynamodb.meta.service_model.operation_model("DescribeTable").input_shape
+        self.assertEqual(get_waiter_params(input_shape, {"TableName": "t1", "BillingMode": "PROVISIONED"}, {}),
+                         {"TableName": "t1"})
+        self.assertIsNone(get_waiter_params(input_shape, {}, {}))
+        input_shape = ec2.meta.service_model.operation_model("DescribeVpcs").input_shape
+        self.assertEqual(get_waiter_params(input_shape, {"CidrBlock": "10.0.0.0/16"}, {"Vpc": {"VpcId": "vpc-1", "State": "pending"}}),
+                         {"VpcIds": ["vpc-1"]})